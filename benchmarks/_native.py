@@ -0,0 +1,6 @@
+""" The native coroutine part of the benchmarks, a syntax error before Python 3.5 """
+
+
+async def call_native(count, call):
+    for _ in range(count):
+        await call()
@@ -0,0 +1,78 @@
+""" Benchmark of the future tracking of :class:`topika.common.FutureStore`.
+
+Futures are created in a store nested like those of a queue on a channel on a connection, which is where the
+publish, consume and declare paths create them.  Run with topika installed:
+
+    python benchmarks/bench_futures.py --count 200000
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import time
+
+from tornado import gen, ioloop
+
+from topika.common import FutureStore
+
+
+def nested_store(loop):
+    """ The store of a queue on a channel on a connection """
+    return FutureStore(loop).create_child().create_child().create_child()
+
+
+@gen.coroutine
+def resolve(loop, count, timeout):
+    """ Create and resolve futures, like confirms that arrive in order """
+    store = nested_store(loop)
+    start = time.time()
+    for _ in range(count):
+        store.create_future(timeout=timeout).set_result(None)
+    # Let the done callbacks run
+    yield gen.moment
+    raise gen.Return(count / (time.time() - start))
+
+
+@gen.coroutine
+def reject(loop, count):
+    """ Reject all the pending futures of a channel, like when it closes with outstanding confirms.
+
+    :return: the futures rejected per second and the longest time the loop was unavailable to other work
+    """
+    channel_store = FutureStore(loop).create_child()
+    remaining = [count]
+
+    def on_rejected(future):
+        future.exception()
+        remaining[0] -= 1
+
+    for _ in range(count):
+        channel_store.create_future(timeout=30).add_done_callback(on_rejected)
+
+    stall = 0.
+    start = time.time()
+    channel_store.reject_all(RuntimeError("Channel closed"))
+    while remaining[0]:
+        beat = time.time()
+        yield gen.moment
+        stall = max(stall, time.time() - beat)
+
+    raise gen.Return((count / (time.time() - start), stall))
+
+
+@gen.coroutine
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--count', type=int, default=200000, help='the number of futures')
+    args = parser.parse_args()
+
+    loop = ioloop.IOLoop.current()
+    for timeout in (None, 5):
+        rate = yield resolve(loop, args.count, timeout)
+        print("create and resolve, timeout={}: {:>12,.0f} futures/s".format(timeout, rate))
+
+    rate, stall = yield reject(loop, args.count)
+    print("reject_all: {:>12,.0f} futures/s, longest loop stall {:.1f}ms".format(rate, stall * 1000))
+
+
+if __name__ == '__main__':
+    ioloop.IOLoop.current().run_sync(main)
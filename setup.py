@@ -50,7 +50,7 @@ setup(
         ':python_version<"3.5"': ['typing'],
         ':python_version<"3.4"': ['enum34', 'singledispatch'],
         ':python_version<"3.3"': ['mock'],
-        ':python_version<"3.2"': ['backports.tempfile'],
+        ':python_version<"3.2"': ['backports.tempfile', 'futures'],
     },
     packages=['topika'],
     test_suite='test')
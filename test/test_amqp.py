@@ -6,6 +6,8 @@ from tornado import gen, testing, concurrent
 import uuid
 import logging
 import pika.exceptions
+import pika.frame
+import pika.spec
 from sys import version_info
 import shortuuid
 import time
@@ -24,6 +26,7 @@ import topika
 import topika.exceptions
 from copy import copy
 from topika import connect, Message, DeliveryMode
+from topika.common import BlockedPolicy, FutureStore
 from topika.exceptions import MessageProcessError, ProbableAuthenticationError
 from topika.exchange import ExchangeType
 from topika.tools import wait
@@ -61,6 +64,68 @@ class TestCase(BaseTestCase):
 
         yield self.create_channel(connection=client)
 
+    @testing.gen_test
+    def test_open_channels_concurrently(self):
+        client = yield self.create_connection()
+
+        channels = yield client.channels(10)
+
+        self.assertEqual(len(set(channel.number for channel in channels)), 10)
+        for channel in channels:
+            self.assertFalse(channel.is_closed)
+            self.assertIs(client._channels[channel.number], channel)
+            yield channel.close()
+
+    @staticmethod
+    def block_connection(connection):
+        frame = pika.frame.Method(0, pika.spec.Connection.Blocked('low on memory'))
+        connection._on_connection_blocked(connection._connection, frame)
+
+    @staticmethod
+    def unblock_connection(connection):
+        frame = pika.frame.Method(0, pika.spec.Connection.Unblocked())
+        connection._on_connection_unblocked(connection._connection, frame)
+
+    @testing.gen_test
+    def test_connection_blocked_wait(self):
+        client = yield self.create_connection()
+        client.blocked_policy = BlockedPolicy.WAIT
+        channel = yield self.create_channel(connection=client)
+        queue = yield self.declare_queue(auto_delete=True, channel=channel)
+
+        events = []
+        client.add_blocked_callback(lambda connection, reason: events.append(reason))
+        client.add_unblocked_callback(lambda connection: events.append('unblocked'))
+
+        self.block_connection(client)
+        self.assertTrue(client.is_blocked)
+
+        publish = channel.default_exchange.publish(Message(b'test'), queue.name)
+        yield gen.sleep(0.2)
+        self.assertFalse(publish.done())
+
+        self.unblock_connection(client)
+        yield publish
+
+        self.assertFalse(client.is_blocked)
+        self.assertListEqual(events, ['low on memory', 'unblocked'])
+        self.assertEqual(client.blocked_count, 1)
+        self.assertGreaterEqual(client.blocked_time, 0.2)
+
+    @testing.gen_test
+    def test_connection_blocked_raise(self):
+        client = yield self.create_connection()
+        client.blocked_policy = BlockedPolicy.RAISE
+        channel = yield self.create_channel(connection=client)
+        queue = yield self.declare_queue(auto_delete=True, channel=channel)
+
+        self.block_connection(client)
+        with self.assertRaises(topika.exceptions.ConnectionBlocked):
+            yield channel.default_exchange.publish(Message(b'test'), queue.name)
+
+        self.unblock_connection(client)
+        yield channel.default_exchange.publish(Message(b'test'), queue.name)
+
     @testing.gen_test
     def test_delete_queue_and_exchange(self):
         queue_name = self.get_random_name("test_connection")
@@ -73,6 +138,82 @@ class TestCase(BaseTestCase):
         yield channel.queue_delete(queue_name)
         yield channel.exchange_delete(exchange)
 
+    @testing.gen_test
+    def test_declare_nowait(self):
+        channel = yield self.create_channel()
+        exchange = yield channel.declare_exchange(self.get_random_name(), auto_delete=True, nowait=True)
+
+        queues = []
+        for _ in range(50):
+            queue = yield channel.declare_queue(self.get_random_name('nowait'), auto_delete=True, nowait=True)
+            yield queue.bind(exchange, queue.name, nowait=True)
+            queues.append(queue)
+
+        yield channel.synchronize()
+
+        yield exchange.publish(Message(b'nowait'), queues[-1].name)
+        message = yield queues[-1].get(timeout=5)
+        message.ack()
+        self.assertEqual(message.body, b'nowait')
+
+        for queue in queues:
+            yield queue.delete(if_unused=False, if_empty=False, nowait=True)
+        yield exchange.delete(nowait=True)
+        yield channel.synchronize()
+
+        with self.assertRaises(ValueError):
+            yield channel.declare_queue(nowait=True)
+
+    @testing.gen_test
+    def test_nowait_error_surfaces_on_synchronize(self):
+        channel = yield self.create_channel()
+        name = self.get_random_name()
+        yield self.declare_exchange(name, auto_delete=True, channel=channel)
+
+        # The broker closes this channel
+        channel = yield self.create_channel(cleanup=False)
+        yield channel.declare_exchange(name, type=ExchangeType.FANOUT, auto_delete=True, nowait=True)
+
+        with self.assertRaises(pika.exceptions.ChannelClosedByBroker):
+            yield channel.synchronize()
+
+    @testing.gen_test
+    def test_declaration_cache(self):
+        client = yield self.create_connection()
+        channel = yield self.create_channel(connection=client, cache_declarations=True)
+        name = self.get_random_name('cached')
+
+        queue = yield channel.declare_queue(name, auto_delete=True)
+        again = yield channel.declare_queue(name, auto_delete=True)
+        self.assertIs(again, queue)
+
+        exchange = yield channel.declare_exchange(name, auto_delete=True)
+        again = yield channel.declare_exchange(name, auto_delete=True)
+        self.assertIs(again, exchange)
+
+        # Deleting invalidates the cache
+        yield exchange.delete()
+        again = yield channel.declare_exchange(name, auto_delete=True)
+        self.assertIsNot(again, exchange)
+        yield channel.exchange_delete(name)
+
+        queue = yield channel.declare_queue(name, auto_delete=True)
+        yield queue.delete(if_unused=False, if_empty=False)
+        again = yield channel.declare_queue(name, auto_delete=True)
+        self.assertIsNot(again, queue)
+        yield again.delete(if_unused=False, if_empty=False)
+
+        # Passive declarations always go to the broker
+        first = yield channel.declare_queue(name, auto_delete=True)
+        second = yield channel.declare_queue(name, auto_delete=True, passive=True)
+        self.assertIsNot(second, first)
+        yield first.delete(if_unused=False, if_empty=False)
+
+        # Server named queues are never cached
+        first = yield channel.declare_queue(auto_delete=True)
+        second = yield channel.declare_queue(auto_delete=True)
+        self.assertNotEqual(first.name, second.name)
+
     @testing.gen_test
     def test_temporary_queue(self):
         channel = yield self.create_channel()
@@ -1080,6 +1221,66 @@ class TestCase(BaseTestCase):
     #     return func(self)
 
 
+class ConfirmationTestCase(BaseTestCase):
+
+    def create_channel(self):
+        channel = topika.Channel(None, self.loop, FutureStore(self.loop))
+        channel._channel = mock.Mock()
+        return channel
+
+    def publish(self, channel):
+        return channel._basic_publish('', 'key', b'body', pika.spec.BasicProperties(), False, False)
+
+    @staticmethod
+    def confirm(channel, method):
+        channel._on_delivery_confirmation(pika.frame.Method(1, method))
+
+    @testing.gen_test
+    def test_multiple_ack(self):
+        channel = self.create_channel()
+        futures = [self.publish(channel) for _ in range(3)]
+
+        self.confirm(channel, pika.spec.Basic.Ack(delivery_tag=2, multiple=True))
+        self.assertEqual([future.done() for future in futures], [True, True, False])
+        self.assertEqual((yield futures[:2]), [True, True])
+
+        self.confirm(channel, pika.spec.Basic.Ack(delivery_tag=3))
+        self.assertTrue((yield futures[2]))
+        self.assertEqual(channel._confirmations, {})
+
+    @testing.gen_test
+    def test_publish_waits_for_write_lock(self):
+        channel = self.create_channel()
+        channel._connection = mock.Mock(is_closed=False, is_blocked=False)
+
+        with (yield channel._write_lock.acquire()):
+            future = channel._publish('', 'key', b'body', pika.spec.BasicProperties(), False, False)
+            yield gen.moment
+            self.assertFalse(channel._channel.basic_publish.called)
+
+        while not channel._channel.basic_publish.called:
+            yield gen.moment
+        self.confirm(channel, pika.spec.Basic.Ack(delivery_tag=1))
+        self.assertTrue((yield future))
+        self.assertFalse(channel._write_lock.locked())
+
+        # Nothing holds the lock anymore, the message is sent right away
+        channel._publish('', 'key', b'body', pika.spec.BasicProperties(), False, False)
+        self.assertEqual(channel._channel.basic_publish.call_count, 2)
+
+    @testing.gen_test
+    def test_multiple_nack(self):
+        channel = self.create_channel()
+        futures = [self.publish(channel) for _ in range(2)]
+
+        self.confirm(channel, pika.spec.Basic.Nack(delivery_tag=2, multiple=True))
+
+        for future in futures:
+            with self.assertRaises(topika.exceptions.NackError):
+                yield future
+        self.assertEqual(channel._confirmations, {})
+
+
 class MessageTestCase(unittest.TestCase):
 
     def test_message_copy(self):
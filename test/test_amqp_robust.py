@@ -1,11 +1,27 @@
 from __future__ import absolute_import
 from tornado import gen, testing
 
-from topika import connect_robust
+from topika import connect_robust, tools, Message
+from topika.robust_connection import RobustConnection
 from test import AMQP_URL
 from test.test_amqp import TestCase as AMQPTestCase
 
 
+class DropWhileRestoring(RobustConnection):
+    """ Loses its connection while restoring the channels of the first reconnect """
+
+    restores = 0
+
+    @gen.coroutine
+    def _restore_channels(self):
+        self.restores += 1
+        if self.restores == 2:
+            self.loop.add_callback(self._connection.close)
+
+        result = yield super(DropWhileRestoring, self)._restore_channels()
+        raise gen.Return(result)
+
+
 class TestCase(AMQPTestCase):
 
     @gen.coroutine
@@ -21,3 +37,60 @@ class TestCase(AMQPTestCase):
     def test_set_qos(self):
         channel = yield self.create_channel()
         yield channel.set_qos(prefetch_count=1)
+
+    @testing.gen_test
+    def test_restore_topology(self):
+        connection = yield self.create_connection()
+        exchange_channel = yield self.create_channel(connection)
+        queue_channel = yield self.create_channel(connection)
+
+        exchange = yield exchange_channel.declare_exchange(self.get_random_name('exchange'), auto_delete=True)
+        queues = []
+        for _ in range(5):
+            queue = yield queue_channel.declare_queue(self.get_random_name('queue'), auto_delete=True)
+            yield queue.bind(exchange, 'key')
+            queues.append(queue)
+
+        received = []
+        yield queues[0].consume(received.append, no_ack=True)
+
+        reconnected = tools.create_future(loop=self.loop)
+        connection.add_reconnect_callback(reconnected.set_result)
+
+        # Drop the connection underneath the robust connection
+        connection._connection.close()
+        yield reconnected
+
+        self.assertIsNotNone(connection.recovery_time)
+
+        yield exchange.publish(Message(b'restored'), 'key')
+        for queue in queues[1:]:
+            message = yield queue.get(timeout=5)
+            message.ack()
+            self.assertEqual(message.body, b'restored')
+
+        while not received:
+            yield gen.sleep(0.05)
+        self.assertEqual(received[0].body, b'restored')
+
+    @testing.gen_test
+    def test_connection_lost_while_restoring(self):
+        connection = yield connect_robust(AMQP_URL, loop=self.loop, connection_class=DropWhileRestoring)
+        self.addCleanup(self.wait_for, connection.close)
+
+        channel = yield self.create_channel(connection)
+        queue = yield channel.declare_queue(self.get_random_name('queue'), auto_delete=True)
+
+        reconnected = tools.create_future(loop=self.loop)
+        connection.add_reconnect_callback(reconnected.set_result)
+
+        connection._connection.close()
+        yield reconnected
+
+        # The restore that lost the connection counts as a failed attempt and the next one succeeds
+        self.assertEqual(connection.restores, 3)
+        self.assertFalse(connection.is_closed)
+
+        yield channel.default_exchange.publish(Message(b'restored'), queue.name)
+        message = yield queue.get(timeout=5, no_ack=True)
+        self.assertEqual(message.body, b'restored')
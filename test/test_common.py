@@ -0,0 +1,129 @@
+from __future__ import absolute_import
+from tornado import gen, ioloop, testing
+
+from topika import tools
+from topika.common import FutureStore, TimerWheel
+from . import BaseTestCase
+
+
+class TestTimerWheel(BaseTestCase):
+
+    @testing.gen_test
+    def test_timeout(self):
+        store = FutureStore(self.loop, tick=0.01)
+        child = store.create_child()
+
+        start = self.loop.time()
+        future = child.create_future(timeout=0.05)
+        with self.assertRaises(gen.TimeoutError):
+            yield future
+
+        # Never early and at most about a tick late
+        elapsed = self.loop.time() - start
+        self.assertGreaterEqual(elapsed, 0.05)
+        self.assertLess(elapsed, 0.5)
+
+    @testing.gen_test
+    def test_cancel(self):
+        wheel = TimerWheel(self.loop, tick=0.01)
+        futures = [tools.create_future(self.loop) for _ in range(10)]
+        for future in futures:
+            wheel.add(future, 0.05)
+        self.assertEqual(len(wheel), 10)
+
+        for future in futures[:5]:
+            wheel.cancel(future)
+        self.assertEqual(len(wheel), 5)
+
+        yield gen.sleep(0.1)
+        self.assertEqual(len(wheel), 0)
+        self.assertTrue(all(not future.done() for future in futures[:5]))
+        self.assertTrue(all(future.exception() is not None for future in futures[5:]))
+
+    def test_ticks_on_its_own_loop(self):
+        other = ioloop.IOLoop(make_current=False)
+        self.addCleanup(other.close)
+
+        wheel = TimerWheel(other, tick=0.01)
+        future = tools.create_future(other)
+        wheel.add(future, 0.02)
+
+        other.run_sync(lambda: gen.sleep(0.1))
+        self.assertEqual(len(wheel), 0)
+        self.assertIsInstance(future.exception(), gen.TimeoutError)
+
+    @testing.gen_test
+    def test_done_futures_are_removed(self):
+        store = FutureStore(self.loop)
+        future = store.create_future(timeout=10)
+        future.set_result(True)
+
+        yield gen.moment
+        self.assertEqual(future.result(), True)
+        self.assertEqual(len(store._FutureStore__timer_wheel), 0)
+
+
+class TestFutureStore(BaseTestCase):
+
+    @testing.gen_test
+    def test_reject_all_descendants(self):
+        connection = FutureStore(self.loop)
+        channel = connection.create_child()
+        queue = channel.create_child()
+        other = connection.create_child()
+
+        futures = [store.create_future() for store in (channel, queue)]
+        untouched = other.create_future()
+
+        channel.reject_all(RuntimeError("Channel closed"))
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                yield future
+
+        self.assertFalse(untouched.done())
+        self.assertEqual(len(channel) + len(queue), 0)
+
+    @testing.gen_test
+    def test_reject_all_in_slices(self):
+        store = FutureStore(self.loop)
+        futures = [store.create_future() for _ in range(FutureStore.REJECT_SLICE * 2 + 1)]
+
+        store.reject_all(RuntimeError("Closed"))
+        self.assertFalse(any(future.done() for future in futures))
+
+        # The first slice is rejected in the next loop iteration, the rest follows in later ones
+        yield gen.moment
+        rejected = sum(future.done() for future in futures)
+        self.assertGreater(rejected, 0)
+        self.assertLess(rejected, len(futures))
+
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                yield future
+
+    @testing.gen_test
+    def test_registered_once(self):
+        connection = FutureStore(self.loop)
+        queue = connection.create_child().create_child()
+
+        future = queue.create_future()
+        self.assertEqual(len(queue), 1)
+        self.assertEqual(len(connection), 0)
+
+        future.set_result(None)
+        yield gen.moment
+        self.assertEqual(len(queue), 0)
+
+    @testing.gen_test
+    def test_pending_future_is_forgotten(self):
+        store = FutureStore(self.loop, tick=0.01)
+
+        with store.pending_future(timeout=0.02) as future:
+            self.assertEqual(len(store), 1)
+
+        self.assertEqual(len(store), 0)
+        self.assertEqual(len(store._FutureStore__timer_wheel), 0)
+
+        # The abandoned future doesn't time out
+        yield gen.sleep(0.1)
+        self.assertFalse(future.done())
@@ -0,0 +1,63 @@
+from __future__ import absolute_import
+import time
+
+from tornado import gen, testing
+
+from topika import metrics
+from topika.lag import LagMonitor
+from . import BaseTestCase
+
+
+class TestLagMonitor(BaseTestCase):
+
+    def create_monitor(self, **kwargs):
+        monitor = LagMonitor(loop=self.loop, **kwargs)
+        monitor.start()
+        self.addCleanup(monitor.stop)
+        return monitor
+
+    @testing.gen_test
+    def test_stall_is_attributed(self):
+        registry = metrics.Registry()
+        monitor = self.create_monitor(interval=0.02, threshold=0.1, registry=registry)
+
+        def slow_handler(message):  # pylint: disable=unused-argument
+            time.sleep(0.3)
+
+        yield gen.sleep(0.1)
+        self.loop.add_callback(monitor.run_callback, slow_handler, 'message')
+        yield gen.sleep(0.2)
+
+        self.assertEqual(len(monitor.stalls), 1)
+        stall = monitor.stalls[0]
+        self.assertGreaterEqual(stall.lag, 0.1)
+        self.assertIs(stall.callback, slow_handler)
+        self.assertEqual(stall.message, 'message')
+        self.assertIn('time.sleep', stall.stack[-1])
+
+        self.assertIn('topika_ioloop_lag_seconds_count', registry.render())
+
+    @testing.gen_test
+    def test_single_monitor(self):
+        self.create_monitor()
+        with self.assertRaises(RuntimeError):
+            LagMonitor(loop=self.loop).start()
+
+    @testing.gen_test
+    def test_suspended_coroutine_is_attributed(self):
+        monitor = self.create_monitor(interval=0.02, threshold=0.1)
+
+        @gen.coroutine
+        def slow_coroutine(message):  # pylint: disable=unused-argument
+            yield gen.sleep(0.05)
+            time.sleep(0.3)
+
+        yield gen.sleep(0.1)
+        future = monitor.run_callback(slow_coroutine, 'message')
+        yield future
+        yield gen.sleep(0.1)
+
+        self.assertEqual(len(monitor.stalls), 1)
+        stall = monitor.stalls[0]
+        self.assertIs(stall.callback, slow_coroutine)
+        self.assertEqual(stall.message, 'message')
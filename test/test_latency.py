@@ -0,0 +1,62 @@
+from __future__ import absolute_import
+
+from tornado import testing
+
+from topika import Message, latency, metrics
+from . import BaseTestCase
+
+
+class TestCase(BaseTestCase):
+
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.registry = metrics.Registry()
+        self.recorder = latency.enable(self.registry)
+        self.addCleanup(latency.disable)
+
+    def test_stamp_copies_headers(self):
+        message = Message(body=b'stamped', headers={'key': 'value'})
+        properties = message.properties
+        latency.stamp(properties)
+
+        self.assertIn(latency.HEADER, properties.headers)
+        self.assertNotIn(latency.HEADER, message.headers)
+        self.assertAlmostEqual(latency.published_at(properties.headers), latency.now(), delta=1)
+
+    def test_enable_again(self):
+        registry = metrics.Registry()
+        self.assertIs(latency.enable(registry), self.recorder)
+        self.assertIs(registry.get('topika_queue_latency_seconds'), self.recorder.histogram)
+        self.assertIs(self.registry.get('topika_queue_latency_seconds'), self.recorder.histogram)
+
+        # Registering it again is harmless
+        self.assertIs(latency.enable(registry, buckets=metrics.DEFAULT_BUCKETS), self.recorder)
+
+        with self.assertRaises(ValueError):
+            latency.enable(buckets=(0.1, 1.))
+
+    @testing.gen_test
+    def test_queue_latency(self):
+        channel = yield self.create_channel()
+        queue = yield self.declare_queue(auto_delete=True, channel=channel)
+
+        yield channel.default_exchange.publish(Message(body=b'stamped'), queue.name)
+        message = yield queue.get(timeout=5, no_ack=True)
+
+        self.assertIsNotNone(message.published_at)
+        self.assertGreaterEqual(message.queue_latency, 0)
+        self.assertEqual(self.recorder.histogram.get_count((queue.name,)), 1)
+        self.assertIn('topika_queue_latency_seconds_count{{queue="{}"}} 1'.format(queue.name), self.registry.render())
+
+    @testing.gen_test
+    def test_disabled(self):
+        latency.disable()
+
+        channel = yield self.create_channel()
+        queue = yield self.declare_queue(auto_delete=True, channel=channel)
+
+        yield channel.default_exchange.publish(Message(body=b'plain'), queue.name)
+        message = yield queue.get(timeout=5, no_ack=True)
+
+        self.assertIsNone(message.published_at)
+        self.assertIsNone(message.queue_latency)
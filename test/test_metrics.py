@@ -0,0 +1,128 @@
+from __future__ import absolute_import
+import collections
+import unittest
+
+from tornado import gen, locks, testing
+
+from topika import Message
+from topika import metrics, tracing
+from . import BaseTestCase
+
+
+class TestRegistry(unittest.TestCase):
+
+    def test_render(self):
+        registry = metrics.Registry()
+        counter = registry.counter('requests_total', 'The requests', ('path',))
+        counter.inc(('/a"b',))
+        counter.inc(('/a"b',), 2)
+
+        histogram = registry.histogram('latency_seconds', 'The latency', buckets=(0.1, 1.))
+        histogram.observe((), 0.05)
+        histogram.observe((), 5.)
+
+        self.assertEqual(registry.render(), '\n'.join([
+            '# HELP requests_total The requests',
+            '# TYPE requests_total counter',
+            'requests_total{path="/a\\"b"} 3',
+            '# HELP latency_seconds The latency',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{le="0.1"} 1',
+            'latency_seconds_bucket{le="1.0"} 1',
+            'latency_seconds_bucket{le="+Inf"} 2',
+            'latency_seconds_sum 5.05',
+            'latency_seconds_count 2',
+        ]) + '\n')
+
+    def test_duplicate_name(self):
+        registry = metrics.Registry()
+        registry.counter('requests_total', 'The requests')
+        with self.assertRaises(ValueError):
+            registry.counter('requests_total', 'The requests')
+
+
+Parameters = collections.namedtuple('Parameters', 'host port virtual_host')
+
+
+class FakeConnection(object):
+
+    def __init__(self, blocked_time, is_closed=False, is_reconnecting=False):
+        self.connection_parameters = Parameters('localhost', 5672, '/')
+        self.blocked_time = blocked_time
+        self.is_closed = is_closed
+        self.is_reconnecting = is_reconnecting
+
+
+class TestMetricsTracer(unittest.TestCase):
+
+    def test_blocked_time_never_decreases(self):
+        registry = metrics.Registry()
+        tracer = metrics.MetricsTracer(registry)
+        blocked = registry.get('topika_blocked_seconds_total')
+
+        closing, robust = FakeConnection(2.), FakeConnection(1., is_closed=True, is_reconnecting=True)
+        tracer._connections = {1: closing, 2: robust}  # pylint: disable=protected-access
+        self.assertEqual(list(blocked.samples())[0][3], 3.)
+
+        # The closed connection is forgotten but its time is kept, the reconnecting one is kept
+        closing.is_closed = True
+        self.assertEqual(list(blocked.samples())[0][3], 3.)
+        self.assertEqual(list(tracer._connections.values()), [robust])  # pylint: disable=protected-access
+        self.assertEqual(list(blocked.samples())[0][3], 3.)
+
+
+class TestCase(BaseTestCase):
+
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.registry = metrics.install()
+        self.addCleanup(tracing.uninstall)
+
+    def total(self, name, suffix=''):
+        return sum(value for sample_suffix, _, _, value in self.registry.get(name).samples() if sample_suffix == suffix)
+
+    @testing.gen_test
+    def test_client_metrics(self):
+        channel = yield self.create_channel()
+        queue = yield self.declare_queue(auto_delete=True, channel=channel)
+
+        received = locks.Event()
+
+        def on_message(message):
+            message.ack()
+            received.set()
+
+        yield queue.consume(on_message)
+        yield channel.default_exchange.publish(Message(body=b'measured'), queue.name)
+        yield received.wait()
+        yield gen.sleep(0)
+
+        self.assertEqual(self.total('topika_published_total'), 1)
+        self.assertEqual(self.total('topika_confirmed_total'), 1)
+        self.assertEqual(self.total('topika_confirm_latency_seconds', '_count'), 1)
+        self.assertEqual(self.total('topika_delivered_total'), 1)
+
+        rendered = self.registry.render()
+        self.assertIn('queue="{}",action="ack"'.format(queue.name), rendered)
+        self.assertIn('topika_handler_duration_seconds_count', rendered)
+        self.assertIn('topika_pending_futures{connection=', rendered)
+
+    @testing.gen_test
+    def test_consumers_are_forgotten(self):
+        tracer = tracing.tracers()[-1]
+        channel = yield self.create_channel()
+        queue = yield self.declare_queue(auto_delete=True, channel=channel)
+
+        received = locks.Event()
+
+        def on_message(message):
+            message.ack()
+            received.set()
+
+        consumer_tag = yield queue.consume(on_message)
+        yield channel.default_exchange.publish(Message(body=b'measured'), queue.name)
+        yield received.wait()
+        self.assertIn(consumer_tag, tracer._consumers)  # pylint: disable=protected-access
+
+        yield queue.cancel(consumer_tag)
+        self.assertNotIn(consumer_tag, tracer._consumers)  # pylint: disable=protected-access
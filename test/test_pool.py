@@ -0,0 +1,142 @@
+from __future__ import absolute_import
+from tornado import gen, ioloop, testing
+
+from topika import connect
+from topika.pool import ConnectionPool
+from . import BaseTestCase, AMQP_URL
+
+
+class ReconnectingConnection(object):
+    """ A robust connection that lost its connection and is re-establishing it """
+
+    is_closed = True
+    is_reconnecting = True
+    closed = False
+
+    @gen.coroutine
+    def close(self):
+        self.closed = True
+
+
+class FailingHealthCheckPool(ConnectionPool):
+    """ A pool whose first health check fails """
+
+    checks = 0
+
+    @gen.coroutine
+    def _check_health(self):
+        self.checks += 1
+        if self.checks == 1:
+            raise RuntimeError("Broken health check")
+        yield super(FailingHealthCheckPool, self)._check_health()
+
+
+class TestCase(BaseTestCase):
+
+    @gen.coroutine
+    def create_pool(self, size=2, **kwargs):
+        pool = yield ConnectionPool.create(AMQP_URL, size, loop=self.loop, **kwargs)
+        self.addCleanup(self.wait_for, pool.close)
+        raise gen.Return(pool)
+
+    @testing.gen_test
+    def test_checkout(self):
+        pool = yield self.create_pool()
+        self.assertEqual(len(pool.members), 2)
+
+        connection = yield pool.checkout()
+        self.assertIn(connection, pool.members)
+        self.assertFalse(connection.is_closed)
+
+        channel = yield self.create_channel(connection=connection)
+        self.assertFalse(channel.is_closed)
+        pool.release(connection)
+
+    @testing.gen_test
+    def test_least_loaded_checkout(self):
+        pool = yield self.create_pool(factory=connect)
+
+        first = yield pool.checkout()
+        yield self.create_channel(connection=first)
+        pool.release(first)
+
+        second = yield pool.checkout()
+        self.assertIsNot(first, second)
+        pool.release(second)
+
+    @testing.gen_test
+    def test_health_check_replaces_dead_members(self):
+        pool = yield self.create_pool(factory=connect, health_check_interval=0.1)
+
+        dead = yield pool.checkout()
+        yield dead.close()
+        pool.release(dead)
+
+        yield gen.sleep(0.5)
+
+        self.assertNotIn(dead, pool.members)
+        self.assertEqual(len(pool.members), 2)
+        for connection in pool.members:
+            self.assertFalse(connection.is_closed)
+
+    @testing.gen_test
+    def test_close(self):
+        pool = yield ConnectionPool.create(AMQP_URL, 2, factory=connect, loop=self.loop)
+        members = pool.members
+        yield pool.close()
+
+        self.assertTrue(pool.is_closed)
+        for connection in members:
+            self.assertTrue(connection.is_closed)
+
+        with self.assertRaises(RuntimeError):
+            yield pool.checkout()
+
+    @testing.gen_test
+    def test_health_check_spares_reconnecting_members(self):
+        connection = ReconnectingConnection()
+
+        @gen.coroutine
+        def factory(url, **kwargs):  # pylint: disable=unused-argument
+            raise gen.Return(connection)
+
+        pool = yield self.create_pool(size=1, factory=factory)
+        yield pool._check_health()  # pylint: disable=protected-access
+
+        self.assertEqual(pool.members, (connection,))
+        self.assertFalse(connection.closed)
+        with self.assertRaises(RuntimeError):
+            yield pool.checkout()
+
+    @testing.gen_test
+    def test_connect_timeout(self):
+        """ A member that doesn't open in time is given up, and closed if it opens later """
+        connection = ReconnectingConnection()
+
+        @gen.coroutine
+        def factory(url, timeout=None, **kwargs):  # pylint: disable=unused-argument
+            # Ignores the timeout
+            yield gen.sleep(0.3)
+            raise gen.Return(connection)
+
+        pool = yield self.create_pool(size=1, factory=factory, connect_timeout=0.1)
+        self.assertEqual(pool.members, ())
+
+        yield gen.sleep(0.3)
+        self.assertTrue(connection.closed)
+
+    def test_health_checks_run_on_the_pool_loop(self):
+        other = ioloop.IOLoop(make_current=False)
+        self.addCleanup(other.close)
+
+        @gen.coroutine
+        def factory(url, **kwargs):  # pylint: disable=unused-argument
+            raise gen.Return(ReconnectingConnection())
+
+        pool = other.run_sync(
+            lambda: FailingHealthCheckPool.create(AMQP_URL, 1, factory=factory, loop=other, health_check_interval=0.01))
+        other.run_sync(lambda: gen.sleep(0.1))
+
+        # Checks go on after one failed
+        self.assertGreater(pool.checks, 2)
+        other.run_sync(pool.close)
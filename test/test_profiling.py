@@ -0,0 +1,102 @@
+from __future__ import absolute_import
+import json
+import os
+import pstats
+import tempfile
+import time
+
+from pika import spec
+from tornado import gen, testing
+
+from topika import IncomingMessage, profiling
+from . import BaseTestCase
+
+
+def busy_handler():
+    deadline = time.time() + 0.05
+    while time.time() < deadline:
+        pass
+
+
+class FailingProfiler(object):
+    """ Stands in for :mod:`cProfile` when another profiler is already active """
+
+    class Profile(object):
+
+        def enable(self):
+            raise ValueError("Another profiling tool is already active")
+
+
+class TestProfiling(BaseTestCase):
+
+    @gen.coroutine
+    def profile(self, mode):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+
+        future = profiling.enable(0.3, mode=mode, path=path, loop=self.loop, interval=0.002)
+        for _ in range(5):
+            yield gen.sleep(0.01)
+            busy_handler()
+        while not future.done():
+            yield gen.sleep(0.05)
+
+        raise gen.Return(future.result())
+
+    @testing.gen_test
+    def test_cprofile(self):
+        report = yield self.profile(profiling.CPROFILE)
+
+        self.assertGreater(report.categories[profiling.HANDLER], 0.1)
+        functions = [name for _, _, name in pstats.Stats(report.path).stats]  # pylint: disable=no-member
+        self.assertIn('busy_handler', functions)
+
+    @testing.gen_test
+    def test_sampling(self):
+        report = yield self.profile(profiling.SAMPLING)
+
+        self.assertGreater(report.categories[profiling.HANDLER], 0.1)
+        with open(report.path) as handle:
+            lines = handle.read().splitlines()
+        self.assertTrue(any('busy_handler (test_profiling.py' in line for line in lines))
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in lines))
+
+    @testing.gen_test
+    def test_one_at_a_time(self):
+        future = profiling.enable(0.1, mode=profiling.SAMPLING, loop=self.loop)
+        self.addCleanup(lambda: os.path.exists(future.result().path) and os.remove(future.result().path))
+
+        with self.assertRaises(RuntimeError):
+            profiling.enable(0.1, loop=self.loop)
+
+        while not future.done():
+            yield gen.sleep(0.05)
+        self.assertIsNone(profiling.PROFILE)
+
+    @testing.gen_test
+    def test_failed_start_releases(self):
+        self.addCleanup(setattr, profiling, 'cProfile', profiling.cProfile)
+        profiling.cProfile = FailingProfiler
+
+        future = profiling.enable(0.1, mode=profiling.CPROFILE, loop=self.loop)
+        while not future.done():
+            yield gen.sleep(0.01)
+
+        self.assertIsInstance(future.exception(), ValueError)
+        self.assertIsNone(profiling.PROFILE)
+
+    def test_control_arguments_are_clamped(self):
+        self.addCleanup(setattr, profiling, '_trigger', profiling._trigger)
+        triggered = []
+        profiling._trigger = lambda loop, options: triggered.append(options)
+
+        body = json.dumps({'duration': 1e9, 'interval': 0, 'path': '/etc/passwd'}).encode()
+        envelope = spec.Basic.Deliver(consumer_tag='control', delivery_tag=1, exchange='', routing_key='control')
+        message = IncomingMessage(None, envelope, spec.BasicProperties(), body, no_ack=True)
+        profiling.control_callback(loop=self.loop)(message)
+        self.assertEqual(triggered, [{'duration': profiling.MAX_DURATION, 'interval': profiling.MIN_INTERVAL}])
+
+        with self.assertRaises(ValueError):
+            profiling.enable(1, mode=profiling.SAMPLING, loop=self.loop, interval=0)
+        self.assertIsNone(profiling.PROFILE)
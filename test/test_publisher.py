@@ -0,0 +1,38 @@
+from __future__ import absolute_import
+import threading
+
+from tornado import testing
+
+from topika import Message
+from topika.publisher import Publisher
+from . import BaseTestCase
+
+
+class TestCase(BaseTestCase):
+
+    @testing.gen_test
+    def test_publish_from_threads(self):
+        channel = yield self.create_channel()
+        queue = yield self.declare_queue(auto_delete=True, channel=channel)
+        publisher = Publisher(channel.default_exchange)
+
+        futures = []
+
+        def produce(index):
+            for i in range(50):
+                futures.append(publisher.publish(Message(body='{}-{}'.format(index, i).encode()), queue.name))
+
+        threads = [threading.Thread(target=produce, args=(index,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        yield publisher.close()
+        self.assertTrue(all(future.done() and future.exception() is None for future in futures))
+
+        result = yield queue.declare(passive=True)
+        self.assertEqual(result.method.message_count, 200)
+
+        with self.assertRaises(RuntimeError):
+            publisher.publish(Message(body=b'late'), queue.name)
@@ -0,0 +1,80 @@
+from __future__ import absolute_import
+import unittest
+
+from tornado import gen, testing
+
+from topika import reconnect
+from topika.robust_connection import RobustConnection, connect_robust
+from . import BaseTestCase
+from .test_failover import unused_port
+
+
+class TestPolicies(unittest.TestCase):
+
+    def test_constant(self):
+        policy = reconnect.ConstantBackoff(2.)
+        self.assertListEqual([policy.next_delay() for _ in range(3)], [2., 2., 2.])
+        self.assertEqual(policy.failures, 3)
+
+        policy.reset()
+        self.assertEqual(policy.failures, 0)
+
+    def test_exponential(self):
+        policy = reconnect.ExponentialBackoff(initial=1., factor=2., max_delay=10., jitter=0.)
+        self.assertListEqual([policy.next_delay() for _ in range(6)], [1., 2., 4., 8., 10., 10.])
+
+        policy.reset()
+        self.assertEqual(policy.next_delay(), 1.)
+
+    def test_jitter(self):
+        policy = reconnect.ExponentialBackoff(initial=4., factor=1., jitter=0.5)
+        for _ in range(100):
+            self.assertTrue(2. <= policy.next_delay() <= 4.)
+
+        with self.assertRaises(ValueError):
+            reconnect.ExponentialBackoff(jitter=2.)
+
+    def test_circuit_breaker(self):
+        policy = reconnect.ExponentialBackoff(initial=1., jitter=0., failure_threshold=3, open_timeout=60.)
+        self.assertEqual(policy.state, reconnect.CIRCUIT_CLOSED)
+
+        self.assertListEqual([policy.next_delay() for _ in range(2)], [1., 2.])
+        self.assertEqual(policy.state, reconnect.CIRCUIT_CLOSED)
+
+        self.assertEqual(policy.next_delay(), 60.)
+        self.assertEqual(policy.state, reconnect.CIRCUIT_OPEN)
+
+        policy.reset()
+        self.assertEqual(policy.state, reconnect.CIRCUIT_CLOSED)
+
+
+class TestCase(BaseTestCase):
+
+    @testing.gen_test
+    def test_single_flight(self):
+        policy = reconnect.ConstantBackoff(0.05)
+        connection = RobustConnection(host='127.0.0.1', port=unused_port(), reconnect_policy=policy)
+
+        attempt = connection.connect()
+        self.assertIs(connection.connect(), attempt)
+
+        yield gen.sleep(0.5)
+        self.assertFalse(attempt.done())
+        self.assertGreater(policy.failures, 1)
+
+        # Closing stops the attempts
+        connection.close()
+        yield attempt
+
+    @testing.gen_test
+    def test_connect_timeout(self):
+        policy = reconnect.ConstantBackoff(0.05)
+
+        with self.assertRaises(gen.TimeoutError):
+            yield connect_robust(host='127.0.0.1', port=unused_port(), reconnect_policy=policy, timeout=0.3)
+
+        # The attempts stopped with the timeout
+        failures = policy.failures
+        self.assertGreater(failures, 1)
+        yield gen.sleep(0.3)
+        self.assertEqual(policy.failures, failures)
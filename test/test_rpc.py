@@ -0,0 +1,193 @@
+from __future__ import absolute_import
+from tornado import gen, testing
+
+import topika.exceptions
+from topika import ExchangeType, Message
+from topika.rpc import RpcClient, RpcServer
+from . import BaseTestCase
+
+
+class FailingExchange(object):
+
+    @gen.coroutine
+    def publish(self, message, routing_key, mandatory=True, immediate=False):
+        raise RuntimeError("Publish failed")
+
+
+class TestCase(BaseTestCase):
+
+    @gen.coroutine
+    def create_client(self, channel, **kwargs):
+        client = yield RpcClient.create(channel, **kwargs)
+        self.addCleanup(self.wait_for, client.close)
+        raise gen.Return(client)
+
+    @gen.coroutine
+    def start_echo_server(self, channel, queue):
+
+        @gen.coroutine
+        def on_request(message):
+            reply = Message(body=message.body[::-1], correlation_id=message.correlation_id)
+            yield channel.default_exchange.publish(reply, routing_key=message.reply_to, mandatory=False)
+            message.ack()
+
+        yield queue.consume(on_request)
+
+    @testing.gen_test
+    def test_call(self):
+        channel = yield self.create_channel()
+        queue = yield self.declare_queue(auto_delete=True, channel=channel)
+        yield self.start_echo_server(channel, queue)
+
+        client = yield self.create_client(channel)
+        reply = yield client.call(queue.name, b'hello', timeout=5)
+
+        self.assertEqual(reply.body, b'olleh')
+
+    @testing.gen_test
+    def test_concurrent_calls(self):
+        channel = yield self.create_channel()
+        queue = yield self.declare_queue(auto_delete=True, channel=channel)
+        yield self.start_echo_server(channel, queue)
+
+        client = yield self.create_client(channel)
+        bodies = [str(i).encode() * 3 for i in range(20)]
+        replies = yield [client.call(queue.name, body, timeout=5) for body in bodies]
+
+        self.assertListEqual([reply.body for reply in replies], [body[::-1] for body in bodies])
+
+    @testing.gen_test
+    def test_call_timeout(self):
+        channel = yield self.create_channel()
+        queue = yield self.declare_queue(auto_delete=True, channel=channel)
+
+        client = yield self.create_client(channel)
+
+        with self.assertRaises(gen.TimeoutError):
+            yield client.call(queue.name, b'hello', timeout=0.5)
+
+    @testing.gen_test
+    def test_call_publish_failure(self):
+        channel = yield self.create_channel()
+        client = yield self.create_client(channel, exchange=FailingExchange())
+
+        with self.assertRaises(RuntimeError):
+            yield client.call('queue', b'hello')
+
+        self.assertEqual(client._futures.count_pending(), 0)  # pylint: disable=protected-access
+
+    @testing.gen_test
+    def test_close_removes_return_callback(self):
+        channel = yield self.create_channel()
+        callbacks = len(channel._on_return_callbacks)  # pylint: disable=protected-access
+
+        client = yield RpcClient.create(channel)
+        self.assertEqual(len(channel._on_return_callbacks), callbacks + 1)  # pylint: disable=protected-access
+
+        yield client.close()
+        self.assertEqual(len(channel._on_return_callbacks), callbacks)  # pylint: disable=protected-access
+
+    @testing.gen_test
+    def test_call_unroutable(self):
+        channel = yield self.create_channel()
+        client = yield self.create_client(channel)
+
+        with self.assertRaises(topika.exceptions.UnroutableError):
+            yield client.call(self.get_random_name('no_such_queue'), b'hello', timeout=5)
+
+    @gen.coroutine
+    def start_server(self, handler, **kwargs):
+        channel = yield self.create_channel()
+        queue = yield self.declare_queue(auto_delete=True, channel=channel)
+
+        server = RpcServer(channel, queue, handler, **kwargs)
+        yield server.start()
+        self.addCleanup(self.wait_for, server.stop)
+        raise gen.Return(queue)
+
+    @testing.gen_test
+    def test_server(self):
+        queue = yield self.start_server(lambda message: message.body.upper())
+
+        channel = yield self.create_channel()
+        client = yield self.create_client(channel)
+        reply = yield client.call(queue.name, b'hello', timeout=5)
+
+        self.assertEqual(reply.body, b'HELLO')
+
+    @testing.gen_test
+    def test_server_max_concurrency(self):
+        running = []
+        max_running = []
+
+        @gen.coroutine
+        def handler(message):
+            running.append(message)
+            max_running.append(len(running))
+            yield gen.sleep(0.05)
+            running.remove(message)
+            raise gen.Return(message.body)
+
+        queue = yield self.start_server(handler, max_concurrency=2)
+
+        channel = yield self.create_channel()
+        client = yield self.create_client(channel)
+        replies = yield [client.call(queue.name, str(i).encode(), timeout=5) for i in range(10)]
+
+        self.assertEqual(len(replies), 10)
+        self.assertLessEqual(max(max_running), 2)
+
+    @testing.gen_test
+    def test_server_handler_error(self):
+
+        def handler(message):
+            raise ValueError("Bad request")
+
+        queue = yield self.start_server(handler)
+
+        channel = yield self.create_channel()
+        client = yield self.create_client(channel)
+
+        with self.assertRaises(topika.exceptions.RpcError):
+            yield client.call(queue.name, b'hello', timeout=5)
+
+        # The request was acknowledged so the queue is empty
+        result = yield queue.declare(passive=True)
+        self.assertEqual(result.method.message_count, 0)
+
+    @testing.gen_test
+    def test_gather(self):
+        channel = yield self.create_channel()
+        exchange = yield self.declare_exchange(
+            self.get_random_name('fanout'), type=ExchangeType.FANOUT, auto_delete=True, channel=channel)
+
+        names = []
+        for i in range(3):
+            name = 'responder-{}'.format(i)
+            names.append(name)
+
+            server_channel = yield self.create_channel()
+            queue = yield self.declare_queue(auto_delete=True, channel=server_channel)
+            yield queue.bind(exchange)
+
+            server = RpcServer(server_channel, queue, lambda message, name=name: name.encode(), name=name)
+            yield server.start()
+            self.addCleanup(self.wait_for, server.stop)
+
+        client = yield self.create_client(channel)
+
+        result = yield client.gather(exchange, b'status', expected=3, timeout=5)
+        self.assertTrue(result.complete)
+        self.assertListEqual(sorted(reply.responder for reply in result.replies), names)
+        for reply in result.replies:
+            self.assertEqual(reply.message.body, reply.responder.encode())
+            self.assertLessEqual(reply.elapsed, result.elapsed)
+
+        result = yield client.gather(exchange, b'status', quorum=1, timeout=5)
+        self.assertTrue(result.complete)
+        self.assertGreaterEqual(len(result.replies), 1)
+
+        # Expecting more responders than there are returns the partial result at the deadline
+        result = yield client.gather(exchange, b'status', expected=4, timeout=0.5)
+        self.assertFalse(result.complete)
+        self.assertEqual(len(result.replies), 3)
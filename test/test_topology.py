@@ -0,0 +1,103 @@
+from __future__ import absolute_import
+import unittest
+
+from tornado import gen, testing
+
+from topika import connect_robust, ExchangeType, Message
+from topika import topology
+from . import BaseTestCase, AMQP_URL
+
+SPEC = """
+exchanges:
+  {exchange}: {{type: topic, auto_delete: true}}
+queues:
+  {billing}: {{auto_delete: true}}
+  {audit}: {{auto_delete: true}}
+bindings:
+  - {{source: {exchange}, queue: {billing}, routing_key: 'invoice.*'}}
+  - {{source: {exchange}, queue: {audit}, routing_key: '#'}}
+"""
+
+
+class TestTopology(unittest.TestCase):
+
+    def test_load(self):
+        spec = topology.Topology.load(SPEC.format(exchange='events', billing='billing', audit='audit'))
+
+        self.assertListEqual(list(spec.exchanges), ['events'])
+        self.assertEqual(spec.exchanges['events'].type, ExchangeType.TOPIC)
+        self.assertListEqual(list(spec.queues), ['billing', 'audit'])
+        self.assertEqual(len(spec.bindings), 2)
+
+        # A list of named entries is equivalent to a mapping
+        self.assertEqual(
+            spec,
+            topology.Topology.load({
+                'exchanges': [{'name': 'events', 'type': 'topic', 'auto_delete': True}],
+                'queues': [{'name': 'billing', 'auto_delete': True}, {'name': 'audit', 'auto_delete': True}],
+                'bindings': [
+                    {'source': 'events', 'queue': 'billing', 'routing_key': 'invoice.*'},
+                    {'source': 'events', 'queue': 'audit', 'routing_key': '#'},
+                ],
+            }))
+
+    def test_invalid(self):
+        for spec in ({'exchange': {}}, {'queues': {'q': {'durabel': True}}}, {'bindings': [{'source': 'x'}]},
+                     {'bindings': [{'source': 'x', 'queue': 'undeclared'}]}):
+            with self.assertRaises(ValueError):
+                topology.Topology.load(spec)
+
+
+class TestCase(BaseTestCase):
+
+    @gen.coroutine
+    def create_connection(self, cleanup=True):
+        client = yield connect_robust(AMQP_URL, loop=self.loop)
+
+        if cleanup:
+            self.addCleanup(self.wait_for, client.close)
+
+        raise gen.Return(client)
+
+    @testing.gen_test
+    def test_apply(self):
+        channel = yield self.create_channel()
+        names = dict(
+            exchange=self.get_random_name('events'),
+            billing=self.get_random_name('billing'),
+            audit=self.get_random_name('audit'))
+        spec = SPEC.format(**names)
+
+        changes = yield topology.apply(channel, spec)
+        self.assertEqual(len(changes.exchanges), 1)
+        self.assertEqual(len(changes.queues), 2)
+        self.assertEqual(len(changes.bindings), 2)
+
+        # The topology is registered for restoration after a reconnect
+        self.assertIn(names['exchange'], channel._exchanges)
+        self.assertIn(names['billing'], channel._queues)
+
+        exchange = channel._exchanges[names['exchange']]
+        yield exchange.publish(Message(b'invoice'), 'invoice.paid')
+        for name in (names['billing'], names['audit']):
+            message = yield channel._queues[name].get(timeout=5)
+            message.ack()
+
+        # Nothing changed
+        changes = yield topology.apply(channel, spec)
+        self.assertFalse(any(changes))
+
+        # Drop the audit queue
+        reduced = topology.Topology.load(spec)
+        del reduced.queues[names['audit']]
+        del reduced.bindings[[key for key in reduced.bindings if key[2] == names['audit']][0]]
+
+        changes = yield topology.apply(channel, reduced, delete=True)
+        self.assertListEqual([queue.name for queue in changes.removed_queues], [names['audit']])
+        self.assertListEqual(changes.exchanges + changes.queues + changes.bindings, [])
+        self.assertNotIn(names['audit'], channel._queues)
+
+        # Applying an empty spec removes everything
+        changes = yield topology.apply(channel, {}, delete=True)
+        self.assertEqual(len(changes.removed_exchanges), 1)
+        self.assertEqual(len(changes.removed_queues), 1)
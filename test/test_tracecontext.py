@@ -0,0 +1,114 @@
+from __future__ import absolute_import
+import json
+import os
+import shutil
+import tempfile
+
+from tornado import testing
+
+from topika import Message, tools, tracecontext
+from . import BaseTestCase
+
+
+class TestCase(BaseTestCase):
+
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.collector = tracecontext.Collector()
+        self.propagator = tracecontext.enable(exporter=self.collector)
+        self.addCleanup(tracecontext.disable)
+
+    def test_traceparent(self):
+        traceparent = '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01'
+        context = tracecontext.TraceContext.parse(traceparent)
+
+        self.assertEqual(context, ('4bf92f3577b34da6a3ce929d0e0e4736', '00f067aa0ba902b7', True))
+        self.assertEqual(context.traceparent, traceparent)
+        self.assertIsNone(tracecontext.TraceContext.parse('00-{}-00f067aa0ba902b7-01'.format('0' * 32)))
+        self.assertIsNone(tracecontext.TraceContext.parse('garbage'))
+
+    def test_sampling_once_per_trace(self):
+        propagator = tracecontext.Propagator(ratio=0.)
+        root = propagator.start()
+        self.assertFalse(root.sampled)
+        self.assertFalse(tracecontext.Propagator(ratio=1.).start(root).sampled)
+
+        # The decision travels with the unsampled trace so that the consumers don't sample it again
+        message = tracecontext.with_parent(Message(body=b'unsampled'), root)
+        properties = message.properties
+        self.assertIsNone(self.propagator.inject(properties, '', 'key'))
+
+        context = tracecontext.extract(properties.headers)
+        self.assertEqual(context.trace_id, root.trace_id)
+        self.assertFalse(context.sampled)
+        self.assertTrue(properties.headers[tracecontext.HEADER].endswith('-00'))
+        self.assertFalse(self.collector.spans)
+
+    def test_with_parent(self):
+        message = Message(body=b'child', headers={'key': 'value'})
+        headers = message.headers
+
+        with tracecontext.start_span('parent') as parent:
+            self.assertIs(tracecontext.with_parent(message, parent), message)
+            properties = message.properties
+            self.propagator.inject(properties, '', 'key')
+
+        self.assertNotIn(tracecontext.HEADER, headers)
+        context = tracecontext.extract(properties.headers)
+        self.assertEqual(context.trace_id, parent.trace_id)
+        self.assertNotEqual(context.span_id, parent.span_id)
+        self.assertEqual(self.collector.spans[-1].name, 'parent')
+
+    def test_cancelled_publish(self):
+        finish = self.propagator.inject(Message(body=b'cancelled').properties, '', 'key')
+
+        future = tools.create_future(self.loop)
+        if not future.cancel():
+            self.skipTest("The futures of this tornado can't be cancelled")
+        finish(future)
+
+        self.assertEqual(self.collector.spans[-1].attributes['error'], 'cancelled')
+
+    def test_file_exporter(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'spans.jsonl')
+
+        exporter = tracecontext.FileExporter(path)
+        tracecontext.enable(exporter=exporter)
+        for name in ('first', 'second'):
+            with tracecontext.start_span(name):
+                pass
+        exporter.close()
+
+        with open(path) as spans:
+            self.assertEqual([json.loads(line)['name'] for line in spans], ['first', 'second'])
+        self.assertEqual(exporter.dropped, 0)
+
+    @testing.gen_test
+    def test_propagation(self):
+        channel = yield self.create_channel()
+        queue = yield self.declare_queue(auto_delete=True, channel=channel)
+
+        with tracecontext.start_span('request') as root:
+            message = tracecontext.with_parent(Message(body=b'traced'), root)
+            yield channel.default_exchange.publish(message, queue.name)
+        message = yield queue.get(timeout=5, no_ack=True)
+
+        self.assertEqual(message.trace_context.trace_id, root.trace_id)
+        self.assertEqual([span.name for span in self.collector.spans], ['publish', 'request'])
+        self.assertEqual(self.collector.spans[0].parent_id, root.span_id)
+        self.assertEqual(self.collector.spans[0].span_id, message.trace_context.span_id)
+
+    @testing.gen_test
+    def test_disabled(self):
+        tracecontext.disable()
+
+        channel = yield self.create_channel()
+        queue = yield self.declare_queue(auto_delete=True, channel=channel)
+
+        yield channel.default_exchange.publish(Message(body=b'plain'), queue.name)
+        message = yield queue.get(timeout=5, no_ack=True)
+
+        self.assertIsNone(message.trace_context)
+        self.assertFalse(self.collector.spans)
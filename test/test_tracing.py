@@ -0,0 +1,146 @@
+from __future__ import absolute_import
+import unittest
+
+import pika.frame
+import pika.spec
+from tornado import gen, locks, testing
+
+try:
+    from unittest import mock
+except ImportError:
+    from mock import mock
+
+from topika import Channel, Message
+from topika import tracing
+from topika.common import FutureStore
+from . import BaseTestCase
+
+
+class RecordingTracer(tracing.Tracer):
+
+    def __init__(self):
+        self.events = []
+
+    def on_publish(self, channel, exchange, routing_key, delivery_tag, timestamp, duration):
+        self.events.append(('publish', routing_key, duration))
+
+    def on_confirm(self, channel, delivery_tag, acked, timestamp, latency):
+        self.events.append(('confirm', acked, latency))
+
+    def on_deliver(self, queue, message, timestamp):
+        self.events.append(('deliver', queue.name, timestamp))
+
+    def on_ack(self, message, action, timestamp, latency):
+        self.events.append((action, message.body, latency))
+
+    def on_declare(self, channel, kind, name, timestamp, duration):
+        self.events.append(('declare', kind, duration))
+
+    def on_channel_open(self, channel, timestamp, duration):
+        self.events.append(('channel_open', channel.number, duration))
+
+    def kinds(self):
+        return [event[0] for event in self.events]
+
+
+class FailingTracer(tracing.Tracer):
+
+    def on_publish(self, *args):  # pylint: disable=arguments-differ
+        raise RuntimeError("Broken tracer")
+
+
+class TestInstall(unittest.TestCase):
+
+    def tearDown(self):
+        tracing.uninstall()
+
+    def test_install_uninstall(self):
+        self.assertIsNone(tracing.TRACER)
+
+        first, second = tracing.Tracer(), tracing.Tracer()
+        tracing.install(first)
+        tracing.install(second)
+        self.assertEqual(tracing.tracers(), (first, second))
+
+        tracing.uninstall(first)
+        self.assertEqual(tracing.tracers(), (second,))
+
+        tracing.uninstall()
+        self.assertIsNone(tracing.TRACER)
+
+    def test_failing_tracer_is_isolated(self):
+        recording = RecordingTracer()
+        tracing.install(FailingTracer())
+        tracing.install(recording)
+
+        tracing.TRACER.on_publish(None, '', 'key', 1, tracing.clock(), 0.)
+        self.assertEqual(recording.kinds(), ['publish'])
+
+
+class TestCase(BaseTestCase):
+
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.tracer = RecordingTracer()
+        tracing.install(self.tracer)
+        self.addCleanup(tracing.uninstall, self.tracer)
+
+    @testing.gen_test
+    def test_operations_are_traced(self):
+        channel = yield self.create_channel()
+        queue = yield self.declare_queue(auto_delete=True, channel=channel)
+
+        received = locks.Event()
+
+        def on_message(message):
+            message.ack()
+            received.set()
+
+        yield queue.consume(on_message)
+        yield channel.default_exchange.publish(Message(body=b'traced'), queue.name)
+        yield received.wait()
+        yield gen.sleep(0)
+
+        kinds = self.tracer.kinds()
+        for kind in ('channel_open', 'declare', 'publish', 'confirm', 'deliver', tracing.ACK):
+            self.assertIn(kind, kinds)
+
+        confirm = self.tracer.events[kinds.index('confirm')]
+        self.assertTrue(confirm[1])
+        self.assertGreaterEqual(confirm[2], 0)
+
+        ack = self.tracer.events[kinds.index(tracing.ACK)]
+        self.assertEqual(ack[1], b'traced')
+        self.assertGreaterEqual(ack[2], 0)
+
+    @testing.gen_test
+    def test_no_ack_consumer_is_traced(self):
+        """ The delivery of a locked, no_ack message must not set public attributes on it """
+        channel = yield self.create_channel()
+        queue = yield self.declare_queue(auto_delete=True, channel=channel)
+
+        received = []
+        yield queue.consume(received.append, no_ack=True)
+        yield channel.default_exchange.publish(Message(body=b'traced'), queue.name)
+        while not received:
+            yield gen.sleep(0.01)
+
+        self.assertTrue(received[0].locked)
+        self.assertEqual(received[0].body, b'traced')
+        self.assertIn('deliver', self.tracer.kinds())
+
+    @testing.gen_test
+    def test_multiple_confirm_is_traced_per_message(self):
+        channel = Channel(None, self.loop, FutureStore(self.loop))
+        channel._channel = mock.Mock()
+        futures = [
+            channel._basic_publish('', 'key', b'body', pika.spec.BasicProperties(), False, False) for _ in range(3)
+        ]
+
+        channel._on_delivery_confirmation(pika.frame.Method(1, pika.spec.Basic.Ack(delivery_tag=2, multiple=True)))
+        yield futures[:2]
+
+        confirms = [event for event in self.tracer.events if event[0] == 'confirm']
+        self.assertEqual(len(confirms), 2)
+        self.assertTrue(all(acked and latency >= 0 for _, acked, latency in confirms))
+        self.assertEqual(list(channel._published_at), [3])
@@ -0,0 +1,50 @@
+from __future__ import absolute_import
+from tornado import gen, testing
+
+from topika import Message
+from topika.workers import Worker
+from . import BaseTestCase, AMQP_URL
+
+
+class TestCase(BaseTestCase):
+
+    @gen.coroutine
+    def wait_until(self, condition, timeout=5):
+        deadline = self.loop.time() + timeout
+        while not condition():
+            self.assertLess(self.loop.time(), deadline)
+            yield gen.sleep(0.01)
+
+    @testing.gen_test
+    def test_worker_drain(self):
+        channel = yield self.create_channel()
+        queue = yield channel.declare_queue(self.get_random_name('workers'))
+        self.addCleanup(self.wait_for, queue.delete, if_unused=False, if_empty=False)
+
+        received = []
+        release = gen.sleep(0.2)
+
+        @gen.coroutine
+        def handler(message):
+            received.append(message.body)
+            if message.body == b'fail':
+                raise ValueError("Bad message")
+            yield release
+
+        worker = Worker(0, AMQP_URL, [queue.name], handler, prefetch_count=4)
+        yield worker.start()
+
+        for body in (b'a', b'b', b'fail'):
+            yield channel.default_exchange.publish(Message(body=body), queue.name)
+
+        yield self.wait_until(lambda: len(received) >= 3)
+
+        # Draining lets the messages in flight finish before closing the connection
+        yield worker.drain()
+        self.assertTrue(release.done())
+        self.assertEqual(worker._processed, 2)  # pylint: disable=protected-access
+        self.assertGreaterEqual(worker._failed, 1)  # pylint: disable=protected-access
+
+        # The failed message was requeued, the others were acknowledged
+        result = yield queue.declare(passive=True)
+        self.assertEqual(result.method.message_count, 1)
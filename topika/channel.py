@@ -15,6 +15,7 @@ from . import exchange
 from . import message
 from . import queue
 from . import tools
+from . import tracing
 from . import transaction
 
 LOGGER = logging.getLogger(__name__)
@@ -22,6 +23,46 @@ LOGGER = logging.getLogger(__name__)
 FunctionOrCoroutine = Union[Callable[[message.IncomingMessage], Any], Awaitable[message.IncomingMessage]]
 
 
+class _WriteLock(object):
+    """ A :class:`tornado.locks.Lock` that knows whether it is held or waited for, which tornado has no public
+    API for.  Used like the tornado lock: ``with (yield lock.acquire()):`` """
+
+    __slots__ = ('_lock', '_users')
+
+    def __init__(self):
+        self._lock = locks.Lock()
+        # The holder and the waiters
+        self._users = 0
+
+    def locked(self):
+        """
+        :return: whether the lock is held or waited for
+        :rtype: bool
+        """
+        return self._users > 0
+
+    @gen.coroutine
+    def acquire(self, timeout=None):
+        self._users += 1
+        try:
+            yield self._lock.acquire(timeout)
+        except BaseException:
+            self._users -= 1
+            raise
+
+        raise gen.Return(self)
+
+    def release(self):
+        self._users -= 1
+        self._lock.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
 class Channel(BaseChannel):
     """ Channel abstraction """
 
@@ -30,7 +71,7 @@ class Channel(BaseChannel):
 
     __slots__ = ('_connection', '__closing', '_confirmations', '_delivery_tag', 'loop', '_futures', '_channel',
                  '_on_return_callbacks', 'default_exchange', '_write_lock', '_channel_number', '_publisher_confirms',
-                 '_on_return_raises')
+                 '_on_return_raises', '_opening', '_topology', '_declarations', '_published_at', '_opened_at')
 
     def __init__(self,
                  connection,
@@ -38,7 +79,8 @@ class Channel(BaseChannel):
                  future_store,
                  channel_number=None,
                  publisher_confirms=True,
-                 on_return_raises=False):
+                 on_return_raises=False,
+                 cache_declarations=False):
         """
         Create a new instance of the Channel.  Don't call this directly, this should
         be constructed by the connection.
@@ -50,6 +92,9 @@ class Channel(BaseChannel):
         :type channel_number: int
         :type publisher_confirms: bool
         :type on_return_raises: bool
+        :param cache_declarations: return the same exchange or queue object, without a round trip to the
+            broker, when it is declared again with the same arguments
+        :type cache_declarations: bool
         """
         super(Channel, self).__init__(loop, future_store.create_child())
 
@@ -58,8 +103,14 @@ class Channel(BaseChannel):
         self._confirmations = {}
         self._on_return_callbacks = []
         self._delivery_tag = 0
-        self._write_lock = locks.Lock()
+        self._write_lock = _WriteLock()
         self._channel_number = channel_number
+        self._opening = None
+        self._topology = None
+        self._declarations = common.DeclarationCache() if cache_declarations else None
+        # The publish times by delivery tag and the open time, only recorded while tracing
+        self._published_at = {}
+        self._opened_at = None
         self._publisher_confirms = publisher_confirms
 
         if not publisher_confirms and on_return_raises:
@@ -87,7 +138,7 @@ class Channel(BaseChannel):
 
     @property
     def number(self):
-        return self._channel.channel_number
+        return self._channel_number
 
     def __str__(self):
         return "{0}".format(self.number if self._channel else "Not initialized channel")
@@ -111,6 +162,15 @@ class Channel(BaseChannel):
 
         log_method("Channel %r closed: %s", channel, reason)
 
+        tracer = tracing.TRACER
+        if tracer is not None:
+            now = tracing.clock()
+            tracer.on_channel_close(self, reason, now, now - self._opened_at if self._opened_at else None)
+        self._published_at.clear()
+
+        if self._declarations is not None:
+            self._declarations.clear()
+
         self._futures.reject_all(reason)
         return reason
 
@@ -128,6 +188,10 @@ class Channel(BaseChannel):
         """
         msg = message.ReturnedMessage(channel=channel, body=body, envelope=method, properties=properties)
 
+        tracer = tracing.TRACER
+        if tracer is not None:
+            tracer.on_return(self, msg, tracing.clock())
+
         for callback in self._on_return_callbacks:
             tools.create_task(callback(msg))
 
@@ -155,11 +219,32 @@ class Channel(BaseChannel):
         """
         self._on_return_callbacks.append(gen.coroutine(callback))
 
-    @gen.coroutine
-    def _create_channel(self, timeout=None):
+    def remove_on_return_callback(self, callback):
+        """
+        :param callback: a callback added with :meth:`add_on_return_callback`
+        """
+        self._on_return_callbacks = [
+            added for added in self._on_return_callbacks if getattr(added, '__wrapped__', added) != callback
+        ]
+
+    def _open(self, timeout=None):
+        """ Send the channel open method, which reserves the channel number, without waiting for the reply
+
+        :return: future resolved with the pika channel once it is open
+        :rtype: :class:`tornado.concurrent.Future`
+        """
         future = self._create_future(timeout=timeout)
 
-        self._channel_maker(channel_number=self._channel_number, on_open_callback=future.set_result)
+        channel = self._channel_maker(channel_number=self._channel_number, on_open_callback=future.set_result)
+
+        self._channel_number = channel.channel_number
+        self._opening = future
+        return future
+
+    @gen.coroutine
+    def _create_channel(self, timeout=None):
+        future = self._opening or self._open(timeout)
+        self._opening = None
 
         channel = yield future  # type: pika.channel.Channel
         if self._publisher_confirms:
@@ -179,32 +264,73 @@ class Channel(BaseChannel):
             if self._closing.done():
                 raise RuntimeError("Can't initialize closed channel")
 
+            tracer = tracing.TRACER
+            start = tracing.clock() if tracer is not None else None
+
             self._channel = yield self._create_channel(timeout)
             self._delivery_tag = 0
 
+            if tracer is not None:
+                self._opened_at = tracing.clock()
+                tracer.on_channel_open(self, self._opened_at, self._opened_at - start)
+
     def _on_return_delivery(self, channel, method_frame, properties, body):
         f = self._confirmations.pop(int(properties.headers.get('delivery-tag')))
         f.set_exception(exceptions.UnroutableError([body]))
 
+    @staticmethod
+    def _confirmed_tags(pending, method):
+        """ The pending delivery tags settled by a confirmation, the broker confirms all the tags up to and
+        including the delivery tag at once when `multiple` is set
+
+        :param pending: the pending delivery tags
+        :type pending: dict
+        :type method: :class:`pika.spec.Basic.Ack` or :class:`pika.spec.Basic.Nack`
+        :rtype: list
+        """
+        if not method.multiple:
+            return [method.delivery_tag] if method.delivery_tag in pending else []
+
+        return sorted(tag for tag in pending if tag <= method.delivery_tag)
+
     def _on_delivery_confirmation(self, method_frame):
-        future = self._confirmations.pop(method_frame.method.delivery_tag, None)
+        method = method_frame.method
+        futures = [self._confirmations.pop(tag) for tag in self._confirmed_tags(self._confirmations, method)]
 
-        if not future:
-            LOGGER.info("Unknown delivery tag %d for message confirmation \"%s\"", method_frame.method.delivery_tag,
-                        method_frame.method.NAME)
+        if not futures:
+            LOGGER.info("Unknown delivery tag %d for message confirmation \"%s\"", method.delivery_tag, method.NAME)
             return
 
-        try:
-            confirmation_type = common.ConfirmationTypes(method_frame.method.NAME.split('.')[1].lower())
+        for future in futures:
+            if future.done():
+                # Cancelled by the publisher, e.g. on a timeout
+                continue
 
-            if confirmation_type == common.ConfirmationTypes.ACK:
-                future.set_result(True)
-            elif confirmation_type == common.ConfirmationTypes.NACK:
-                future.set_exception(exceptions.NackError(method_frame))
-        except ValueError:
-            future.set_exception(RuntimeError('Unknown method frame', method_frame))
-        except Exception as e:
-            future.set_exception(e)
+            try:
+                confirmation_type = common.ConfirmationTypes(method.NAME.split('.')[1].lower())
+
+                if confirmation_type == common.ConfirmationTypes.ACK:
+                    future.set_result(True)
+                elif confirmation_type == common.ConfirmationTypes.NACK:
+                    future.set_exception(exceptions.NackError([method_frame]))
+            except ValueError:
+                future.set_exception(RuntimeError('Unknown method frame', method_frame))
+            except Exception as e:
+                future.set_exception(e)
+
+        if self._published_at or tracing.TRACER is not None:
+            self._trace_confirmation(method_frame)
+
+    def _trace_confirmation(self, method_frame):
+        method = method_frame.method
+        confirmed = [(tag, self._published_at.pop(tag)) for tag in self._confirmed_tags(self._published_at, method)]
+
+        tracer = tracing.TRACER
+        if tracer is not None:
+            now = tracing.clock()
+            acked = method.NAME == 'Basic.Ack'
+            for delivery_tag, published_at in confirmed or [(method.delivery_tag, None)]:
+                tracer.on_confirm(self, delivery_tag, acked, now, now - published_at if published_at else None)
 
     @BaseChannel._ensure_channel_is_open
     @gen.coroutine
@@ -216,7 +342,8 @@ class Channel(BaseChannel):
                          internal=False,
                          passive=False,
                          arguments=None,
-                         timeout=None):
+                         timeout=None,
+                         nowait=False):
         """
         :type name: str
         :type type: ExchangeType
@@ -226,13 +353,25 @@ class Channel(BaseChannel):
         :type passive: Optional[bool]
         :type arguments: dict or NoneType
         :type timeout: int
+        :param nowait: don't wait for the reply of the broker, errors surface on the next synchronous
+            operation such as :meth:`synchronize`
+        :type nowait: bool
         :rtype: :class:`Generator[Any, None, exchange.Exchange]`
         """
 
+        tracer = tracing.TRACER
+        start = tracing.clock() if tracer is not None else None
+
         with (yield self._write_lock.acquire()):
             if auto_delete and durable is None:
                 durable = False
 
+            cache_key = dict(
+                type=type, durable=durable, auto_delete=auto_delete, internal=internal, arguments=arguments)
+            cached = self._get_declared(common.DeclarationCache.EXCHANGE, name, cache_key, passive)
+            if cached is not None:
+                raise gen.Return(cached)
+
             exchange = self.EXCHANGE_CLASS(
                 loop=self.loop,
                 future_store=self._futures.create_child(),
@@ -246,44 +385,90 @@ class Channel(BaseChannel):
                 internal=internal,
                 arguments=arguments)
 
-            yield exchange.declare(timeout=timeout)
+            yield exchange.declare(timeout=timeout, nowait=nowait)
 
             LOGGER.debug("Exchange declared %r", exchange)
 
+            if tracer is not None:
+                now = tracing.clock()
+                tracer.on_declare(self, tracing.EXCHANGE, name, now, now - start)
+
+            self._add_declared(common.DeclarationCache.EXCHANGE, name, cache_key, passive, exchange)
+
             raise gen.Return(exchange)
 
     @BaseChannel._ensure_channel_is_open
-    @gen.coroutine
     def _publish(self, queue_name, routing_key, body, properties, mandatory, immediate):
         """
         :type properties: :class:`pika.BasicProperties`
+        :return: future resolved once the broker confirmed the message
+        :rtype: :class:`tornado.concurrent.Future`
         """
+        connection = self._connection
+        if not self._write_lock.locked() and not connection.is_closed and (
+                not connection.is_blocked or connection.blocked_policy is common.BlockedPolicy.IGNORE):
+            # Nothing to wait for: send right away, without going through a coroutine
+            return self._basic_publish(queue_name, routing_key, body, properties, mandatory, immediate)
+
+        return self._publish_when_ready(queue_name, routing_key, body, properties, mandatory, immediate)
+
+    @gen.coroutine
+    def _publish_when_ready(self, queue_name, routing_key, body, properties, mandatory, immediate):
         with (yield self._write_lock.acquire()):
             while self._connection.is_closed:
                 LOGGER.debug("Can't publish message because connection is inactive")
                 yield gen.sleep(1)
 
-            publish_future = self._create_future()
-            self._delivery_tag += 1
+            if self._connection.is_blocked:
+                blocked_policy = self._connection.blocked_policy
+                if blocked_policy is common.BlockedPolicy.RAISE:
+                    raise exceptions.ConnectionBlocked("The connection is blocked by the broker")
+                elif blocked_policy is common.BlockedPolicy.WAIT:
+                    LOGGER.debug("Waiting for the connection to be unblocked before publishing")
+                    yield self._connection.wait_unblocked()
 
-            if self._on_return_raises:
-                properties.headers = properties.headers or {}
-                properties.headers['delivery-tag'] = str(self._delivery_tag)
+            publish_future = self._basic_publish(queue_name, routing_key, body, properties, mandatory, immediate)
 
-            try:
-                self._channel.basic_publish(queue_name, routing_key, body, properties, mandatory, immediate)
-            except (AttributeError, RuntimeError) as exc:
-                LOGGER.exception("Failed to send data to client (connection unexpectedly closed)")
-                self._on_channel_close(self._channel, exc)
-                self._connection._connection.close(reply_code=500, reply_text="Incorrect state")
+        # Wait for the confirmation outside the lock so that concurrent publishes are pipelined: several messages
+        # can be unconfirmed at once, and the broker may confirm them together, see _on_delivery_confirmation
+        result = yield publish_future
+        raise gen.Return(result)
+
+    def _basic_publish(self, queue_name, routing_key, body, properties, mandatory, immediate):
+        """ Send the message, the caller makes sure nothing else is writing to the channel
+
+        :rtype: :class:`tornado.concurrent.Future`
+        """
+        publish_future = self._create_future()
+        self._delivery_tag += 1
+
+        if self._on_return_raises:
+            properties.headers = properties.headers or {}
+            properties.headers['delivery-tag'] = str(self._delivery_tag)
+
+        tracer = tracing.TRACER
+        if tracer is not None:
+            start = tracing.clock()
+
+        try:
+            self._channel.basic_publish(queue_name, routing_key, body, properties, mandatory, immediate)
+        except (AttributeError, RuntimeError) as exc:
+            LOGGER.exception("Failed to send data to client (connection unexpectedly closed)")
+            self._on_channel_close(self._channel, exc)
+            self._connection._connection.close(reply_code=500, reply_text="Incorrect state")
+        else:
+            if self._publisher_confirms:
+                self._confirmations[self._delivery_tag] = publish_future
             else:
+                publish_future.set_result(None)
+
+            if tracer is not None:
+                now = tracing.clock()
                 if self._publisher_confirms:
-                    self._confirmations[self._delivery_tag] = publish_future
-                else:
-                    publish_future.set_result(None)
+                    self._published_at[self._delivery_tag] = start
+                tracer.on_publish(self, queue_name, routing_key, self._delivery_tag, now, now - start)
 
-            result = yield publish_future
-            raise gen.Return(result)
+        return publish_future
 
     @BaseChannel._ensure_channel_is_open
     @gen.coroutine
@@ -294,7 +479,8 @@ class Channel(BaseChannel):
                       passive=False,
                       auto_delete=False,
                       arguments=None,
-                      timeout=None):
+                      timeout=None,
+                      nowait=False):
         """
         :param name: queue name
         :type name: str
@@ -312,19 +498,53 @@ class Channel(BaseChannel):
         :type arguments: Optional[dict]
         :param timeout: execution timeout
         :type timeout: int
+        :param nowait: don't wait for the reply of the broker, errors surface on the next synchronous
+            operation such as :meth:`synchronize`.  The queue needs a name.
+        :type nowait: bool
         :rtype: :class:`topika.Queue`
         """
 
+        tracer = tracing.TRACER
+        start = tracing.clock() if tracer is not None else None
+
         with (yield self._write_lock.acquire()):
             if auto_delete and durable is None:
                 durable = False
 
+            cache_key = dict(durable=durable, exclusive=exclusive, auto_delete=auto_delete, arguments=arguments)
+            # Server named queues are unique to every declaration
+            cached = self._get_declared(common.DeclarationCache.QUEUE, name, cache_key, passive or not name)
+            if cached is not None:
+                raise gen.Return(cached)
+
             queue = self.QUEUE_CLASS(self.loop, self._futures.create_child(), self._channel, name, durable, exclusive,
                                      auto_delete, arguments)
 
-            yield queue.declare(timeout, passive=passive)
+            yield queue.declare(timeout, passive=passive, nowait=nowait)
+
+            if tracer is not None:
+                now = tracing.clock()
+                tracer.on_declare(self, tracing.QUEUE, queue.name, now, now - start)
+
+            self._add_declared(common.DeclarationCache.QUEUE, name, cache_key, passive or not name, queue)
             raise gen.Return(queue)
 
+    def _get_declared(self, kind, name, arguments, passive):
+        """
+        :return: the cached exchange or queue declared with the same arguments, None if there is none
+        """
+        if self._declarations is None or passive:
+            return None
+
+        return self._declarations.get(kind, name, arguments)
+
+    def _add_declared(self, kind, name, arguments, passive, declared):
+        if self._declarations is None or passive:
+            return
+
+        declared._declarations = self._declarations  # pylint: disable=protected-access
+        self._declarations.add(kind, name, arguments, declared)
+
     @gen.coroutine
     def close(self):
         if not self._channel:
@@ -359,40 +579,83 @@ class Channel(BaseChannel):
 
     @BaseChannel._ensure_channel_is_open
     @gen.coroutine
-    def queue_delete(self, queue_name, timeout=None, if_unused=False, if_empty=False):
+    def queue_delete(self, queue_name, timeout=None, if_unused=False, if_empty=False, nowait=False):
         """
         :type queue_name: str
         :type timeout: int
         :type if_unused: bool
         :type if_empty: bool
+        :param nowait: don't wait for the reply of the broker
+        :type nowait: bool
         """
         with (yield self._write_lock.acquire()):
             f = self._create_future(timeout=timeout)
 
             self._channel.queue_delete(
-                callback=f.set_result,
+                callback=None if nowait else f.set_result,
                 queue=queue_name,
                 if_unused=if_unused,
                 if_empty=if_empty,
             )
 
+            if nowait:
+                f.set_result(None)
+
+            if self._declarations is not None:
+                self._declarations.discard(common.DeclarationCache.QUEUE, queue_name)
+
             raise gen.Return((yield f))
 
     @BaseChannel._ensure_channel_is_open
     @gen.coroutine
-    def exchange_delete(self, exchange_name, timeout=None, if_unused=False):
+    def exchange_delete(self, exchange_name, timeout=None, if_unused=False, nowait=False):
         """
         :type exchange_name: str
         :type timeout: int
         :type if_unused:bool
+        :param nowait: don't wait for the reply of the broker
+        :type nowait: bool
         """
         with (yield self._write_lock.acquire()):
             f = self._create_future(timeout=timeout)
 
-            self._channel.exchange_delete(exchange=exchange_name, if_unused=if_unused, callback=f.set_result)
+            self._channel.exchange_delete(
+                exchange=exchange_name, if_unused=if_unused, callback=None if nowait else f.set_result)
+
+            if nowait:
+                f.set_result(None)
+
+            if self._declarations is not None:
+                self._declarations.discard(common.DeclarationCache.EXCHANGE, exchange_name)
 
             raise gen.Return((yield f))
 
+    @BaseChannel._ensure_channel_is_open
+    @gen.coroutine
+    def synchronize(self, timeout=None):
+        """ Wait until the broker has processed all the methods sent on the channel so far.
+
+        Operations sent with `nowait` get no reply, a failing one makes the broker close the channel instead.
+        The methods of a channel are processed in order so a round trip after them surfaces such an error,
+        this sends a passive declare of the always present `amq.direct` exchange.
+
+        .. code-block:: python
+
+            for tenant in tenants:
+                queue = yield channel.declare_queue(tenant, durable=True, nowait=True)
+                yield queue.bind(exchange, tenant, nowait=True)
+
+            yield channel.synchronize()
+
+        :type timeout: int
+        :raises pika.exceptions.ChannelClosed: when the broker rejected one of the preceding operations
+        """
+        f = self._create_future(timeout=timeout)
+
+        self._channel.exchange_declare(exchange='amq.direct', passive=True, callback=f.set_result)
+
+        yield f
+
     def transaction(self):
         """
         :rtype: :class:`topika.Transaction`
@@ -1,6 +1,9 @@
 from __future__ import absolute_import
 import contextlib
 import enum
+import math
+import weakref
+from six.moves import range
 import tornado.ioloop
 from tornado import gen
 import tornado.gen
@@ -16,9 +19,24 @@ class ConfirmationTypes(enum.Enum):
     NACK = 'nack'
 
 
+@enum.unique
+class BlockedPolicy(enum.Enum):
+    """ What publishing does while the broker has blocked the connection because of a resource alarm """
+    IGNORE = 'ignore'  # Publish anyway, the data piles up in the socket buffers
+    WAIT = 'wait'  # Park the publishers until the connection is unblocked
+    RAISE = 'raise'  # Fail fast with ConnectionBlocked
+
+
 def ensure_coroutine(func_or_coro):
     if gen.is_coroutine_function(func_or_coro):
         return func_or_coro
+    elif tools.iscoroutinepartial(func_or_coro):
+
+        @coroutine
+        def native(*args, **kwargs):
+            raise Return((yield func_or_coro(*args, **kwargs)))
+
+        return native
     else:
 
         @coroutine
@@ -76,20 +94,142 @@ def future_with_timeout(loop, timeout, future=None):
     return f
 
 
+class TimerWheel(object):
+    """ Hashed timer wheel that fails futures with a :class:`tornado.ioloop.TimeoutError` once their timeout
+    has passed.
+
+    Adding and cancelling a timeout are O(1), unlike a `call_later` per future which goes into the heap of the
+    IOLoop.  A single callback per tick, only scheduled while there are timeouts, turns the wheel on the loop
+    of the wheel.  Timeouts fire up to one tick late, never early.
+    """
+    __slots__ = ('__loop', '__tick', '__buckets', '__bucket_of', '__turned', '__ticker')
+
+    DEFAULT_TICK = 0.05
+    DEFAULT_SLOTS = 512
+
+    def __init__(self, loop, tick=DEFAULT_TICK, slots=DEFAULT_SLOTS):
+        """
+        :type loop: :class:`tornado.ioloop.IOLoop`
+        :param tick: the resolution of the timeouts in seconds
+        :type tick: float
+        :param slots: the number of buckets of the wheel
+        :type slots: int
+        """
+        if tick <= 0:
+            raise ValueError("The tick must be positive")
+
+        self.__loop = loop
+        self.__tick = tick
+        self.__buckets = [dict() for _ in range(slots)]  # Every bucket maps a future to the tick of its deadline
+        self.__bucket_of = {}
+        self.__turned = None  # The last tick that was processed
+        self.__ticker = None
+
+    def __len__(self):
+        return len(self.__bucket_of)
+
+    @property
+    def tick(self):
+        return self.__tick
+
+    def add(self, future, timeout):
+        """ Fail the future once `timeout` seconds have passed, unless it is done or cancelled before
+
+        :type future: :class:`tornado.concurrent.Future`
+        :type timeout: float
+        """
+        now = self.__loop.time()
+        deadline = int(math.ceil((now + timeout) / self.__tick))
+        bucket = self.__buckets[deadline % len(self.__buckets)]
+        bucket[future] = deadline
+        self.__bucket_of[future] = bucket
+
+        if self.__ticker is None:
+            self.__turned = int(now / self.__tick)
+            self._schedule()
+
+    def cancel(self, future):
+        """ Forget the timeout of the future, this is a no-op if it has none
+
+        :type future: :class:`tornado.concurrent.Future`
+        """
+        bucket = self.__bucket_of.pop(future, None)
+        if bucket is not None:
+            del bucket[future]
+
+    def _schedule(self):
+        """ Turn the wheel at the start of the next tick """
+        self.__ticker = self.__loop.call_at((int(self.__loop.time() / self.__tick) + 1) * self.__tick, self._turn)
+
+    def _turn(self):
+        now = int(self.__loop.time() / self.__tick)
+        # Catch up on the ticks that were missed while the loop was busy, one turn visits every bucket
+        first = max(self.__turned + 1, now - len(self.__buckets) + 1)
+        self.__turned = now
+
+        for tick in range(first, now + 1):
+            bucket = self.__buckets[tick % len(self.__buckets)]
+            expired = [future for future, deadline in bucket.items() if deadline <= now]
+            for future in expired:
+                self.cancel(future)
+                if not future.done():
+                    future.set_exception(tornado.ioloop.TimeoutError)
+
+        if self.__bucket_of:
+            self._schedule()
+        else:
+            self.__ticker = None
+
+
 class FutureStore(object):
     """
     Borrowed from aio_pika (https://github.com/mosquito/aio-pika)
+
+    Stores form a tree, e.g. connection, channel, queue.  A future is only registered with the store that
+    created it and gets a single done callback.  Rejecting all the futures of a store covers those of its
+    descendants, which are found through the children of every store.
     """
-    __slots__ = "__collection", "__loop", "__parent_store"
+    __slots__ = ("__collection", "__loop", "__parent_store", "__timer_wheel", "__children", "__on_done",
+                 "__weakref__")
+
+    # The number of futures rejected per IOLoop callback, other work runs in between the slices
+    REJECT_SLICE = 1000
 
-    def __init__(self, loop, parent_store=None):
+    def __init__(self, loop, parent_store=None, tick=TimerWheel.DEFAULT_TICK):
+        """
+        :type loop: :class:`tornado.ioloop.IOLoop`
+        :param parent_store: the store this one is a child of
+        :type parent_store: :class:`FutureStore`
+        :param tick: the resolution in seconds of the timeouts of the futures, children share the timer
+            wheel of the root store
+        :type tick: float
+        """
         self.__parent_store = parent_store
         self.__collection = set()
+        # Stores of exchanges and queues that are dropped go away with them
+        self.__children = weakref.WeakSet()
         self.__loop = loop if loop else tornado.ioloop.IOLoop.current()
+        self.__on_done = self._on_future_done
+        if parent_store is None:
+            self.__timer_wheel = TimerWheel(self.__loop, tick)
+        else:
+            self.__timer_wheel = parent_store.__timer_wheel
+            parent_store.__children.add(self)
+
+    def __len__(self):
+        """ The number of pending futures of this store, without those of its descendants """
+        return len(self.__collection)
+
+    def count_pending(self):
+        """ The number of pending futures of this store and all its descendants
+
+        :rtype: int
+        """
+        return len(self.__collection) + sum(child.count_pending() for child in list(self.__children))
 
     def _on_future_done(self, future):
-        if future in self.__collection:
-            self.__collection.remove(future)
+        self.__collection.discard(future)
+        self.__timer_wheel.cancel(future)
 
     @staticmethod
     def _reject_future(future, exception):
@@ -99,16 +239,43 @@ class FutureStore(object):
         future.set_exception(exception)
 
     def add(self, future):
-        if self.__parent_store:
-            self.__parent_store.add(future)
-
         self.__collection.add(future)
-        future.add_done_callback(self._on_future_done)
+        future.add_done_callback(self.__on_done)
+
+    def _take_pending(self):
+        """ Detach the pending futures of this store and all its descendants
+
+        :rtype: list
+        """
+        pending = []
+        stores = [self]
+        while stores:
+            store = stores.pop()
+            pending.extend(store.__collection)
+            store.__collection.clear()
+            stores.extend(store.__children)
+
+        return pending
 
     def reject_all(self, exception):
-        for future in list(self.__collection):
-            self.__collection.remove(future)
-            self.__loop.add_callback(self._reject_future, future, exception)
+        """ Reject the pending futures of this store and its descendants with the exception.
+
+        Collecting them walks the stores of the subtree, O(stores + futures), as every future is only
+        registered with the store that created it.  They are rejected from IOLoop callbacks, each one handling
+        at most :attr:`REJECT_SLICE` futures, instead of one callback per future which would hold up all other
+        work on the loop.
+        """
+        pending = self._take_pending()
+        if pending:
+            self.__loop.add_callback(self._reject_slice, pending, 0, exception)
+
+    def _reject_slice(self, pending, start, exception):
+        end = start + self.REJECT_SLICE
+        for future in pending[start:end]:
+            self._reject_future(future, exception)
+
+        if end < len(pending):
+            self.__loop.add_callback(self._reject_slice, pending, end, exception)
 
     @staticmethod
     def _on_timeout(future):
@@ -118,12 +285,12 @@ class FutureStore(object):
         future.set_exception(tornado.ioloop.TimeoutError)
 
     def create_future(self, timeout=None):
-        future = future_with_timeout(self.__loop, timeout)
+        future = tools.create_future(loop=self.__loop)
 
-        self.add(future)
+        if timeout:
+            self.__timer_wheel.add(future, timeout)
 
-        if self.__parent_store:
-            self.__parent_store.add(future)
+        self.add(future)
 
         return future
 
@@ -137,9 +304,50 @@ class FutureStore(object):
             future = self.create_future(timeout)
             yield future
         finally:
-            # Cleanup
-            if future in self.__collection:
-                self.__collection.remove(future)
+            # Cleanup, the timeout included so that an abandoned future doesn't fail later
+            if future is not None:
+                self._on_future_done(future)
+
+
+class DeclarationCache(object):
+    """ The exchanges and queues declared on a channel, keyed by their name and the arguments they were
+    declared with, so that declaring them again needs no round trip to the broker """
+    __slots__ = ('__entries',)
+
+    EXCHANGE = 'exchange'
+    QUEUE = 'queue'
+
+    def __init__(self):
+        self.__entries = {}
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, kind, name, arguments):
+        """
+        :param kind: :attr:`EXCHANGE` or :attr:`QUEUE`
+        :type name: str
+        :param arguments: all the arguments of the declaration
+        :type arguments: dict
+        :return: the cached exchange or queue, None if it was not declared with the same arguments
+        """
+        entry = self.__entries.get((kind, name))
+        if entry is None or entry[0] != tools.freeze(arguments):
+            return None
+
+        return entry[1]
+
+    def add(self, kind, name, arguments, declared):
+        """
+        :param declared: the :class:`topika.Exchange` or :class:`topika.Queue`
+        """
+        self.__entries[(kind, name)] = tools.freeze(arguments), declared
+
+    def discard(self, kind, name):
+        self.__entries.pop((kind, name), None)
+
+    def clear(self):
+        self.__entries.clear()
 
 
 class BaseChannel(object):
@@ -164,14 +372,21 @@ class BaseChannel(object):
 
     @staticmethod
     def _ensure_channel_is_open(func):
+        """ Fail calls to the operation once the channel is closed.
+
+        The operation already returns a future so it is passed through as is, without wrapping it in another
+        coroutine.  Exceptions raised by the operation end up in the returned future.
+        """
 
         @contextlib.wraps(func)
-        @tools.coroutine
         def wrap(self, *args, **kwargs):
             if self.is_closed:
-                raise RuntimeError("The channel is closed")
+                return tools.failed_future(self.loop, RuntimeError("The channel is closed"))
 
-            raise gen.Return((yield func(self, *args, **kwargs)))
+            try:
+                return func(self, *args, **kwargs)
+            except Exception as exc:  # pylint: disable=broad-except
+                return tools.failed_future(self.loop, exc)
 
         return wrap
 
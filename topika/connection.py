@@ -10,6 +10,7 @@ import tornado.ioloop
 from tornado import gen, ioloop, locks
 from tornado.concurrent import Future
 from tornado.gen import coroutine, Return
+from six.moves import range
 from six.moves.urllib.parse import urlparse
 
 from .channel import Channel
@@ -26,8 +27,10 @@ LOGGER = logging.getLogger(__name__)
 class Connection(object):
     """ Connection abstraction """
 
-    __slots__ = ('loop', '__closing', '_connection', 'future_store', '__sender_lock', '_io_loop',
-                 '__connection_parameters', '__credentials', '__write_lock', '_channels', '__close_started')
+    __slots__ = ('loop', '__closing', '_connection', '_opening', 'future_store', '__sender_lock', '_io_loop',
+                 '__connection_parameters', '__credentials', '__write_lock', '_channels', '__close_started',
+                 'blocked_policy', '_unblocked', '_blocked_since', '_blocked_count', '_blocked_time',
+                 '_on_blocked_callbacks', '_on_unblocked_callbacks')
 
     CHANNEL_CLASS = Channel
 
@@ -38,10 +41,19 @@ class Connection(object):
                  password='guest',
                  virtual_host='/',
                  loop=None,
+                 blocked_policy=common.BlockedPolicy.IGNORE,
+                 timer_tick=common.TimerWheel.DEFAULT_TICK,
                  **kwargs):
+        """
+        :param blocked_policy: what publishing does while the broker has blocked the connection
+        :type blocked_policy: :class:`topika.common.BlockedPolicy`
+        :param timer_tick: the resolution in seconds of the timeouts of operations on the connection
+        :type timer_tick: float
+        :param kwargs: addition parameters which will be passed to the pika connection parameters
+        """
 
         self.loop = loop if loop else ioloop.IOLoop.current()
-        self.future_store = common.FutureStore(loop=self.loop)
+        self.future_store = common.FutureStore(loop=self.loop, tick=timer_tick)
 
         self.__credentials = PlainCredentials(login, password) if login else ExternalCredentials()
 
@@ -50,17 +62,29 @@ class Connection(object):
 
         self._channels = dict()
         self._connection = None
+        # The pika connection of the attempt in flight
+        self._opening = None
         self.__closing = None
         self.__close_started = False
         self.__write_lock = locks.Lock()
 
+        self.blocked_policy = common.BlockedPolicy(blocked_policy)
+        self._unblocked = locks.Event()
+        self._unblocked.set()
+        self._blocked_since = None
+        self._blocked_count = 0
+        self._blocked_time = 0.
+        self._on_blocked_callbacks = []
+        self._on_unblocked_callbacks = []
+
     def __str__(self):
+        parameters = self.connection_parameters
         return 'amqp://{credentials}{host}:{port}/{vhost}'.format(
-            credentials="{0.username}:********@".format(self.__credentials) if isinstance(
-                self.__credentials, PlainCredentials) else '',
-            host=self.__connection_parameters.host,
-            port=self.__connection_parameters.port,
-            vhost=self.__connection_parameters.virtual_host,
+            credentials="{0.username}:********@".format(parameters.credentials) if isinstance(
+                parameters.credentials, PlainCredentials) else '',
+            host=parameters.host,
+            port=parameters.port,
+            vhost=parameters.virtual_host,
         )
 
     def __repr__(self):
@@ -106,6 +130,14 @@ class Connection(object):
 
         return False
 
+    @property
+    def connection_parameters(self):
+        """ The parameters used to connect to the broker
+
+        :rtype: :class:`pika.ConnectionParameters`
+        """
+        return self.__connection_parameters
+
     @property
     def _closing(self):
         self._ensure_cosing_future()
@@ -170,7 +202,7 @@ class Connection(object):
             connect_future = tools.create_future(loop=self.loop)
 
             connection = pika.TornadoConnection(
-                parameters=self.__connection_parameters,
+                parameters=self.connection_parameters,
                 custom_ioloop=self.loop,
                 on_open_callback=connect_future.set_result,
                 on_close_callback=partial(self._on_connection_lost, connect_future),
@@ -179,16 +211,24 @@ class Connection(object):
 
             connection.channel_cleanup_callback = self._channel_cleanup
             connection.channel_cancel_callback = self._on_channel_cancel
+            connection.add_on_connection_blocked_callback(self._on_connection_blocked)
+            connection.add_on_connection_unblocked_callback(self._on_connection_unblocked)
 
-            result = yield connect_future
+            self._opening = connection
+            try:
+                result = yield connect_future
+            finally:
+                self._opening = None
 
-            LOGGER.debug("Connection ready: %r", self)
+            # A failed attempt of a robust connection resolves the future with None
+            if result is not None:
+                LOGGER.debug("Connection ready: %r", self)
+                self._connection = connection
 
-            self._connection = connection
             raise gen.Return(result)
 
     @gen.coroutine
-    def channel(self, channel_number=None, publisher_confirms=True, on_return_raises=False):
+    def channel(self, channel_number=None, publisher_confirms=True, on_return_raises=False, cache_declarations=False):
         """ Coroutine which returns new instance of :class:`Channel`.
 
         Example:
@@ -224,6 +264,12 @@ class Connection(object):
         :param on_return_raises:
             raise an :class:`topika.exceptions.UnroutableError`
             when mandatory message will be returned
+        :param cache_declarations:
+            declaring an exchange or queue again with the same arguments returns the existing object
+            without a round trip to the broker.  Call :meth:`topika.Queue.declare` to refresh the
+            `declaration_result` of a cached queue.  The cache is invalidated when the exchange or queue is
+            deleted, when the channel closes and on reconnect
+        :type cache_declarations: bool
         :rtype: :class:`Generator[Any, None, Channel]`
         """
         with (yield self.__write_lock.acquire()):
@@ -235,18 +281,48 @@ class Connection(object):
                 self.future_store,
                 channel_number=channel_number,
                 publisher_confirms=publisher_confirms,
-                on_return_raises=on_return_raises)
+                on_return_raises=on_return_raises,
+                cache_declarations=cache_declarations)
+
+            # Only the channel number allocation is serialized, the open handshakes of concurrently
+            # created channels are pipelined
+            channel._open()  # pylint: disable=protected-access
+            self._channels[channel.number] = channel
+
+        try:
             yield channel.initialize()
+        except Exception:
+            self._channels.pop(channel.number, None)
+            raise
 
-            LOGGER.debug("Channel created: %r", channel)
+        LOGGER.debug("Channel created: %r", channel)
 
-            self._channels[channel.number] = channel
+        raise gen.Return(channel)
+
+    @gen.coroutine
+    def channels(self, count, **kwargs):
+        """ Coroutine which opens `count` channels at once, their open handshakes are pipelined.
+
+        Example:
+
+        .. code-block:: python
 
-            raise gen.Return(channel)
+            channels = yield connection.channels(200, publisher_confirms=False)
+
+        :param count: the number of channels to open
+        :type count: int
+        :param kwargs: passed to :meth:`channel` for each channel
+        :rtype: :class:`Generator[Any, None, List[Channel]]`
+        """
+        if kwargs.get('channel_number') is not None:
+            raise ValueError("Can't open several channels with the same channel number")
+
+        channels = yield [self.channel(**kwargs) for _ in range(count)]
+        raise gen.Return(channels)
 
     def close(self):
         """
-        Close AMQP connection
+        Close AMQP connection, a connection attempt in flight is aborted
 
         This method is idempotent and may be called multiple times without conflict
         """
@@ -255,11 +331,16 @@ class Connection(object):
         if self.__close_started:
             return self.__closing
 
+        opening = self._opening
+        if opening is not None and not (opening.is_closing or opening.is_closed):
+            # Fails the attempt with a ConnectionOpenAborted
+            opening.close()
+
         @gen.coroutine
         def inner():
             if self._connection:
                 self._connection.close()
-            yield self.closing
+                yield self.closing
 
         self.__close_started = True
         return tools.create_task(inner())
@@ -275,6 +356,94 @@ class Connection(object):
         """
         return self._connection.is_open
 
+    @property
+    def is_blocked(self):
+        """
+        Is the connection blocked by the broker because of a memory or disk alarm
+
+        :rtype: bool
+        """
+        return self._blocked_since is not None
+
+    @property
+    def blocked_count(self):
+        """
+        The number of times the broker has blocked this connection
+
+        :rtype: int
+        """
+        return self._blocked_count
+
+    @property
+    def blocked_time(self):
+        """
+        The total time in seconds this connection has been blocked for, including the current block
+
+        :rtype: float
+        """
+        if self._blocked_since is None:
+            return self._blocked_time
+
+        return self._blocked_time + self.loop.time() - self._blocked_since
+
+    def add_blocked_callback(self, callback):
+        """ Add callback which will be called when the broker blocks the connection.
+
+        The connection and the reason given by the broker will be passed as arguments.
+
+        :type callback: Callable[[Connection, str], None]
+        :return: None
+        """
+        self._on_blocked_callbacks.append(callback)
+
+    def add_unblocked_callback(self, callback):
+        """ Add callback which will be called when the broker unblocks the connection.
+
+        The connection will be passed as the argument.
+
+        :type callback: Callable[[Connection], None]
+        :return: None
+        """
+        self._on_unblocked_callbacks.append(callback)
+
+    def wait_unblocked(self):
+        """ Return a future which will be finished once the connection is not blocked
+
+        :rtype: :class:`tornado.concurrent.Future`
+        """
+        return self._unblocked.wait()
+
+    def _on_connection_blocked(self, _connection, method_frame):
+        """
+        :type method_frame: :class:`pika.frame.Method`
+        """
+        if self.is_blocked:
+            return
+
+        reason = method_frame.method.reason
+        LOGGER.warning("Connection %r blocked by the broker: %s", self, reason)
+
+        self._blocked_since = self.loop.time()
+        self._blocked_count += 1
+        self._unblocked.clear()
+
+        for callback in self._on_blocked_callbacks:
+            callback(self, reason)
+
+    def _on_connection_unblocked(self, _connection=None, _method_frame=None):
+        if not self.is_blocked:
+            return
+
+        duration = self.loop.time() - self._blocked_since
+        self._blocked_time += duration
+        self._blocked_since = None
+        self._unblocked.set()
+
+        LOGGER.info("Connection %r unblocked after %.3fs", self, duration)
+
+        for callback in self._on_unblocked_callbacks:
+            callback(self)
+
     def _channel_cleanup(self, channel):
         """
         :type channel: :class:`pika.channel.Channel`
@@ -296,6 +465,9 @@ class Connection(object):
         :type connection: :class:`pika.TornadoConnection`
         :type reason: Exception
         """
+        # A new connection starts unblocked
+        self._on_connection_unblocked()
+
         if self.__closing and self.__closing.done():
             return
 
@@ -380,6 +552,7 @@ def connect(url=None,
             loop=None,
             ssl_options=None,
             connection_class=Connection,
+            timeout=None,
             **kwargs):
     """ Make connection to the broker.
 
@@ -442,6 +615,9 @@ def connect(url=None,
     :param loop: Event loop (:func:`tornado.ioloop.IOLoop.current()` when :class:`None`)
     :type loop: :class:`tornado.ioloop.IOLoop`
     :param connection_class: Factory of a new connection
+    :param timeout: the time in seconds to wait for the connection, it is closed and a
+        :class:`tornado.gen.TimeoutError` raised when it is not open by then.  Wait forever when :class:`None`.
+    :type timeout: float
     :param kwargs: addition parameters which will be passed to \
                    the pika connection.
     :rtype: :class:`topika.connection.Connection`
@@ -482,5 +658,18 @@ def connect(url=None,
         ssl_options=ssl_options,
         **kwargs)
 
-    yield connection.connect()
+    if timeout is None:
+        yield connection.connect()
+    else:
+        try:
+            yield gen.with_timeout(
+                connection.loop.time() + timeout,
+                connection.connect(),
+                quiet_exceptions=pika.exceptions.ConnectionOpenAborted)
+        except gen.TimeoutError:
+            LOGGER.warning("Could not connect to %s within %.3fs", connection, timeout)
+            # Abort the attempt in flight, a robust connection also stops retrying
+            connection.close()
+            raise
+
     raise gen.Return(connection)
@@ -24,6 +24,14 @@ class TransactionClosed(AMQPException):
     pass
 
 
+class RpcError(AMQPException):
+    pass
+
+
+class ConnectionBlocked(AMQPException):
+    pass
+
+
 __all__ = (
     'AMQPChannelError',
     'AMQPConnectionError',
@@ -33,6 +41,7 @@ __all__ = (
     'BodyTooLongError',
     'ChannelClosed',
     'ChannelError',
+    'ConnectionBlocked',
     'ConnectionClosed',
     'ConsumerCancelled',
     'DuplicateConsumerTag',
@@ -51,6 +60,7 @@ __all__ = (
     'ProtocolSyntaxError',
     'ProtocolVersionMismatch',
     'QueueEmpty',
+    'RpcError',
     'ShortStringTooLong',
     'TransactionClosed',
     'UnexpectedFrameError',
@@ -5,7 +5,9 @@ from logging import getLogger
 from typing import Optional, Union
 
 from pika.channel import Channel
-from .common import BaseChannel, FutureStore
+from .common import BaseChannel, DeclarationCache, FutureStore
+from . import latency
+from . import tracecontext
 from .message import Message
 from .tools import create_future
 
@@ -28,7 +30,7 @@ class Exchange(BaseChannel):
     """ Exchange abstraction """
 
     __slots__ = ('name', '__type', '__publish_method', 'arguments', 'durable', 'auto_delete', 'internal', 'passive',
-                 '_channel')
+                 '_channel', '_declarations')
 
     def __init__(self,
                  loop,
@@ -68,18 +70,29 @@ class Exchange(BaseChannel):
         self.internal = internal
         self.passive = passive
         self.arguments = arguments
+        self._declarations = None  # type: DeclarationCache
 
     def __str__(self):
         return self.name
 
+    @property
+    def type(self):
+        """
+        :rtype: :class:`ExchangeType`
+        """
+        return ExchangeType(self.__type)
+
     def __repr__(self):
         return "<Exchange(%s): auto_delete=%s, durable=%s, arguments=%r)>" % (self, self.auto_delete, self.durable,
                                                                               self.arguments)
 
     @BaseChannel._ensure_channel_is_open
-    def declare(self, timeout=None):
+    def declare(self, timeout=None, nowait=False):
         """
         :type timeout: int
+        :param nowait: don't wait for the reply of the broker.  Errors surface on the next synchronous
+            operation, see :meth:`topika.Channel.synchronize`
+        :type nowait: bool
         """
         future = self._create_future(timeout=timeout)
 
@@ -91,7 +104,10 @@ class Exchange(BaseChannel):
             auto_delete=self.auto_delete,
             internal=self.internal,
             arguments=self.arguments,
-            callback=future.set_result)
+            callback=None if nowait else future.set_result)
+
+        if nowait:
+            future.set_result(None)
 
         return future
 
@@ -108,7 +124,7 @@ class Exchange(BaseChannel):
             raise ValueError('exchange argument must be an exchange instance or str')
 
     @BaseChannel._ensure_channel_is_open
-    def bind(self, exchange, routing_key='', arguments=None, timeout=None):
+    def bind(self, exchange, routing_key='', arguments=None, timeout=None, nowait=False):
         """ A binding can also be a relationship between two exchanges. This can be
         simply read as: this exchange is interested in messages from another exchange.
 
@@ -138,6 +154,8 @@ class Exchange(BaseChannel):
         :param arguments: additional arguments (will be passed to `pika`)
         :param timeout: execution timeout
         :type timeout: int
+        :param nowait: don't wait for the reply of the broker
+        :type nowait: bool
         :rtype: :class:`tornado.concurrent.Future`
         """
 
@@ -151,13 +169,16 @@ class Exchange(BaseChannel):
             source=self._get_exchange_name(exchange),
             routing_key=routing_key,
             arguments=arguments,
-            callback=f.set_result,
+            callback=None if nowait else f.set_result,
         )
 
+        if nowait:
+            f.set_result(None)
+
         return f
 
     @BaseChannel._ensure_channel_is_open
-    def unbind(self, exchange, routing_key='', arguments=None, timeout=None):
+    def unbind(self, exchange, routing_key='', arguments=None, timeout=None, nowait=False):
         """ Remove exchange-to-exchange binding for this :class:`Exchange` instance
 
         :param exchange: :class:`topika.exchange.Exchange` instance
@@ -168,6 +189,8 @@ class Exchange(BaseChannel):
         :type arguments: dict
         :param timeout: execution timeout
         :type timeout: int
+        :param nowait: don't wait for the reply of the broker
+        :type nowait: bool
         :rtype: :class:`tornado.concurrent.Future`
         """
 
@@ -181,13 +204,15 @@ class Exchange(BaseChannel):
             source=self._get_exchange_name(exchange),
             routing_key=routing_key,
             arguments=arguments,
-            callback=f.set_result,
+            callback=None if nowait else f.set_result,
         )
 
+        if nowait:
+            f.set_result(None)
+
         return f
 
     @BaseChannel._ensure_channel_is_open
-    @gen.coroutine
     def publish(self, message, routing_key, mandatory=True, immediate=False):
         """ Publish the message to the queue. `topika` use `publisher confirms`_
         extension for message delivery.
@@ -195,6 +220,7 @@ class Exchange(BaseChannel):
         .. _publisher confirms: https://www.rabbitmq.com/confirms.html
 
         :type message: :class:`Message`
+        :rtype: :class:`tornado.concurrent.Future`
         """
 
         log.debug("Publishing message via exchange %s: %r", self, message)
@@ -202,25 +228,44 @@ class Exchange(BaseChannel):
             # Caught on the client side to prevent channel closure
             raise ValueError("cannot publish to internal exchange: '%s'!" % self.name)
 
-        raise gen.Return((yield self.__publish_method(
+        properties = message.properties
+        if latency.RECORDER is not None:
+            latency.stamp(properties)
+
+        finish_span = None
+        if tracecontext.PROPAGATOR is not None:
+            finish_span = tracecontext.PROPAGATOR.inject(properties, self.name, routing_key)
+
+        publish_future = self.__publish_method(
             self.name,
             routing_key,
             message.body,
-            properties=message.properties,
+            properties=properties,
             mandatory=mandatory,
-            immediate=immediate)))
+            immediate=immediate)
+
+        if finish_span is not None:
+            publish_future.add_done_callback(finish_span)
+
+        return publish_future
 
     @BaseChannel._ensure_channel_is_open
-    def delete(self, if_unused=False):
+    def delete(self, if_unused=False, nowait=False):
         """ Delete the queue
 
         :param if_unused: perform deletion when queue has no bindings.
+        :param nowait: don't wait for the reply of the broker
         :rtype: :class:`tornado.concurrent.Future`
         """
         log.info("Deleting %r", self)
         self._futures.reject_all(RuntimeError("Exchange was deleted"))
+        if self._declarations is not None:
+            self._declarations.discard(DeclarationCache.EXCHANGE, self.name)
         future = create_future(loop=self.loop)
-        self._channel.exchange_delete(exchange=self.name, if_unused=if_unused, callback=future.set_result)
+        self._channel.exchange_delete(
+            exchange=self.name, if_unused=if_unused, callback=None if nowait else future.set_result)
+        if nowait:
+            future.set_result(None)
         return future
 
 
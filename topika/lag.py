@@ -0,0 +1,237 @@
+""" Monitor the scheduling lag of the event loop and find the consumer callbacks that stall it.
+
+A synchronous consumer callback that runs for long keeps the loop from sending heartbeats, which gets the
+connection closed by the broker.  The :class:`LagMonitor` measures how late a periodic callback runs and, while the
+loop is stalled, a watchdog thread samples the stack of the loop thread together with the consumer callback and
+message being processed.  A coroutine callback is also attributed after it first yields: while it is suspended,
+its code is looked for in the sampled stack and the message is taken from its frame.
+
+.. code-block:: python
+
+    import topika.lag
+    import topika.metrics
+
+    registry = topika.metrics.install()
+    monitor = topika.lag.LagMonitor(threshold=0.2, registry=registry)
+    monitor.start()
+    ...
+    for stall in monitor.stalls:
+        print(stall.lag, stall.callback, ''.join(stall.stack))
+
+"""
+from __future__ import absolute_import
+import collections
+from logging import getLogger
+import sys
+import threading
+import time
+import traceback
+
+from tornado import ioloop
+
+from . import metrics
+from . import tools
+
+LOGGER = getLogger(__name__)
+
+# The running monitor, consumer callbacks are only attributed while there is one
+MONITOR = None
+
+Stall = collections.namedtuple('Stall', 'timestamp lag callback message stack')
+
+
+class LagMonitor(object):
+    """ Measures the lag of the event loop and records what was running when it exceeded the threshold """
+
+    DEFAULT_INTERVAL = 0.05
+    DEFAULT_THRESHOLD = 0.1
+    DEFAULT_MAX_STALLS = 100
+
+    def __init__(self,
+                 loop=None,
+                 interval=DEFAULT_INTERVAL,
+                 threshold=DEFAULT_THRESHOLD,
+                 registry=None,
+                 buckets=metrics.DEFAULT_BUCKETS,
+                 max_stalls=DEFAULT_MAX_STALLS):
+        """
+        :param loop: Event loop (:func:`tornado.ioloop.IOLoop.current()` when :class:`None`)
+        :type loop: :class:`tornado.ioloop.IOLoop`
+        :param interval: the time in seconds between two measurements
+        :type interval: float
+        :param threshold: the lag in seconds from which the loop is considered stalled
+        :type threshold: float
+        :param registry: the registry the lag histogram is registered in, if any
+        :type registry: :class:`topika.metrics.Registry`
+        :param buckets: the buckets of the lag histogram
+        :type buckets: tuple
+        :param max_stalls: the number of most recent stalls that are kept
+        :type max_stalls: int
+        """
+        self.loop = loop if loop else ioloop.IOLoop.current()
+        self.interval = interval
+        self.threshold = threshold
+        self.histogram = metrics.Histogram('topika_ioloop_lag_seconds', 'Scheduling lag of the event loop',
+                                           buckets=buckets)
+        if registry is not None:
+            registry.register(self.histogram)
+
+        self._stalls = collections.deque(maxlen=max_stalls)
+        self._running = None
+        # The code of the coroutine callbacks in flight: code -> [callback, index of the message argument, count]
+        self._suspended = {}
+        self._sample = None
+        self._expected = None
+        self._last_beat = None
+        self._timeout = None
+        self._thread_id = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    @property
+    def is_running(self):
+        return MONITOR is self
+
+    @property
+    def stalls(self):
+        """ The most recent stalls, oldest first
+
+        :rtype: list
+        """
+        return list(self._stalls)
+
+    def start(self):
+        """ Start monitoring, only one monitor can run at a time """
+        global MONITOR  # pylint: disable=global-statement
+
+        if MONITOR is not None:
+            raise RuntimeError("A lag monitor is already running")
+        MONITOR = self
+
+        self._stopped.clear()
+        self._last_beat = time.time()
+        self._expected = self.loop.time() + self.interval
+        self._timeout = self.loop.call_at(self._expected, self._beat)
+
+        self._watchdog = threading.Thread(target=self._watch, name='topika-lag-monitor')
+        self._watchdog.daemon = True
+        self._watchdog.start()
+
+    def stop(self):
+        """ Stop monitoring """
+        global MONITOR  # pylint: disable=global-statement
+
+        if MONITOR is not self:
+            return
+        MONITOR = None
+
+        self._stopped.set()
+        if self._timeout is not None:
+            self.loop.remove_timeout(self._timeout)
+            self._timeout = None
+
+    def run_callback(self, callback, message):
+        """ Call a consumer callback, recording it as running so that a stall can be attributed to it.  The
+        coroutine of a coroutine callback is recorded as in flight until it finishes.
+
+        :param callback: the consumer callback
+        :type message: :class:`topika.IncomingMessage`
+        :return: whatever the callback returns, the future of the coroutine for a coroutine callback
+        """
+        self._running = (callback, message)
+        try:
+            result = callback(message)
+        finally:
+            self._running = None
+
+        if not tools.iscoroutinepartial(callback):
+            return result
+
+        future = tools.create_task(result)
+        if not future.done():
+            self._add_suspended(callback, future)
+        return future
+
+    def _add_suspended(self, callback, future):
+        function = callback
+        while getattr(function, 'func', None) is not None:
+            function = function.func
+        # The message follows self for a method
+        index = 1 if getattr(function, '__self__', None) is not None else 0
+        while hasattr(function, '__wrapped__'):
+            function = function.__wrapped__
+
+        code = getattr(function, '__code__', None)
+        if code is None:
+            return
+
+        entry = self._suspended.get(code)
+        if entry is None:
+            entry = self._suspended[code] = [callback, index, 0]
+        entry[2] += 1
+
+        def on_done(_future):
+            entry[2] -= 1
+            if not entry[2] and self._suspended.get(code) is entry:
+                del self._suspended[code]
+
+        future.add_done_callback(on_done)
+
+    def _find_suspended(self, frame):
+        """ The coroutine callback in flight and its message whose frame is on the stack, runs in the watchdog
+
+        :rtype: tuple
+        """
+        while frame is not None:
+            entry = self._suspended.get(frame.f_code)
+            if entry is not None:
+                callback, index, _ = entry
+                names = frame.f_code.co_varnames
+                message = frame.f_locals.get(names[index]) if index < frame.f_code.co_argcount else None
+                return callback, message
+            frame = frame.f_back
+
+        return None, None
+
+    def _beat(self):
+        now = self.loop.time()
+        lag = max(now - self._expected, 0.)
+        self.histogram.observe((), lag)
+
+        if lag >= self.threshold:
+            sample, self._sample = self._sample, None
+            callback, message, stack = sample if sample is not None else (None, None, None)
+            stall = Stall(timestamp=time.time(), lag=lag, callback=callback, message=message, stack=stack)
+            self._stalls.append(stall)
+            LOGGER.warning("Event loop stalled for %.3fs running %r on %r", lag, callback, message)
+        else:
+            self._sample = None
+
+        self._thread_id = threading.current_thread().ident
+        self._last_beat = time.time()
+        if self.is_running:
+            self._expected = now + self.interval
+            self._timeout = self.loop.call_at(self._expected, self._beat)
+
+    def _watch(self):
+        """ Sample the loop thread once per stall, runs in the watchdog thread """
+        while not self._stopped.wait(self.interval):
+            if self._sample is not None or self._thread_id is None:
+                continue
+
+            if time.time() - self._last_beat < self.interval + self.threshold:
+                continue
+
+            running = self._running
+            frame = sys._current_frames().get(self._thread_id)  # pylint: disable=protected-access
+            stack = traceback.format_stack(frame) if frame is not None else None
+            if running is not None:
+                callback, message = running
+            elif self._suspended:
+                callback, message = self._find_suspended(frame)
+            else:
+                callback, message = None, None
+            self._sample = (callback, message, stack)
+
+
+__all__ = ('LagMonitor', 'Stall')
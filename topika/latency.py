@@ -0,0 +1,139 @@
+""" End to end latency of messages through publish time stamps.
+
+Once enabled, every message published by this process carries its publish time in the :data:`HEADER` header, with
+microsecond resolution, and every message delivered to this process with such a header gets its
+:attr:`queue_latency <topika.IncomingMessage.queue_latency>`: the time from publishing to delivery, i.e. mostly
+the time spent in the broker queue.  The latencies are recorded in a histogram per queue.  The time spent in the
+handler is the delivery to settlement latency of :mod:`topika.metrics`.
+
+.. code-block:: python
+
+    import topika.latency
+    import topika.metrics
+
+    registry = topika.metrics.install()
+    topika.latency.enable(registry)
+
+The publishers and consumers need clocks that are in sync to within the latencies of interest.
+"""
+from __future__ import absolute_import
+from logging import getLogger
+import time
+
+from . import metrics
+
+LOGGER = getLogger(__name__)
+
+# The publish time in microseconds since the epoch
+HEADER = 'x-published-at'
+
+_monotonic = getattr(time, 'monotonic', time.time)  # pylint: disable=invalid-name
+# Anchor the monotonic clock to the wall clock once so the time stamps can't go backwards when the clock is stepped
+_OFFSET = time.time() - _monotonic()
+
+# The enabled recorder, None when publish times are neither stamped nor measured
+RECORDER = None
+
+
+def now():
+    """ The wall clock time in seconds since the epoch, never going backwards within the process
+
+    :rtype: float
+    """
+    return _monotonic() + _OFFSET
+
+
+def stamp(properties):
+    """ Stamp the current time into the headers of the properties, the headers are copied
+
+    :type properties: :class:`pika.BasicProperties`
+    """
+    headers = dict(properties.headers) if properties.headers else {}
+    headers[HEADER] = int(now() * 1e6)
+    properties.headers = headers
+
+
+def published_at(headers):
+    """
+    :param headers: the headers of a message
+    :type headers: dict
+    :return: the publish time stamped in the headers in seconds since the epoch, None if there is none
+    :rtype: float
+    """
+    if not headers:
+        return None
+
+    value = headers.get(HEADER)
+    if value is None:
+        return None
+
+    try:
+        return int(value) / 1e6
+    except (TypeError, ValueError):
+        LOGGER.debug("Invalid publish time header %r", value)
+        return None
+
+
+class LatencyRecorder(object):
+    """ Records the queue latencies of the delivered messages """
+
+    def __init__(self, registry=None, buckets=metrics.DEFAULT_BUCKETS):
+        """
+        :param registry: the registry the histogram is registered in, if any
+        :type registry: :class:`topika.metrics.Registry`
+        :param buckets: the buckets of the histogram
+        :type buckets: tuple
+        """
+        self.histogram = metrics.Histogram(
+            'topika_queue_latency_seconds', 'Time from publishing a message to its delivery', ('queue',), buckets)
+        if registry is not None:
+            self.register(registry)
+
+    def register(self, registry):
+        """ Expose the histogram through the registry too, does nothing if it is already registered there
+
+        :type registry: :class:`topika.metrics.Registry`
+        """
+        if registry.get(self.histogram.name) is not self.histogram:
+            registry.register(self.histogram)
+
+    def record(self, queue_name, message):
+        """
+        :type queue_name: str
+        :type message: :class:`topika.IncomingMessage`
+        """
+        if message.queue_latency is not None:
+            self.histogram.observe((queue_name,), message.queue_latency)
+
+
+def enable(registry=None, buckets=None):
+    """ Stamp the published messages and measure the queue latency of the delivered ones.  Enabling it again
+    returns the same recorder, registered with the registry too.
+
+    :param registry: the registry the histogram is registered in, if any
+    :type registry: :class:`topika.metrics.Registry`
+    :param buckets: the buckets of the histogram, :data:`topika.metrics.DEFAULT_BUCKETS` when None
+    :type buckets: tuple
+    :rtype: :class:`LatencyRecorder`
+    :raises ValueError: if it is already enabled with other buckets
+    """
+    global RECORDER  # pylint: disable=global-statement
+
+    if RECORDER is None:
+        RECORDER = LatencyRecorder(registry, metrics.DEFAULT_BUCKETS if buckets is None else buckets)
+        return RECORDER
+
+    if buckets is not None and tuple(sorted(buckets)) != RECORDER.histogram.buckets:
+        raise ValueError("The queue latency is already measured with the buckets {}".format(
+            RECORDER.histogram.buckets))
+    if registry is not None:
+        RECORDER.register(registry)
+    return RECORDER
+
+
+def disable():
+    global RECORDER  # pylint: disable=global-statement
+    RECORDER = None
+
+
+__all__ = ('enable', 'disable', 'now', 'stamp', 'published_at', 'LatencyRecorder', 'HEADER')
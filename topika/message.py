@@ -13,6 +13,9 @@ from pika import BasicProperties
 from pika.channel import Channel
 from contextlib import contextmanager
 from .exceptions import MessageProcessError
+from . import latency
+from . import tracecontext
+from . import tracing
 
 LOGGER = getLogger(__name__)
 NoneType = type(None)
@@ -268,7 +271,7 @@ class IncomingMessage(Message):
 
     """
     __slots__ = ('_loop', '__channel', 'cluster_id', 'consumer_tag', 'delivery_tag', 'exchange', 'routing_key',
-                 'synchronous', 'redelivered', '__no_ack', '__processed')
+                 'synchronous', 'redelivered', 'queue_latency', '_delivered_at', '__no_ack', '__processed')
 
     def __init__(self, channel, envelope, properties, body, no_ack=False):
         """ Create an instance of :class:`IncomingMessage`
@@ -283,6 +286,8 @@ class IncomingMessage(Message):
         self.__channel = channel
         self.__no_ack = no_ack
         self.__processed = False
+        # When the message was delivered to the consumer, only recorded while tracing
+        self._delivered_at = None
 
         expiration = None
         if properties.expiration:
@@ -312,6 +317,12 @@ class IncomingMessage(Message):
         self.routing_key = envelope.routing_key
         self.redelivered = getattr(envelope, 'redelivered', None)
         self.synchronous = envelope.synchronous
+        # The time from publishing to delivery, only measured while enabled in :mod:`topika.latency`
+        self.queue_latency = None
+        if latency.RECORDER is not None:
+            stamped = latency.published_at(self.headers)
+            if stamped is not None:
+                self.queue_latency = latency.now() - stamped
 
         if no_ack or not self.delivery_tag:
             self.lock()
@@ -377,6 +388,9 @@ class IncomingMessage(Message):
         self.__channel.basic_ack(delivery_tag=self.delivery_tag, multiple=multiple)
         self.__processed = True
 
+        if tracing.TRACER is not None:
+            self._trace_settlement(tracing.ACK)
+
         if not self.locked:
             self.lock()
 
@@ -397,6 +411,9 @@ class IncomingMessage(Message):
 
         self.__channel.basic_reject(delivery_tag=self.delivery_tag, requeue=requeue)
         self.__processed = True
+
+        if tracing.TRACER is not None:
+            self._trace_settlement(tracing.REJECT)
         if not self.locked:
             self.lock()
 
@@ -415,9 +432,32 @@ class IncomingMessage(Message):
 
         self.__processed = True
 
+        if tracing.TRACER is not None:
+            self._trace_settlement(tracing.NACK)
+
         if not self.locked:
             self.lock()
 
+    @property
+    def trace_context(self):
+        """ The trace context propagated with the message, see :mod:`topika.tracecontext`
+
+        :rtype: :class:`topika.tracecontext.TraceContext`
+        """
+        return tracecontext.extract(self.headers)
+
+    @property
+    def published_at(self):
+        """ The publish time stamped by a publisher with :mod:`topika.latency` enabled, in seconds since the epoch
+
+        :rtype: float
+        """
+        return latency.published_at(self.headers)
+
+    def _trace_settlement(self, action):
+        now = tracing.clock()
+        tracing.TRACER.on_ack(self, action, now, now - self._delivered_at if self._delivered_at else None)
+
     def info(self):
         """
         Method returns dict representation of the message
@@ -0,0 +1,411 @@
+""" Client side metrics in the Prometheus text format.
+
+:func:`install` installs a :class:`MetricsTracer` that records the operations of all the connections in a
+:class:`Registry`, see :mod:`topika.tracing`.  The registry renders the Prometheus text exposition format and
+:func:`serve` exposes it over HTTP on the event loop of the application:
+
+.. code-block:: python
+
+    import topika.metrics
+
+    registry = topika.metrics.install()
+    topika.metrics.serve(9100, registry=registry)
+
+The metrics are labeled by connection (the broker address without credentials), channel number, exchange and
+queue.
+"""
+from __future__ import absolute_import
+import bisect
+from logging import getLogger
+import math
+
+import six
+
+from . import tracing
+
+LOGGER = getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.)
+
+
+def _format_value(value):
+    if isinstance(value, six.integer_types):
+        return str(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values)) + '}'
+
+
+class Metric(object):
+    """ A metric with a value per combination of label values """
+
+    TYPE = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        :param name: the name of the metric
+        :type name: str
+        :param documentation: the help text
+        :type documentation: str
+        :param labelnames: the names of the labels
+        :type labelnames: tuple
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        """ Yield the samples of the metric as `(suffix, labelnames, labelvalues, value)` tuples """
+        raise NotImplementedError
+
+    def render(self):
+        """
+        :return: the metric in the Prometheus text format
+        :rtype: str
+        """
+        lines = ['# HELP {} {}'.format(self.name, self.documentation.replace('\\', r'\\').replace('\n', r'\n'))]
+        lines.append('# TYPE {} {}'.format(self.name, self.TYPE))
+        for suffix, names, values, value in self.samples():
+            lines.append('{}{}{} {}'.format(self.name, suffix, _format_labels(names, values), _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(Metric):
+    """ A value that only goes up """
+
+    TYPE = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super(Counter, self).__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, labelvalues=(), amount=1):
+        """
+        :param labelvalues: the values of the labels, in the order of the label names
+        :type labelvalues: tuple
+        :param amount: the amount to increase by
+        :type amount: float
+        """
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def get(self, labelvalues=()):
+        return self._values.get(labelvalues, 0)
+
+    def samples(self):
+        for labelvalues, value in sorted(self._values.items()):
+            yield '', self.labelnames, labelvalues, value
+
+
+class Histogram(Metric):
+    """ The distribution of observed values in cumulative buckets """
+
+    TYPE = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        :param buckets: the upper bounds of the buckets, the `+Inf` bucket is added
+        :type buckets: tuple
+        """
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, labelvalues, value):
+        """
+        :param labelvalues: the values of the labels, in the order of the label names
+        :type labelvalues: tuple
+        :param value: the observed value
+        :type value: float
+        """
+        try:
+            counts, total = self._values[labelvalues]
+        except KeyError:
+            counts, total = [0] * (len(self.buckets) + 1), 0.
+
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._values[labelvalues] = counts, total + value
+
+    def get_count(self, labelvalues=()):
+        counts, _ = self._values.get(labelvalues, ((), 0.))
+        return sum(counts)
+
+    def samples(self):
+        bounds = self.buckets + (float('inf'),)
+        names = self.labelnames + ('le',)
+        for labelvalues, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield '_bucket', names, labelvalues + (_format_value(bound),), cumulative
+            yield '_sum', self.labelnames, labelvalues, total
+            yield '_count', self.labelnames, labelvalues, cumulative
+
+
+class CallbackMetric(Metric):
+    """ A metric whose values are read when it is rendered """
+
+    def __init__(self, name, documentation, labelnames, collect, type='gauge'):  # pylint: disable=redefined-builtin
+        """
+        :param collect: returns a mapping of label values to the current value
+        :param type: the Prometheus type, 'gauge' or 'counter'
+        :type type: str
+        """
+        super(CallbackMetric, self).__init__(name, documentation, labelnames)
+        self.TYPE = type  # pylint: disable=invalid-name
+        self._collect = collect
+
+    def samples(self):
+        for labelvalues, value in sorted(self._collect().items()):
+            yield '', self.labelnames, labelvalues, value
+
+
+class Registry(object):
+    """ A collection of metrics rendered together """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        """
+        :type metric: :class:`Metric`
+        :return: the metric
+        """
+        if any(registered.name == metric.name for registered in self._metrics):
+            raise ValueError("A metric named '{}' is already registered".format(metric.name))
+
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """
+        :rtype: :class:`Counter`
+        """
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        :rtype: :class:`Histogram`
+        """
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name):
+        """
+        :return: the metric with the name, None if there is none
+        :rtype: :class:`Metric`
+        """
+        for metric in self._metrics:
+            if metric.name == name:
+                return metric
+        return None
+
+    def render(self):
+        """
+        :return: all the metrics in the Prometheus text format
+        :rtype: str
+        """
+        return ''.join(metric.render() for metric in self._metrics)
+
+
+def _connection_label(parameters):
+    """
+    :type parameters: :class:`pika.ConnectionParameters`
+    """
+    return '{}:{}{}'.format(parameters.host, parameters.port, parameters.virtual_host)
+
+
+def _channel_labels(pika_channel):
+    """
+    :type pika_channel: :class:`pika.channel.Channel`
+    :return: the connection and channel labels
+    """
+    if pika_channel is None:
+        return '', ''
+    return _connection_label(pika_channel.connection.params), str(pika_channel.channel_number)
+
+
+class MetricsTracer(tracing.Tracer):
+    """ Records the traced operations in a registry """
+
+    CHANNEL_LABELS = ('connection', 'channel')
+
+    def __init__(self, registry, buckets=DEFAULT_BUCKETS):
+        """
+        :type registry: :class:`Registry`
+        :param buckets: the buckets of the latency histograms
+        :type buckets: tuple
+        """
+        channel_labels = self.CHANNEL_LABELS
+        queue_labels = channel_labels + ('queue',)
+
+        self.registry = registry
+        self.published = registry.counter('topika_published_total', 'Messages published',
+                                          channel_labels + ('exchange',))
+        self.confirmed = registry.counter('topika_confirmed_total', 'Publishes acked by the broker', channel_labels)
+        self.nacked = registry.counter('topika_nacked_total', 'Publishes nacked by the broker', channel_labels)
+        self.confirm_latency = registry.histogram('topika_confirm_latency_seconds',
+                                                  'Time from publishing to the confirmation', channel_labels, buckets)
+        self.returned = registry.counter('topika_returned_total', 'Unroutable messages returned by the broker',
+                                         channel_labels + ('exchange',))
+        self.delivered = registry.counter('topika_delivered_total', 'Messages delivered to consumers', queue_labels)
+        self.acks = registry.counter('topika_acks_total', 'Delivered messages settled, by action',
+                                     queue_labels + ('action',))
+        self.handler_duration = registry.histogram(
+            'topika_handler_duration_seconds', 'Time from the delivery of a message to its settlement', queue_labels,
+            buckets)
+        self.reconnects = registry.counter('topika_reconnects_total', 'Recoveries of robust connections',
+                                           ('connection',))
+        self.downtime = registry.histogram('topika_reconnect_downtime_seconds',
+                                           'Time from losing a connection to having restored its channels',
+                                           ('connection',), buckets)
+        registry.register(
+            CallbackMetric(
+                'topika_blocked_seconds_total',
+                'Time the connection was blocked by the broker', ('connection',),
+                lambda: self._collect(lambda connection: connection.blocked_time, self._closed_blocked_time),
+                type='counter'))
+        registry.register(
+            CallbackMetric('topika_pending_futures', 'Operations waiting for the broker', ('connection',),
+                           lambda: self._collect(lambda connection: connection.future_store.count_pending())))
+
+        # Connections seen through their channels, connections have no weak references
+        self._connections = {}
+        # The blocked time of the connections that were closed, so that the counter never goes down
+        self._closed_blocked_time = {}
+        # Consumer tag to the labels of its queue, settlements only know the consumer tag
+        self._consumers = {}
+
+    def _track(self, channel):
+        """
+        :type channel: :class:`topika.Channel`
+        """
+        connection = channel._connection  # pylint: disable=protected-access
+        if connection is not None and id(connection) not in self._connections:
+            self._connections[id(connection)] = connection
+
+    def _prune(self):
+        """ Forget the connections that were closed, a robust connection is only closed while reconnecting """
+        for key, connection in list(self._connections.items()):
+            if connection.is_closed and not getattr(connection, 'is_reconnecting', False):
+                label = (_connection_label(connection.connection_parameters),)
+                self._closed_blocked_time[label] = self._closed_blocked_time.get(label, 0) + connection.blocked_time
+                del self._connections[key]
+
+    def _collect(self, read, closed=None):
+        """
+        :param read: reads the value of a connection
+        :param closed: the values of the connections that were closed, per label
+        :type closed: dict
+        :return: the values per connection label
+        :rtype: dict
+        """
+        self._prune()
+        values = dict(closed or {})
+        for connection in self._connections.values():
+            label = (_connection_label(connection.connection_parameters),)
+            values[label] = values.get(label, 0) + read(connection)
+        return values
+
+    def on_publish(self, channel, exchange, routing_key, delivery_tag, timestamp, duration):
+        self._track(channel)
+        self.published.inc(_channel_labels(channel._channel) + (exchange,))  # pylint: disable=protected-access
+
+    def on_confirm(self, channel, delivery_tag, acked, timestamp, latency):
+        labels = _channel_labels(channel._channel)  # pylint: disable=protected-access
+        (self.confirmed if acked else self.nacked).inc(labels)
+        if latency is not None:
+            self.confirm_latency.observe(labels, latency)
+
+    def on_return(self, channel, message, timestamp):
+        self.returned.inc(_channel_labels(channel._channel) + (message.exchange,))  # pylint: disable=protected-access
+
+    def on_deliver(self, queue, message, timestamp):
+        labels = _channel_labels(queue._channel) + (queue.name,)  # pylint: disable=protected-access
+        self._consumers[message.consumer_tag] = labels
+        self.delivered.inc(labels)
+
+    def on_cancel(self, queue, consumer_tag, timestamp):
+        self._consumers.pop(consumer_tag, None)
+
+    def on_ack(self, message, action, timestamp, latency):
+        labels = self._consumers.get(message.consumer_tag)
+        if labels is None:
+            # Got with basic.get, or delivered before the tracer was installed
+            return
+
+        self.acks.inc(labels + (action,))
+        if latency is not None:
+            self.handler_duration.observe(labels, latency)
+
+    def on_channel_open(self, channel, timestamp, duration):
+        self._track(channel)
+
+    def on_channel_close(self, channel, reason, timestamp, lifetime):
+        # The consumers of the channel are gone with it, those of a robust channel come back with their deliveries
+        labels = _channel_labels(channel._channel)  # pylint: disable=protected-access
+        for consumer_tag, consumer_labels in list(self._consumers.items()):
+            if consumer_labels[:2] == labels:
+                del self._consumers[consumer_tag]
+
+    def on_reconnect(self, connection, timestamp, downtime, restore_duration):
+        label = (_connection_label(connection.connection_parameters),)
+        self.reconnects.inc(label)
+        self.downtime.observe(label, downtime)
+
+
+def install(registry=None, buckets=DEFAULT_BUCKETS):
+    """ Start recording the metrics of all the connections
+
+    :param registry: the registry to record in, a new one when None
+    :type registry: :class:`Registry`
+    :param buckets: the buckets of the latency histograms
+    :type buckets: tuple
+    :return: the registry
+    :rtype: :class:`Registry`
+    """
+    registry = registry if registry is not None else Registry()
+    tracing.install(MetricsTracer(registry, buckets))
+    return registry
+
+
+def serve(port, address='', registry=None, path='/metrics'):
+    """ Serve the metrics over HTTP on the current event loop
+
+    :param port: the port to listen on
+    :type port: int
+    :param address: the address to listen on, all interfaces by default
+    :type address: str
+    :param registry: the registry to serve, installs a new one when None
+    :type registry: :class:`Registry`
+    :param path: the path of the metrics
+    :type path: str
+    :return: the server, stop it with :meth:`tornado.httpserver.HTTPServer.stop`
+    :rtype: :class:`tornado.httpserver.HTTPServer`
+    """
+    # Only needed to serve, the registry works without the HTTP stack
+    from tornado import web
+
+    class MetricsHandler(web.RequestHandler):  # pylint: disable=abstract-method
+
+        def get(self):  # pylint: disable=arguments-differ
+            self.set_header('Content-Type', CONTENT_TYPE)
+            self.write(registry.render())
+
+    registry = registry if registry is not None else install()
+    application = web.Application([(path, MetricsHandler)])
+    return application.listen(port, address)
+
+
+__all__ = ('Registry', 'Counter', 'Histogram', 'CallbackMetric', 'MetricsTracer', 'install', 'serve',
+           'CONTENT_TYPE')
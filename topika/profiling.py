@@ -0,0 +1,407 @@
+""" Profile the event loop thread of a running process for a while, on demand.
+
+:func:`enable` profiles the thread of the event loop for `duration` seconds and writes the profile to a file:
+
+* ``cprofile`` runs :mod:`cProfile` on the loop thread and writes a :mod:`pstats` file, the own time of every
+  function is attributed to a category.  Precise but slows the loop down noticeably.
+* ``sampling`` samples the stack of the loop thread from another thread every `interval` seconds and writes the
+  stacks in the collapsed format of `FlameGraph`_, each sample is attributed to the category of the innermost frame
+  that is not in the standard library.  Cheap enough for production traffic.
+
+The categories separate the topika internals, :data:`PUBLISH`, :data:`CONFIRM`, :data:`DELIVER`, :data:`FUTURES`
+and the rest of :data:`TOPIKA`, from the consumer :data:`HANDLER` code, the :data:`LIBRARY` code of pika and tornado
+and the time the loop is :data:`IDLE`.
+
+Hot spots often only show up under production traffic, so a profile can be triggered at runtime with a signal or a
+control message:
+
+.. code-block:: python
+
+    import topika.profiling
+
+    # kill -USR2 <pid> profiles the loop for 30 seconds
+    topika.profiling.install_signal_handler(duration=30, mode=topika.profiling.SAMPLING)
+
+    # or publish {"duration": 30, "mode": "cprofile"} to the control queue
+    yield control_queue.consume(topika.profiling.control_callback(), no_ack=True)
+
+.. _FlameGraph: https://github.com/brendangregg/FlameGraph
+"""
+from __future__ import absolute_import
+import collections
+import cProfile
+import inspect
+import json
+from logging import getLogger
+import numbers
+import os
+import pstats
+import signal
+import sys
+import sysconfig
+import tempfile
+import threading
+import time
+
+import concurrent.futures
+import pika
+import tornado
+from tornado import ioloop
+
+LOGGER = getLogger(__name__)
+
+CPROFILE = 'cprofile'
+SAMPLING = 'sampling'
+MODES = (CPROFILE, SAMPLING)
+
+PUBLISH = 'publish'
+CONFIRM = 'confirm'
+DELIVER = 'deliver'
+FUTURES = 'futures'
+TOPIKA = 'topika'
+HANDLER = 'handler'
+LIBRARY = 'library'
+IDLE = 'idle'
+OTHER = 'other'
+
+DEFAULT_DURATION = 30
+DEFAULT_INTERVAL = 0.005
+
+# The bounds the arguments of a control message are clamped to
+MIN_DURATION = 1
+MAX_DURATION = 300
+MIN_INTERVAL = 0.001
+MAX_INTERVAL = 1
+
+# The running profile, only one can run at a time
+PROFILE = None
+
+Report = collections.namedtuple('Report', 'mode path duration categories')
+
+_lock = threading.Lock()  # pylint: disable=invalid-name
+_classifier = None  # pylint: disable=invalid-name
+
+
+def _targets():
+    """ The code of the topika internals that gets a category of its own """
+    # pylint: disable=protected-access
+    from .channel import Channel
+    from .common import FutureStore, TimerWheel
+    from .exchange import Exchange
+    from .message import IncomingMessage
+    from .publisher import Publisher
+    from .queue import Queue
+
+    return (
+        (PUBLISH, (Exchange.publish, Channel._publish, Channel._publish_when_ready, Channel._basic_publish,
+                   Publisher)),
+        (CONFIRM, (Channel._on_delivery_confirmation, Channel._trace_confirmation)),
+        (DELIVER, (Queue.consume, Queue.get, IncomingMessage)),
+        (FUTURES, (FutureStore, TimerWheel)),
+    )
+
+
+def _path(module):
+    return os.path.normcase(os.path.abspath(module))
+
+
+class _Classifier(object):
+    """ Attributes a code location to a category, None for the standard library """
+
+    def __init__(self):
+        self._ranges = collections.defaultdict(list)
+        for category, targets in _targets():
+            for target in targets:
+                while hasattr(target, '__wrapped__'):
+                    target = target.__wrapped__
+                try:
+                    lines, start = inspect.getsourcelines(target)
+                    filename = inspect.getsourcefile(target)
+                except (IOError, TypeError):
+                    continue
+                self._ranges[_path(filename)].append((start, start + len(lines), category))
+
+        self._packages = (
+            (os.path.dirname(_path(__file__)), TOPIKA),
+            (os.path.dirname(_path(tornado.__file__)), LIBRARY),
+            (os.path.dirname(_path(pika.__file__)), LIBRARY),
+        )
+        paths = sysconfig.get_paths()
+        self._stdlib = tuple(set(_path(paths[key]) for key in ('stdlib', 'platstdlib') if key in paths))
+        self._site = tuple(set(_path(paths[key]) for key in ('purelib', 'platlib') if key in paths))
+        self._cache = {}
+
+    def classify(self, filename, lineno, name):
+        """
+        :param filename: the file of the code, '~' for builtins as in :mod:`pstats`
+        :type filename: str
+        :param lineno: the first line of the code
+        :type lineno: int
+        :param name: the name of the code
+        :type name: str
+        :rtype: str
+        """
+        key = (filename, lineno, name)
+        try:
+            return self._cache[key]
+        except KeyError:
+            category = self._cache[key] = self._classify(filename, lineno, name)
+            return category
+
+    def _classify(self, filename, lineno, name):
+        if filename == '~' or filename.startswith('<'):
+            return IDLE if 'poll' in name or 'select' in name else None
+
+        path = _path(filename)
+        for start, end, category in self._ranges.get(path, ()):
+            if start <= lineno < end:
+                return category
+
+        for package, category in self._packages:
+            if path.startswith(package + os.sep):
+                return category
+
+        if path.startswith(self._stdlib) and not path.startswith(self._site):
+            return None
+
+        return HANDLER
+
+
+def _get_classifier():
+    global _classifier  # pylint: disable=global-statement,invalid-name
+
+    if _classifier is None:
+        _classifier = _Classifier()
+    return _classifier
+
+
+def _is_idle(code):
+    """ Whether the innermost frame of the loop thread is waiting for events """
+    filename = os.path.basename(code.co_filename)
+    return (filename == 'selectors.py' and code.co_name == 'select') or (filename == 'ioloop.py' and
+                                                                         code.co_name == 'start')
+
+
+class Profile(object):
+    """ A profile of the event loop thread, see :func:`enable` """
+
+    def __init__(self, loop, duration, mode, path, interval):
+        if mode not in MODES:
+            raise ValueError("Unknown profiling mode '{}', must be one of {}".format(mode, MODES))
+        if not duration > 0:
+            raise ValueError("duration must be positive")
+        if not interval > 0:
+            raise ValueError("interval must be positive")
+
+        self.loop = loop
+        self.duration = duration
+        self.mode = mode
+        self.path = path
+        self.interval = interval
+        self.future = concurrent.futures.Future()
+
+        self._started_at = None
+        self._profiler = None
+        self._samples = None
+        self._sampler = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """ Start profiling, must be called on the thread of the loop """
+        self._started_at = time.time()
+
+        try:
+            if self.mode == CPROFILE:
+                self._profiler = cProfile.Profile()
+                self._profiler.enable()
+            else:
+                self._samples = collections.Counter()
+                self._sampler = threading.Thread(
+                    target=self._sample, args=(threading.current_thread().ident,), name='topika-profiler')
+                self._sampler.daemon = True
+                self._sampler.start()
+        except Exception as exception:  # pylint: disable=broad-except
+            # E.g. another profiler is already active on the thread
+            LOGGER.exception("Failed to start the %s profile", self.mode)
+            self._stopped.set()
+            self._release()
+            self.future.set_exception(exception)
+            return
+
+        self.loop.call_later(self.duration, self.stop)
+
+    def stop(self):
+        """ Stop profiling and write the profile, must be called on the thread of the loop """
+        try:
+            duration = time.time() - self._started_at
+            if self.mode == CPROFILE:
+                self._profiler.disable()
+                self._profiler.dump_stats(self.path)
+                categories = self._cprofile_categories()
+            else:
+                self._stopped.set()
+                self._sampler.join()
+                categories = self._write_samples(duration)
+        except Exception as exception:  # pylint: disable=broad-except
+            LOGGER.exception("Failed to write the profile to '%s'", self.path)
+            self.future.set_exception(exception)
+        else:
+            report = Report(self.mode, self.path, duration, categories)
+            LOGGER.info("Wrote the %s profile of %.1fs to '%s': %s", self.mode, duration, self.path,
+                        ', '.join('{} {:.3f}s'.format(*item) for item in sorted(categories.items())))
+            self.future.set_result(report)
+        finally:
+            self._release()
+
+    def _release(self):
+        """ Let the next profile run """
+        global PROFILE  # pylint: disable=global-statement
+
+        with _lock:
+            if PROFILE is self:
+                PROFILE = None
+
+    def _sample(self, thread_id):
+        """ Sample the stack of the loop thread until stopped, runs in the sampler thread """
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)  # pylint: disable=protected-access
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            if stack:
+                self._samples[tuple(stack)] += 1
+
+    def _write_samples(self, duration):
+        classifier = _get_classifier()
+        total = sum(self._samples.values())
+        categories = collections.Counter()
+
+        with open(self.path, 'w') as handle:
+            for stack, count in self._samples.items():
+                if _is_idle(stack[0]):
+                    category = IDLE
+                else:
+                    category = OTHER
+                    for code in stack:
+                        found = classifier.classify(code.co_filename, code.co_firstlineno, code.co_name)
+                        if found is not None:
+                            category = found
+                            break
+                categories[category] += duration * count / total
+
+                frames = ('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+                          for code in reversed(stack))
+                handle.write('{} {}\n'.format(';'.join(frames), count))
+
+        return dict(categories)
+
+    def _cprofile_categories(self):
+        classifier = _get_classifier()
+        categories = collections.Counter()
+        stats = pstats.Stats(self._profiler).stats  # pylint: disable=no-member
+        for (filename, lineno, name), (_, _, own_time, _, _) in stats.items():
+            categories[classifier.classify(filename, lineno, name) or OTHER] += own_time
+        return dict(categories)
+
+
+def enable(duration=DEFAULT_DURATION, mode=CPROFILE, path=None, loop=None, interval=DEFAULT_INTERVAL):
+    """ Profile the thread of the event loop for a while, can be called from any thread
+
+    :param duration: the time to profile for in seconds
+    :type duration: float
+    :param mode: :data:`CPROFILE` or :data:`SAMPLING`
+    :type mode: str
+    :param path: the file the profile is written to, a new file in the temporary directory when None
+    :type path: str
+    :param loop: Event loop (:func:`tornado.ioloop.IOLoop.current()` when :class:`None`)
+    :type loop: :class:`tornado.ioloop.IOLoop`
+    :param interval: the time between two samples of the sampling mode in seconds
+    :type interval: float
+    :return: resolves with the :class:`Report` once the profile is written
+    :rtype: :class:`concurrent.futures.Future`
+    """
+    global PROFILE  # pylint: disable=global-statement
+
+    loop = loop if loop else ioloop.IOLoop.current()
+    if path is None:
+        extension = 'pstats' if mode == CPROFILE else 'collapsed'
+        path = os.path.join(tempfile.gettempdir(), 'topika-{}-{}.{}'.format(os.getpid(), int(time.time()), extension))
+
+    profile = Profile(loop, duration, mode, path, interval)
+    with _lock:
+        if PROFILE is not None:
+            raise RuntimeError("A profile is already running")
+        PROFILE = profile
+
+    loop.add_callback(profile.start)
+    return profile.future
+
+
+def _trigger(loop, kwargs):
+    try:
+        enable(loop=loop, **kwargs)
+    except (RuntimeError, ValueError) as exception:
+        LOGGER.warning("Not profiling: %s", exception)
+
+
+def install_signal_handler(signum=getattr(signal, 'SIGUSR2', None), loop=None, **kwargs):
+    """ Profile the loop whenever the process receives the signal, must be called on the main thread
+
+    :param signum: the signal
+    :type signum: int
+    :param loop: Event loop (:func:`tornado.ioloop.IOLoop.current()` when :class:`None`)
+    :type loop: :class:`tornado.ioloop.IOLoop`
+    :param kwargs: passed on to :func:`enable`
+    :return: the previous handler of the signal
+    """
+    loop = loop if loop else ioloop.IOLoop.current()
+
+    def on_signal(_signum, _frame):
+        loop.add_callback_from_signal(_trigger, loop, kwargs)
+
+    return signal.signal(signum, on_signal)
+
+
+def _clamp(value, low, high):
+    """
+    :raises ValueError: if the value is not a finite number
+    :rtype: float
+    """
+    if isinstance(value, bool) or not isinstance(value, numbers.Real) or value != value:
+        raise ValueError("{!r} is not a number".format(value))
+    return min(max(float(value), low), high)
+
+
+def control_callback(loop=None, **kwargs):
+    """ A consumer callback that profiles the loop for every control message.  The body of a message is a JSON
+    object with the arguments of :func:`enable`, e.g. ``{"duration": 10, "mode": "sampling"}``, or empty.  The
+    duration is clamped to between :data:`MIN_DURATION` and :data:`MAX_DURATION` seconds and the interval to
+    between :data:`MIN_INTERVAL` and :data:`MAX_INTERVAL` seconds.
+
+    :param loop: Event loop (:func:`tornado.ioloop.IOLoop.current()` when :class:`None`)
+    :type loop: :class:`tornado.ioloop.IOLoop`
+    :param kwargs: the defaults of the arguments passed on to :func:`enable`
+    """
+    loop = loop if loop else ioloop.IOLoop.current()
+    allowed = ('duration', 'mode', 'interval')
+
+    def on_message(message):
+        with message.process(ignore_processed=True):
+            try:
+                options = json.loads(message.body.decode('utf-8')) if message.body else {}
+                options = dict(kwargs, **{key: options[key] for key in allowed if key in options})
+                if 'duration' in options:
+                    options['duration'] = _clamp(options['duration'], MIN_DURATION, MAX_DURATION)
+                if 'interval' in options:
+                    options['interval'] = _clamp(options['interval'], MIN_INTERVAL, MAX_INTERVAL)
+            except (AttributeError, TypeError, ValueError) as exception:
+                LOGGER.warning("Invalid profiling control message %r: %s", message.body, exception)
+                return
+            _trigger(loop, options)
+
+    return on_message
+
+
+__all__ = ('enable', 'install_signal_handler', 'control_callback', 'Profile', 'Report', 'CPROFILE', 'SAMPLING',
+           'PUBLISH', 'CONFIRM', 'DELIVER', 'FUTURES', 'TOPIKA', 'HANDLER', 'LIBRARY', 'IDLE', 'OTHER')
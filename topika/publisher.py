@@ -0,0 +1,136 @@
+from __future__ import absolute_import
+import collections
+import concurrent.futures
+import threading
+
+from tornado import concurrent as tornado_concurrent
+from tornado import gen
+
+_Request = collections.namedtuple('_Request', 'message routing_key mandatory immediate future')
+
+
+class Publisher(object):
+    """ Publish to an exchange from any thread.
+
+    :meth:`Exchange.publish <topika.Exchange.publish>` has to be called on the thread of the event loop.  The
+    publisher queues the messages of the other threads and hands them over in batches: the loop is woken once for
+    all the messages queued since its last batch, instead of once per message.  Every call returns a
+    :class:`concurrent.futures.Future` that resolves once the broker confirmed the message.
+
+    Example:
+
+    .. code-block:: python
+
+        from topika.publisher import Publisher
+
+        publisher = Publisher(exchange)
+
+        # From any thread
+        future = publisher.publish(topika.Message(b'hello'), routing_key='greetings')
+        future.result(timeout=5)
+
+    """
+
+    DEFAULT_MAX_BATCH = 1000
+
+    def __init__(self, exchange, max_batch=DEFAULT_MAX_BATCH):
+        """
+        :param exchange: the exchange to publish to
+        :type exchange: :class:`topika.Exchange`
+        :param max_batch: the maximum number of messages published per loop iteration, the rest waits for the
+            next one so that a large backlog doesn't stall the loop
+        :type max_batch: int
+        """
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+
+        self.loop = exchange.loop
+        self.max_batch = max_batch
+        self._exchange = exchange
+        self._lock = threading.Lock()
+        self._pending = collections.deque()
+        self._scheduled = False
+        self._closed = False
+        # Only touched on the loop thread
+        self._outstanding = set()
+
+    @property
+    def is_closed(self):
+        return self._closed
+
+    def publish(self, message, routing_key, mandatory=True, immediate=False):
+        """ Queue the message for publishing, can be called from any thread
+
+        :type message: :class:`topika.Message`
+        :param routing_key: the routing key of the message
+        :type routing_key: str
+        :return: a future resolved with the confirmation, it can be cancelled until the message is handed over
+        :rtype: :class:`concurrent.futures.Future`
+        """
+        future = concurrent.futures.Future()
+        request = _Request(message, routing_key, mandatory, immediate, future)
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The publisher is closed")
+
+            self._pending.append(request)
+            wakeup = not self._scheduled
+            self._scheduled = True
+
+        if wakeup:
+            self.loop.add_callback(self._flush)
+
+        return future
+
+    def close(self):
+        """ Stop accepting messages, those already queued are still published.  Can be called from any thread.
+
+        :return: a future resolved once all the queued messages are settled
+        :rtype: :class:`concurrent.futures.Future`
+        """
+        future = concurrent.futures.Future()
+        with self._lock:
+            self._closed = True
+
+        self.loop.add_callback(self._close, future)
+        return future
+
+    def _flush(self):
+        with self._lock:
+            batch = [self._pending.popleft() for _ in range(min(len(self._pending), self.max_batch))]
+            more = bool(self._pending)
+            self._scheduled = more
+
+        if more:
+            self.loop.add_callback(self._flush)
+
+        for request in batch:
+            if not request.future.set_running_or_notify_cancel():
+                continue
+
+            publish_future = self._exchange.publish(
+                request.message, request.routing_key, mandatory=request.mandatory, immediate=request.immediate)
+            self._outstanding.add(publish_future)
+            publish_future.add_done_callback(self._outstanding.discard)
+            tornado_concurrent.chain_future(publish_future, request.future)
+
+    @gen.coroutine
+    def _close(self, future):
+        """
+        :type future: :class:`concurrent.futures.Future`
+        """
+        while self._pending:
+            self._flush()
+            yield gen.moment
+
+        for publish_future in list(self._outstanding):
+            try:
+                yield publish_future
+            except Exception:  # pylint: disable=broad-except
+                pass  # Reported through the future of the message
+
+        future.set_result(None)
+
+
+__all__ = ('Publisher',)
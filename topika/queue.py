@@ -8,8 +8,11 @@ from tornado import gen, locks
 
 from .exchange import Exchange
 from .message import IncomingMessage
-from .common import BaseChannel
+from .common import BaseChannel, DeclarationCache
+from . import lag
+from . import latency
 from . import tools
+from . import tracing
 from .exceptions import QueueEmpty
 
 LOGGER = getLogger(__name__)
@@ -22,7 +25,7 @@ class Queue(BaseChannel):
     """ AMQP queue abstraction """
 
     __slots__ = ('name', 'durable', 'exclusive', 'auto_delete', 'arguments', '_get_lock', '_channel', '__closing',
-                 'declaration_result')
+                 'declaration_result', '_declarations')
 
     def __init__(self, loop, future_store, channel, name, durable, exclusive, auto_delete, arguments):  # pylint: disable=too-many-arguments
         """
@@ -44,6 +47,7 @@ class Queue(BaseChannel):
         self.auto_delete = auto_delete
         self.arguments = arguments
         self.declaration_result = None  # type: DeclarationResult
+        self._declarations = None  # type: DeclarationCache
         self._get_lock = locks.Lock()
 
     def __str__(self):
@@ -59,18 +63,24 @@ class Queue(BaseChannel):
         )
 
     @BaseChannel._ensure_channel_is_open
-    def declare(self, timeout=None, passive=False):
+    def declare(self, timeout=None, passive=False, nowait=False):
         """ Declare queue.
 
         :param timeout: execution timeout
         :type timeout: int
         :param passive: Only check to see if the queue exists.
         :type passive: bool
+        :param nowait: don't wait for the reply of the broker, :attr:`declaration_result` is then not set.
+            Errors surface on the next synchronous operation, see :meth:`topika.Channel.synchronize`
+        :type nowait: bool
         :rtype: :class:`tornado.concurrent.Future`
         """
 
         LOGGER.debug("Declaring queue: %r", self)
 
+        if nowait and not self.name:
+            raise ValueError("A queue declared with nowait needs a name")
+
         declare_future = self._create_future(timeout)
 
         self._channel.queue_declare(
@@ -80,7 +90,11 @@ class Queue(BaseChannel):
             exclusive=self.exclusive,
             auto_delete=self.auto_delete,
             arguments=self.arguments,
-            callback=declare_future.set_result)
+            callback=None if nowait else declare_future.set_result)
+
+        if nowait:
+            declare_future.set_result(None)
+            return declare_future
 
         def on_queue_declared(result):
             res = result.result()
@@ -95,7 +109,7 @@ class Queue(BaseChannel):
         return declare_future
 
     @BaseChannel._ensure_channel_is_open
-    def bind(self, exchange, routing_key=None, arguments=None, timeout=None):
+    def bind(self, exchange, routing_key=None, arguments=None, timeout=None, nowait=False):
         """ A binding is a relationship between an exchange and a queue. This can be
         simply read as: the queue is interested in messages from this exchange.
 
@@ -110,6 +124,8 @@ class Queue(BaseChannel):
         :type arguments: dict or NoneType
         :param timeout: execution timeout
         :type timeout: int
+        :param nowait: don't wait for the reply of the broker
+        :type nowait: bool
         :raises tornado.gen.TimeoutError: when the binding timeout period has elapsed.
         :rtype: :class:`tornado.concurrent.Future`
         """
@@ -123,12 +139,15 @@ class Queue(BaseChannel):
             exchange=Exchange._get_exchange_name(exchange),  # pylint: disable=protected-access
             routing_key=routing_key,
             arguments=arguments,
-            callback=bind_future.set_result)
+            callback=None if nowait else bind_future.set_result)
+
+        if nowait:
+            bind_future.set_result(None)
 
         return bind_future
 
     @BaseChannel._ensure_channel_is_open
-    def unbind(self, exchange, routing_key, arguments=None, timeout=None):
+    def unbind(self, exchange, routing_key, arguments=None, timeout=None, nowait=False):
         """ Remove binding from exchange for this :class:`Queue` instance
 
         :param exchange: :class:`topika.exchange.Exchange` instance
@@ -139,6 +158,9 @@ class Queue(BaseChannel):
         :type arguments: dict or NoneType
         :param timeout: execution timeout
         :type timeout: int
+        :param nowait: don't wait for the reply of the broker.  AMQP has no nowait flag for queue.unbind so
+            the broker still replies, the reply is just not waited for
+        :type nowait: bool
         :raises tornado.gen.TimeoutError: when the unbinding timeout period has elapsed.
         :rtype: :class:`tornado.concurrent.Future`
         """
@@ -153,7 +175,10 @@ class Queue(BaseChannel):
             exchange=Exchange._get_exchange_name(exchange),  # pylint: disable=protected-access
             routing_key=routing_key,
             arguments=arguments,
-            callback=unbind_future.set_result)
+            callback=None if nowait else unbind_future.set_result)
+
+        if nowait:
+            unbind_future.set_result(None)
 
         return unbind_future
 
@@ -196,7 +221,23 @@ class Queue(BaseChannel):
                 no_ack=no_ack,
             )
 
-            if tools.iscoroutinepartial(callback):
+            tracer = tracing.TRACER
+            if tracer is not None:
+                message._delivered_at = tracing.clock()  # pylint: disable=protected-access
+                tracer.on_deliver(self, message, message._delivered_at)  # pylint: disable=protected-access
+
+            recorder = latency.RECORDER
+            if recorder is not None:
+                recorder.record(self.name, message)
+
+            monitor = lag.MONITOR
+            if monitor is not None and monitor.loop is self.loop:
+                # Attribute stalls of the loop to the callback
+                if tools.iscoroutinepartial(callback):
+                    tools.create_task(monitor.run_callback(callback, message))
+                else:
+                    self.loop.add_callback(monitor.run_callback, callback, message)
+            elif tools.iscoroutinepartial(callback):
                 tools.create_task(callback(message))
             else:
                 self.loop.add_callback(callback, message)
@@ -236,6 +277,10 @@ class Queue(BaseChannel):
         cancel_future = self._create_future(timeout)
         self._channel.basic_cancel(consumer_tag=consumer_tag, callback=cancel_future.set_result)
 
+        tracer = tracing.TRACER
+        if tracer is not None:
+            tracer.on_cancel(self, consumer_tag, tracing.clock())
+
         return cancel_future
 
     @BaseChannel._ensure_channel_is_open
@@ -271,6 +316,10 @@ class Queue(BaseChannel):
                 no_ack=no_ack,
             )
 
+            recorder = latency.RECORDER
+            if recorder is not None:
+                recorder.record(self.name, message)
+
             get_future.set_result(message)
 
         with (yield self._get_lock.acquire()), self._capture_empty(_on_getempty):
@@ -317,22 +366,32 @@ class Queue(BaseChannel):
         return purge_future
 
     @BaseChannel._ensure_channel_is_open
-    def delete(self, if_unused=True, if_empty=True, timeout=None):
+    def delete(self, if_unused=True, if_empty=True, timeout=None, nowait=False):
         """ Delete the queue.
 
         :param if_unused: Perform delete only when unused
         :param if_empty: Perform delete only when empty
         :param timeout: execution timeout
+        :param nowait: don't wait for the reply of the broker
         :rtype: :class:`tornado.concurrent.Future`
         """
 
         LOGGER.info("Deleting %r", self)
 
         self._futures.reject_all(RuntimeError("Queue was deleted"))
+        if self._declarations is not None:
+            self._declarations.discard(DeclarationCache.QUEUE, self.name)
 
         future = self._create_future(timeout)
 
-        self._channel.queue_delete(queue=self.name, if_unused=if_unused, if_empty=if_empty, callback=future.set_result)
+        self._channel.queue_delete(
+            queue=self.name,
+            if_unused=if_unused,
+            if_empty=if_empty,
+            callback=None if nowait else future.set_result)
+
+        if nowait:
+            future.set_result(None)
 
         return future
 
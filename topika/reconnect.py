@@ -0,0 +1,103 @@
+from __future__ import absolute_import
+import random
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+
+
+class ReconnectPolicy(object):
+    """ Decides how long a robust connection waits before each reconnect attempt """
+
+    def __init__(self):
+        self.failures = 0
+
+    @property
+    def state(self):
+        """ The state of the circuit breaker, the circuit is open while the broker is considered down
+
+        :rtype: str
+        """
+        return CIRCUIT_CLOSED
+
+    def next_delay(self):
+        """ Called when a connection is lost or an attempt failed
+
+        :return: the time in seconds to wait before the next attempt
+        :rtype: float
+        """
+        self.failures += 1
+        return self._delay()
+
+    def reset(self):
+        """ Called once a connection has been established """
+        self.failures = 0
+
+    def _delay(self):
+        raise NotImplementedError
+
+
+class ConstantBackoff(ReconnectPolicy):
+    """ Wait the same interval before every attempt """
+
+    def __init__(self, interval=1.):
+        """
+        :param interval: the delay in seconds
+        :type interval: float
+        """
+        super(ConstantBackoff, self).__init__()
+        self.interval = interval
+
+    def _delay(self):
+        return self.interval
+
+
+class ExponentialBackoff(ReconnectPolicy):
+    """ Exponentially growing delays with jitter, capped at a maximum.
+
+    The jitter spreads the reconnects of many clients that lost the same broker so they don't hit it in
+    lockstep.  When `failure_threshold` consecutive attempts have failed the circuit opens: the attempts
+    are then spaced `open_timeout` seconds apart until one succeeds and closes the circuit again.
+    """
+
+    def __init__(self, initial=1., factor=2., max_delay=30., jitter=0.5, failure_threshold=None, open_timeout=60.):
+        """
+        :param initial: the delay in seconds before the first attempt
+        :type initial: float
+        :param factor: the factor the delay grows by after each failure
+        :type factor: float
+        :param max_delay: the maximum delay in seconds
+        :type max_delay: float
+        :param jitter: the fraction of the delay that is randomised, between 0 (none) and 1 (full jitter)
+        :type jitter: float
+        :param failure_threshold: the number of consecutive failures that opens the circuit, None to never open it
+        :type failure_threshold: int
+        :param open_timeout: the delay in seconds between attempts while the circuit is open
+        :type open_timeout: float
+        """
+        if not 0 <= jitter <= 1:
+            raise ValueError("jitter must be between 0 and 1")
+
+        super(ExponentialBackoff, self).__init__()
+        self.initial = initial
+        self.factor = factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.failure_threshold = failure_threshold
+        self.open_timeout = open_timeout
+
+    @property
+    def state(self):
+        if self.failure_threshold is not None and self.failures >= self.failure_threshold:
+            return CIRCUIT_OPEN
+
+        return CIRCUIT_CLOSED
+
+    def _delay(self):
+        if self.state == CIRCUIT_OPEN:
+            return self.open_timeout
+
+        delay = min(self.initial * self.factor**(self.failures - 1), self.max_delay)
+        return delay - random.uniform(0, self.jitter * delay)
+
+
+__all__ = ('ReconnectPolicy', 'ConstantBackoff', 'ExponentialBackoff', 'CIRCUIT_CLOSED', 'CIRCUIT_OPEN')
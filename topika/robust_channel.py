@@ -32,13 +32,15 @@ class RobustChannel(Channel):
                  future_store,
                  channel_number=None,
                  publisher_confirms=True,
-                 on_return_raises=False):
+                 on_return_raises=False,
+                 cache_declarations=False):
         """
 
         :param connection: :class:`pika.TornadoConnection` instance
         :param loop: Event loop (:func:`tornado.ioloop.IOLoop.current()` when :class:`None`)
         :param future_store: :class:`topika.common.FutureStore` instance
         :param publisher_confirms: False if you don't need delivery confirmations (in pursuit of performance)
+        :param cache_declarations: return the same exchange or queue when it is declared again with the same arguments
         """
         super(RobustChannel, self).__init__(
             loop=loop,
@@ -47,6 +49,7 @@ class RobustChannel(Channel):
             channel_number=channel_number,
             publisher_confirms=publisher_confirms,
             on_return_raises=on_return_raises,
+            cache_declarations=cache_declarations,
         )
 
         self._closed = False
@@ -56,6 +59,19 @@ class RobustChannel(Channel):
 
     @gen.coroutine
     def on_reconnect(self, connection, channel_number):
+        yield self.redeclare(connection, channel_number)
+        yield self.restore_bindings()
+
+    @gen.coroutine
+    def redeclare(self, connection, channel_number):
+        """ Reopen the channel and declare its exchanges and queues again.
+
+        The declarations are sent without waiting for their replies, a single round trip at the end
+        surfaces any error.
+
+        :type connection: :class:`pika.TornadoConnection`
+        :type channel_number: int
+        """
         exc = compat.ConnectionError('Auto Reconnect Error')
 
         if not self._closing.done():
@@ -63,16 +79,26 @@ class RobustChannel(Channel):
 
         self._closing = tools.create_future(loop=self.loop)
         self._futures.reject_all(exc)
+        if self._declarations is not None:
+            # The declarations that are not robust are gone with the old connection
+            self._declarations.clear()
         self._connection = connection
         self._channel_number = channel_number
 
         yield self.initialize()
 
-        for exchange in self._exchanges.values():
-            yield exchange.on_reconnect(self)
+        exchanges = [exchange.redeclare(self) for exchange in tuple(self._exchanges.values())]
+        queues = [queue.redeclare(self) for queue in tuple(self._queues.values())]
+        yield exchanges + queues
+        yield self.synchronize()
 
-        for queue in self._queues.values():
-            yield queue.on_reconnect(self)
+    @gen.coroutine
+    def restore_bindings(self):
+        """ Restore the bindings and the consumers of the exchanges and queues of the channel """
+        exchanges = [exchange.restore_bindings() for exchange in tuple(self._exchanges.values())]
+        queues = [queue.restore_bindings() for queue in tuple(self._queues.values())]
+        yield exchanges + queues
+        yield self.synchronize()
 
     @gen.coroutine
     def initialize(self, timeout=None):
@@ -119,7 +145,8 @@ class RobustChannel(Channel):
                          passive=False,
                          arguments=None,
                          timeout=None,
-                         robust=True):
+                         robust=True,
+                         nowait=False):
 
         exchange = yield super(RobustChannel, self).declare_exchange(
             name=name,
@@ -130,6 +157,7 @@ class RobustChannel(Channel):
             passive=passive,
             arguments=arguments,
             timeout=timeout,
+            nowait=nowait,
         )
 
         if not internal and robust:
@@ -138,9 +166,9 @@ class RobustChannel(Channel):
         raise gen.Return(exchange)
 
     @gen.coroutine
-    def exchange_delete(self, exchange_name, timeout=None, if_unused=False):
+    def exchange_delete(self, exchange_name, timeout=None, if_unused=False, nowait=False):
         result = yield super(RobustChannel, self).exchange_delete(
-            exchange_name=exchange_name, timeout=timeout, if_unused=if_unused)
+            exchange_name=exchange_name, timeout=timeout, if_unused=if_unused, nowait=nowait)
 
         self._exchanges.pop(exchange_name, None)
 
@@ -155,7 +183,8 @@ class RobustChannel(Channel):
                       auto_delete=False,
                       arguments=None,
                       timeout=None,
-                      robust=True):
+                      robust=True,
+                      nowait=False):
         """
         :param name: queue name
         :type name: str
@@ -174,6 +203,8 @@ class RobustChannel(Channel):
         :param timeout: execution timeout
         :type timeout: int
         :type robust: bool
+        :param nowait: don't wait for the reply of the broker
+        :type nowait: bool
         :rtype: :class:`Generator[Any, None, Queue]`
         """
 
@@ -185,6 +216,7 @@ class RobustChannel(Channel):
             auto_delete=auto_delete,
             arguments=arguments,
             timeout=timeout,
+            nowait=nowait,
         )
 
         if robust:
@@ -193,9 +225,9 @@ class RobustChannel(Channel):
         raise gen.Return(queue)
 
     @gen.coroutine
-    def queue_delete(self, queue_name, timeout=None, if_unused=False, if_empty=False):
+    def queue_delete(self, queue_name, timeout=None, if_unused=False, if_empty=False, nowait=False):
         result = yield super(RobustChannel, self).queue_delete(
-            queue_name=queue_name, timeout=timeout, if_unused=if_unused, if_empty=if_empty)
+            queue_name=queue_name, timeout=timeout, if_unused=if_unused, if_empty=if_empty, nowait=nowait)
 
         self._queues.pop(queue_name, None)
         raise gen.Return(result)
@@ -56,18 +56,29 @@ class RobustExchange(Exchange):
     @gen.coroutine
     def on_reconnect(self, channel):
         """
+        :type channel: :class:`Channel`
+        """
+        yield self.redeclare(channel)
+        yield self.restore_bindings()
+
+    @gen.coroutine
+    def redeclare(self, channel):
+        """ Declare the exchange again on the reopened channel
+
         :type channel: :class:`Channel`
         """
         self._futures.reject_all(compat.ConnectionError("Auto Reconnect Error"))
         self._channel = channel._channel
 
-        yield self.declare()
+        yield self.declare(nowait=True)
 
-        for exchange, kwargs in self._bindings.items():
-            yield self.bind(exchange, **kwargs)
+    @gen.coroutine
+    def restore_bindings(self):
+        """ Bind the exchange again to the exchanges it was bound to, all the bindings are sent at once """
+        yield [self.bind(exchange, nowait=True, **kwargs) for exchange, kwargs in tuple(self._bindings.items())]
 
     @gen.coroutine
-    def bind(self, exchange, routing_key='', arguments=None, timeout=None):
+    def bind(self, exchange, routing_key='', arguments=None, timeout=None, nowait=False):
         """
         :param exchange: :class:`topika.exchange.Exchange` instance
         :type exchange: ExchangeType_
@@ -76,17 +87,19 @@ class RobustExchange(Exchange):
         :param arguments: additional arguments (will be passed to `pika`)
         :param timeout: execution timeout
         :type timeout: int
+        :param nowait: don't wait for the reply of the broker
+        :type nowait: bool
         :rtype: :class:`tornado.concurrent.Future`
         """
         result = yield super(RobustExchange, self).bind(
-            exchange, routing_key=routing_key, arguments=arguments, timeout=timeout)
+            exchange, routing_key=routing_key, arguments=arguments, timeout=timeout, nowait=nowait)
 
         self._bindings[exchange] = dict(routing_key=routing_key, arguments=arguments)
 
         raise gen.Return(result)
 
     @gen.coroutine
-    def unbind(self, exchange, routing_key='', arguments=None, timeout=None):
+    def unbind(self, exchange, routing_key='', arguments=None, timeout=None, nowait=False):
         """ Remove exchange-to-exchange binding for this :class:`Exchange` instance
 
         :param exchange: :class:`topika.exchange.Exchange` instance
@@ -97,9 +110,12 @@ class RobustExchange(Exchange):
         :type arguments: dict
         :param timeout: execution timeout
         :type timeout: int
+        :param nowait: don't wait for the reply of the broker
+        :type nowait: bool
         :rtype: :class:`tornado.concurrent.Future`
         """
-        result = yield super(RobustExchange, self).unbind(exchange, routing_key, arguments=arguments, timeout=timeout)
+        result = yield super(RobustExchange, self).unbind(
+            exchange, routing_key, arguments=arguments, timeout=timeout, nowait=nowait)
         self._bindings.pop(exchange, None)
         raise gen.Return(result)
 
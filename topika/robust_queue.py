@@ -39,22 +39,37 @@ class RobustQueue(Queue):
     @gen.coroutine
     def on_reconnect(self, channel):
         """
+        :type channel: :class:`Channel`
+        """
+        yield self.redeclare(channel)
+        yield self.restore_bindings()
+
+    @gen.coroutine
+    def redeclare(self, channel):
+        """ Declare the queue again on the reopened channel
+
         :type channel: :class:`Channel`
         """
         self._futures.reject_all(compat.ConnectionError("Auto Reconnect Error"))
         self._channel = channel._channel
 
-        yield self.declare()
-
-        for item, kwargs in self._bindings.items():
-            exchange, routing_key = item
-            yield self.bind(exchange, routing_key, **kwargs)
+        yield self.declare(nowait=True)
 
-        for consumer_tag, kwargs in tuple(self._consumers.items()):
-            yield self.consume(consumer_tag=consumer_tag, **kwargs)
+    @gen.coroutine
+    def restore_bindings(self):
+        """ Bind the queue and start its consumers again, all the methods are sent at once """
+        bindings = [
+            self.bind(exchange, routing_key, nowait=True, **kwargs)
+            for (exchange, routing_key), kwargs in tuple(self._bindings.items())
+        ]
+        consumers = [
+            self.consume(consumer_tag=consumer_tag, **kwargs)
+            for consumer_tag, kwargs in tuple(self._consumers.items())
+        ]
+        yield bindings + consumers
 
     @gen.coroutine
-    def bind(self, exchange, routing_key=None, arguments=None, timeout=None):
+    def bind(self, exchange, routing_key=None, arguments=None, timeout=None, nowait=False):
         """ A binding is a relationship between an exchange and a queue. This can be
         simply read as: the queue is interested in messages from this exchange.
 
@@ -69,19 +84,22 @@ class RobustQueue(Queue):
         :type arguments: dict or NoneType
         :param timeout: execution timeout
         :type timeout: int
+        :param nowait: don't wait for the reply of the broker
+        :type nowait: bool
         :raises tornado.gen.TimeoutError: when the binding timeout period has elapsed.
         :rtype: :class:`tornado.concurrent.Future`
         """
         kwargs = dict(arguments=arguments, timeout=timeout)
 
-        result = yield super(RobustQueue, self).bind(exchange=exchange, routing_key=routing_key, **kwargs)
+        result = yield super(RobustQueue, self).bind(
+            exchange=exchange, routing_key=routing_key, nowait=nowait, **kwargs)
 
         self._bindings[(exchange, routing_key)] = kwargs
 
         raise gen.Return(result)
 
     @gen.coroutine
-    def unbind(self, exchange, routing_key, arguments=None, timeout=None):
+    def unbind(self, exchange, routing_key, arguments=None, timeout=None, nowait=False):
         """
         :param exchange:  The exchange to unbind
         :type exchange: :class:`ExchangeType_`
@@ -89,9 +107,10 @@ class RobustQueue(Queue):
         :type routing_key: str
         :param arguments:
         :param timeout:
+        :param nowait: don't wait for the reply of the broker
         :return:
         """
-        result = yield super(RobustQueue, self).unbind(exchange, routing_key, arguments, timeout)
+        result = yield super(RobustQueue, self).unbind(exchange, routing_key, arguments, timeout, nowait=nowait)
         self._bindings.pop((exchange, routing_key), None)
 
         raise gen.Return(result)
@@ -0,0 +1,445 @@
+from __future__ import absolute_import
+from collections import namedtuple
+import copy
+from logging import getLogger
+
+import shortuuid
+import six
+from tornado import gen, locks
+
+from . import common
+from . import exceptions
+from .message import Message
+from .queue import Queue
+
+LOGGER = getLogger(__name__)
+
+# RabbitMQ's pseudo-queue for direct reply-to, see https://www.rabbitmq.com/direct-reply-to.html
+DIRECT_REPLY_TO = 'amq.rabbitmq.reply-to'
+# Message type of the replies sent when the handler of a request raised
+ERROR_TYPE = 'topika.rpc.error'
+
+GatherReply = namedtuple('GatherReply', ('responder', 'message', 'error', 'elapsed'))
+GatherResult = namedtuple('GatherResult', ('replies', 'complete', 'elapsed'))
+
+
+class RpcClient(object):
+    """ RPC client using RabbitMQ's `direct reply-to`_ so that no reply queue has to be declared.
+
+    Replies are matched to their calls through a correlation id to future map so that any number
+    of calls can be in flight on the one channel.
+
+    Example:
+
+    .. code-block:: python
+
+        import topika
+        from topika.rpc import RpcClient
+        import tornado.gen
+
+        @tornado.gen.coroutine
+        def main():
+            connection = yield topika.connect()
+            channel = yield connection.channel()
+
+            client = yield RpcClient.create(channel)
+            reply = yield client.call('my_service', b'ping', timeout=5)
+
+    .. _direct reply-to: https://www.rabbitmq.com/direct-reply-to.html
+    """
+
+    def __init__(self, channel, exchange=None, timeout=None):
+        """
+        :param channel: the channel to publish the requests and consume the replies on
+        :type channel: :class:`topika.Channel`
+        :param exchange: the exchange to publish requests to, the default exchange if not supplied
+        :type exchange: :class:`topika.Exchange`
+        :param timeout: the default timeout for calls in seconds
+        :type timeout: float
+        """
+        self.loop = channel.loop
+        self.timeout = timeout
+        self._channel = channel
+        self._exchange = exchange or channel.default_exchange
+        self._futures = channel._futures.create_child()  # pylint: disable=protected-access
+        self._pending = {}
+        self._gathers = {}
+        self._reply_queue = None  # type: Queue
+        self._consumer_tag = None
+
+    @classmethod
+    @gen.coroutine
+    def create(cls, channel, **kwargs):
+        """ Create a new client and start consuming replies
+
+        :type channel: :class:`topika.Channel`
+        :rtype: :class:`Generator[Any, None, RpcClient]`
+        """
+        client = cls(channel, **kwargs)
+        yield client.initialize()
+        raise gen.Return(client)
+
+    @property
+    def is_initialized(self):
+        return self._consumer_tag is not None
+
+    @gen.coroutine
+    def initialize(self, timeout=None):
+        """ Start consuming from the direct reply-to pseudo-queue.  This has to happen before the first
+        request is published.
+
+        :param timeout: execution timeout
+        :type timeout: int
+        """
+        if self.is_initialized:
+            return
+
+        # The pseudo-queue is never declared, it just has to be consumed from in no_ack mode
+        self._reply_queue = Queue(
+            self.loop,
+            self._futures.create_child(),
+            self._channel._channel,  # pylint: disable=protected-access
+            DIRECT_REPLY_TO,
+            durable=False,
+            exclusive=False,
+            auto_delete=False,
+            arguments=None)
+        self._channel.add_on_return_callback(self._on_return)
+        self._consumer_tag = yield self._reply_queue.consume(self._on_reply, no_ack=True, timeout=timeout)
+
+    @gen.coroutine
+    def call(self, routing_key, message, timeout=None, mandatory=True):
+        """ Publish a request and wait for the reply
+
+        :param routing_key: the routing key of the request, the queue name when using the default exchange
+        :type routing_key: str
+        :param message: the request, either a message or the message body
+        :type message: :class:`topika.Message` or bytes
+        :param timeout: :class:`tornado.gen.TimeoutError` will be raised when no reply arrived in time,
+            the client default is used if not supplied
+        :type timeout: float
+        :param mandatory: if True an unroutable request fails immediately with
+            :class:`topika.exceptions.UnroutableError` instead of timing out
+        :type mandatory: bool
+        :raises topika.exceptions.RpcError: when the handler of the request raised an exception
+        :return: the reply
+        :rtype: :class:`Generator[Any, None, topika.IncomingMessage]`
+        """
+        if not self.is_initialized:
+            raise RuntimeError("The RPC client has not been initialized")
+
+        request = self._create_request(message)
+        correlation_id = request.correlation_id
+
+        future = self._futures.create_future(timeout=timeout or self.timeout)
+        self._pending[correlation_id] = future
+        try:
+            yield self._exchange.publish(request, routing_key, mandatory=mandatory)
+            reply = yield future
+        finally:
+            self._pending.pop(correlation_id, None)
+            # The publish failed, release the future from the store
+            if not future.done():
+                future.set_result(None)
+
+        raise gen.Return(reply)
+
+    @gen.coroutine
+    def gather(self, exchange, message, expected=None, quorum=None, timeout=None):
+        """ Scatter a request to all the responders bound to a fanout exchange and gather their replies.
+
+        Gathering stops as soon as `expected` replies (or `quorum` replies, whichever is lower) have
+        arrived, or when the timeout expires in which case the replies received so far are returned.
+
+        Example:
+
+        .. code-block:: python
+
+            exchange = yield channel.declare_exchange('status', type=topika.ExchangeType.FANOUT)
+            result = yield client.gather(exchange, b'status', expected=5, quorum=3, timeout=2)
+            for reply in result.replies:
+                print(reply.responder, reply.elapsed, reply.message.body)
+
+        :param exchange: the fanout exchange to publish the request to
+        :type exchange: :class:`topika.Exchange`
+        :param message: the request, either a message or the message body
+        :type message: :class:`topika.Message` or bytes
+        :param expected: the number of responders
+        :type expected: int
+        :param quorum: the number of replies that is enough to return early
+        :type quorum: int
+        :param timeout: the deadline in seconds after which the partial result is returned,
+            the client default is used if not supplied
+        :type timeout: float
+        :return: the replies with the time each took to arrive, whether gathering completed before the
+            deadline and the total elapsed time
+        :rtype: :class:`Generator[Any, None, GatherResult]`
+        """
+        if not self.is_initialized:
+            raise RuntimeError("The RPC client has not been initialized")
+
+        timeout = timeout or self.timeout
+        targets = [count for count in (expected, quorum) if count is not None]
+        if not targets and not timeout:
+            raise ValueError("At least one of expected, quorum or timeout has to be supplied")
+
+        request = self._create_request(message)
+        correlation_id = request.correlation_id
+
+        start = self.loop.time()
+        gathering = _Gathering(self.loop, start, self._futures.create_future(timeout=timeout), min(targets or [0]))
+        self._gathers[correlation_id] = gathering
+        try:
+            yield exchange.publish(request, '', mandatory=False)
+            try:
+                yield gathering.future
+            except gen.TimeoutError:
+                pass
+        finally:
+            self._gathers.pop(correlation_id, None)
+            if not gathering.future.done():
+                gathering.future.set_result(None)
+
+        raise gen.Return(
+            GatherResult(
+                replies=tuple(gathering.replies),
+                complete=gathering.future.exception() is None,
+                elapsed=self.loop.time() - start))
+
+    @gen.coroutine
+    def close(self):
+        """ Stop consuming replies and reject all the calls that are still pending """
+        if not self.is_initialized:
+            return
+
+        consumer_tag, self._consumer_tag = self._consumer_tag, None
+        self._channel.remove_on_return_callback(self._on_return)
+        self._futures.reject_all(RuntimeError("RPC client closed"))
+        self._pending.clear()
+        self._gathers.clear()
+
+        if not self._channel.is_closed:
+            yield self._reply_queue.cancel(consumer_tag)
+
+    @staticmethod
+    def _create_request(message):
+        """
+        :type message: :class:`topika.Message` or bytes
+        :rtype: :class:`topika.Message`
+        """
+        if isinstance(message, Message):
+            request = copy.copy(message)
+        else:
+            request = Message(body=message)
+
+        request.correlation_id = shortuuid.uuid().encode()
+        request.reply_to = DIRECT_REPLY_TO
+        return request
+
+    def _on_reply(self, message):
+        """
+        :type message: :class:`topika.IncomingMessage`
+        """
+        future = self._pending.pop(message.correlation_id, None)
+        if future is None:
+            gathering = self._gathers.get(message.correlation_id)
+            if gathering is None:
+                LOGGER.warning("Discarding reply with unknown correlation id: %r", message.correlation_id)
+            else:
+                gathering.add(message, _get_error(message))
+            return
+
+        if future.done():
+            return
+
+        error = _get_error(message)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(message)
+
+    def _on_return(self, message):
+        """
+        :type message: :class:`topika.message.ReturnedMessage`
+        """
+        future = self._pending.pop(message.correlation_id, None)
+        if future is not None and not future.done():
+            future.set_exception(exceptions.UnroutableError([message.body]))
+
+
+class _Gathering(object):
+    """ The replies collected so far for one scatter-gather request """
+
+    __slots__ = ('loop', 'start', 'future', 'target', 'replies')
+
+    def __init__(self, loop, start, future, target):
+        """
+        :type loop: :class:`tornado.ioloop.IOLoop`
+        :param start: the loop time the request was published at
+        :type start: float
+        :param future: resolved once `target` replies have arrived
+        :type future: :class:`tornado.concurrent.Future`
+        :param target: the number of replies to gather, 0 to gather until the future times out
+        :type target: int
+        """
+        self.loop = loop
+        self.start = start
+        self.future = future
+        self.target = target
+        self.replies = []
+
+    def add(self, message, error):
+        """
+        :type message: :class:`topika.IncomingMessage`
+        :type error: :class:`topika.exceptions.RpcError` or NoneType
+        """
+        if self.future.done():
+            return
+
+        self.replies.append(
+            GatherReply(responder=message.app_id, message=message, error=error, elapsed=self.loop.time() - self.start))
+
+        if self.target and len(self.replies) >= self.target:
+            self.future.set_result(None)
+
+
+def _get_error(reply):
+    """
+    :type reply: :class:`topika.IncomingMessage`
+    :return: the error the handler raised if this is an error reply
+    :rtype: :class:`topika.exceptions.RpcError` or NoneType
+    """
+    if reply.type == ERROR_TYPE:
+        return exceptions.RpcError(reply.body.decode('utf-8'))
+
+    return None
+
+
+class RpcServer(object):
+    """ Serve RPC requests consumed from a queue.
+
+    At most `max_concurrency` handlers are in flight at once.  Each reply is published to the `reply_to`
+    of its request with the matching `correlation_id` and the request is only acknowledged once the
+    reply has been confirmed.  Replies are not serialized on each other's confirmations so a burst of
+    completions goes out in a few writes.
+
+    Example:
+
+    .. code-block:: python
+
+        import topika
+        from topika.rpc import RpcServer
+        import tornado.gen
+
+        def handler(message):
+            return message.body.upper()
+
+        @tornado.gen.coroutine
+        def main():
+            connection = yield topika.connect()
+            channel = yield connection.channel()
+            queue = yield channel.declare_queue('my_service')
+
+            server = RpcServer(channel, queue, handler, max_concurrency=16)
+            yield server.start()
+    """
+
+    DEFAULT_MAX_CONCURRENCY = 32
+
+    def __init__(self, channel, queue, handler, max_concurrency=DEFAULT_MAX_CONCURRENCY, name=None):
+        """
+        :param channel: the channel the queue was declared on, replies are published through its default exchange
+        :type channel: :class:`topika.Channel`
+        :param queue: the queue to consume requests from
+        :type queue: :class:`topika.Queue`
+        :param handler: called with each request :class:`topika.IncomingMessage`, can be a coroutine.  Should
+            return the reply as a :class:`topika.Message`, bytes or None for an empty reply
+        :param max_concurrency: the maximum number of handlers running at once
+        :type max_concurrency: int
+        :param name: identifies this server to scatter-gather clients, sent as the `app_id` of the replies.
+            Defaults to the queue name
+        :type name: str
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+
+        self.loop = channel.loop
+        self.max_concurrency = max_concurrency
+        self.name = name or queue.name
+        self._channel = channel
+        self._queue = queue
+        self._handler = common.ensure_coroutine(handler)
+        self._semaphore = locks.Semaphore(max_concurrency)
+        self._consumer_tag = None
+
+    @property
+    def is_running(self):
+        return self._consumer_tag is not None
+
+    @gen.coroutine
+    def start(self, timeout=None):
+        """ Start serving requests.  This sets the prefetch count of the channel to `max_concurrency` so the
+        channel should be dedicated to this server.
+
+        :param timeout: execution timeout
+        :type timeout: int
+        """
+        if self.is_running:
+            return
+
+        yield self._channel.set_qos(prefetch_count=self.max_concurrency, timeout=timeout)
+        self._consumer_tag = yield self._queue.consume(self._on_request, timeout=timeout)
+
+    @gen.coroutine
+    def stop(self, timeout=None):
+        """ Stop consuming new requests, those already being handled still get their reply
+
+        :param timeout: execution timeout
+        :type timeout: int
+        """
+        if not self.is_running:
+            return
+
+        consumer_tag, self._consumer_tag = self._consumer_tag, None
+        yield self._queue.cancel(consumer_tag, timeout=timeout)
+
+    @gen.coroutine
+    def _on_request(self, message):
+        """
+        :type message: :class:`topika.IncomingMessage`
+        """
+        with (yield self._semaphore.acquire()):
+            try:
+                result = yield self._handler(message)
+            except Exception as exc:  # pylint: disable=broad-except
+                LOGGER.exception("Handler failed for request %r", message)
+                reply = Message(body=six.text_type(exc).encode('utf-8'), type=ERROR_TYPE)
+            else:
+                reply = self._create_reply(result)
+
+            if message.reply_to:
+                reply.correlation_id = message.correlation_id
+                reply.app_id = reply.app_id or self.name
+                try:
+                    yield self._channel.default_exchange.publish(reply, message.reply_to, mandatory=False)
+                except Exception:  # pylint: disable=broad-except
+                    LOGGER.exception("Failed to publish the reply to request %r, requeueing it", message)
+                    if not self._channel.is_closed:
+                        message.reject(requeue=True)
+                    return
+
+            message.ack()
+
+    @staticmethod
+    def _create_reply(result):
+        """
+        :param result: the value returned by the handler
+        :rtype: :class:`topika.Message`
+        """
+        if isinstance(result, Message):
+            return copy.copy(result)
+
+        return Message(body=result if result is not None else b'')
+
+
+__all__ = ('RpcClient', 'RpcServer', 'GatherReply', 'GatherResult', 'DIRECT_REPLY_TO')
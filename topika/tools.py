@@ -1,15 +1,20 @@
 from __future__ import absolute_import
 import functools
+import inspect
 import pika.exceptions
 import tornado.concurrent
 from tornado import gen
 
-__all__ = 'wait', 'create_future', 'create_task', 'iscoroutinepartial'
+# Native coroutine functions only exist on Python 3.5+
+_iscoroutinefunction = getattr(inspect, 'iscoroutinefunction', lambda func: False)
+
+__all__ = 'wait', 'create_future', 'failed_future', 'create_task', 'iscoroutinepartial', 'freeze'
 
 
 def iscoroutinepartial(coro):
     """
-    Function returns True if function it's a partial instance of coroutine. See additional information here_.
+    Function returns True if function it's a partial instance of coroutine, either a tornado coroutine or a
+    native one on Python 3.5+. See additional information here_.
 
     :param coro: Function
     :return: bool
@@ -26,7 +31,7 @@ def iscoroutinepartial(coro):
         if coro is None:
             break
 
-    return gen.is_coroutine_function(parent)
+    return gen.is_coroutine_function(parent) or _iscoroutinefunction(parent)
 
 
 def create_future(loop):
@@ -42,6 +47,13 @@ def create_future(loop):
         return tornado.concurrent.Future()
 
 
+def failed_future(loop, exception):
+    """ Create a future that already failed with the exception """
+    future = create_future(loop)
+    future.set_exception(exception)
+    return future
+
+
 def create_task(yielded):
     """ Helper for `create a new Task`_ with backward compatibility for Python 3.4
 
@@ -80,3 +92,15 @@ def ensure_connection_exception(exception_or_message):
 
 # Get rid of the stupid default replace_callback in tornado coroutine
 coroutine = functools.partial(gen._make_coroutine_wrapper, replace_callback=False)
+
+
+def freeze(value):
+    """ Turn a value built from dicts and lists, such as AMQP arguments, into a hashable one
+
+    :return: the value with dicts replaced by sorted tuples of items and lists by tuples
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
@@ -0,0 +1,365 @@
+from __future__ import absolute_import
+from collections import namedtuple, OrderedDict
+from logging import getLogger
+
+import six
+import yaml
+from tornado import gen
+
+from .exchange import Exchange, ExchangeType
+from . import tools
+
+LOGGER = getLogger(__name__)
+
+DESTINATION_QUEUE = 'queue'
+DESTINATION_EXCHANGE = 'exchange'
+
+ExchangeSpec = namedtuple('ExchangeSpec', ('name', 'type', 'durable', 'auto_delete', 'internal', 'arguments'))
+QueueSpec = namedtuple('QueueSpec', ('name', 'durable', 'exclusive', 'auto_delete', 'arguments'))
+BindingSpec = namedtuple('BindingSpec', ('source', 'destination', 'destination_type', 'routing_key', 'arguments'))
+
+Diff = namedtuple('Diff', ('exchanges', 'queues', 'bindings', 'unbindings', 'removed_exchanges', 'removed_queues'))
+
+_Applied = namedtuple('_Applied', ('topology', 'exchanges', 'queues'))
+
+_EXCHANGE_OPTIONS = ('type', 'durable', 'auto_delete', 'internal', 'arguments')
+_QUEUE_OPTIONS = ('durable', 'exclusive', 'auto_delete', 'arguments')
+_BINDING_OPTIONS = ('source', DESTINATION_QUEUE, DESTINATION_EXCHANGE, 'routing_key', 'arguments')
+
+
+class Topology(object):
+    """ A set of exchanges, queues and the bindings between them.
+
+    The spec is a mapping, or a YAML document of one, with the optional keys `exchanges`, `queues` and
+    `bindings`.  Exchanges and queues map their names to their declare options, all of which are optional.
+    A binding names its `source` exchange and either the `queue` or the `exchange` it routes to, which has
+    to be part of the spec:
+
+    .. code-block:: yaml
+
+        exchanges:
+          events: {type: topic, durable: true}
+        queues:
+          billing: {durable: true, arguments: {x-max-length: 10000}}
+          audit: {durable: true}
+        bindings:
+          - {source: events, queue: billing, routing_key: 'invoice.*'}
+          - {source: events, queue: audit, routing_key: '#'}
+    """
+
+    def __init__(self, exchanges=(), queues=(), bindings=()):
+        """
+        :type exchanges: Iterable[ExchangeSpec]
+        :type queues: Iterable[QueueSpec]
+        :type bindings: Iterable[BindingSpec]
+        """
+        self.exchanges = OrderedDict((exchange.name, exchange) for exchange in exchanges)
+        self.queues = OrderedDict((queue.name, queue) for queue in queues)
+        self.bindings = OrderedDict((_binding_key(binding), binding) for binding in bindings)
+
+        for binding in self.bindings.values():
+            declared = self.queues if binding.destination_type == DESTINATION_QUEUE else self.exchanges
+            if binding.destination not in declared:
+                raise ValueError("The {} '{}' of a binding is not declared in the spec".format(
+                    binding.destination_type, binding.destination))
+
+    def __eq__(self, other):
+        return isinstance(other, Topology) and (self.exchanges, self.queues, self.bindings) == (
+            other.exchanges, other.queues, other.bindings)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "<Topology: %d exchanges, %d queues, %d bindings>" % (len(self.exchanges), len(self.queues),
+                                                                    len(self.bindings))
+
+    @classmethod
+    def load(cls, spec):
+        """ Create the topology from a spec
+
+        :param spec: the spec as a mapping or a YAML document
+        :type spec: dict or str or :class:`Topology`
+        :rtype: :class:`Topology`
+        """
+        if isinstance(spec, Topology):
+            return spec
+
+        if isinstance(spec, six.string_types):
+            spec = yaml.safe_load(spec) or {}
+
+        _check_options('topology', spec, ('exchanges', 'queues', 'bindings'))
+
+        exchanges = [_exchange_spec(name, options) for name, options in _entries(spec.get('exchanges'))]
+        queues = [_queue_spec(name, options) for name, options in _entries(spec.get('queues'))]
+        bindings = [_binding_spec(options) for options in spec.get('bindings') or ()]
+
+        return cls(exchanges, queues, bindings)
+
+
+def diff(channel, spec):
+    """ Compute the changes needed to bring the topology of a channel to the spec.
+
+    Exchanges, queues and bindings that were applied before, or that were declared directly on a
+    :class:`topika.robust_channel.RobustChannel` with the same options, are left out.  Removals only cover
+    what a previous :func:`apply` on the channel declared.
+
+    :type channel: :class:`topika.Channel`
+    :param spec: the spec as a mapping or a YAML document
+    :type spec: dict or str or :class:`Topology`
+    :rtype: :class:`Diff`
+    """
+    target = Topology.load(spec)
+    applied = channel._topology.topology if channel._topology else Topology()  # pylint: disable=protected-access
+    known_exchanges = getattr(channel, '_exchanges', {})
+    known_queues = getattr(channel, '_queues', {})
+
+    def is_declared(name, spec, previous, known, describe):
+        if name in previous:
+            return previous[name] == spec
+        return name in known and describe(known[name]) == spec
+
+    known_bindings = _known_bindings(known_exchanges, known_queues)
+
+    return Diff(
+        exchanges=[
+            exchange for name, exchange in target.exchanges.items()
+            if not is_declared(name, exchange, applied.exchanges, known_exchanges, _describe_exchange)
+        ],
+        queues=[
+            queue for name, queue in target.queues.items()
+            if not is_declared(name, queue, applied.queues, known_queues, _describe_queue)
+        ],
+        bindings=[
+            binding for key, binding in target.bindings.items()
+            if key not in applied.bindings and key not in known_bindings
+        ],
+        unbindings=[binding for key, binding in applied.bindings.items() if key not in target.bindings],
+        removed_exchanges=[exchange for name, exchange in applied.exchanges.items() if name not in target.exchanges],
+        removed_queues=[queue for name, queue in applied.queues.items() if name not in target.queues],
+    )
+
+
+@gen.coroutine
+def apply(channel, spec, delete=False, timeout=None):
+    """ Declare the topology of the spec on the channel, only applying what changed since it was last applied.
+
+    All the methods are sent at once without waiting for their replies, a single round trip at the end
+    surfaces any error.  On a :class:`topika.robust_channel.RobustChannel` the applied topology is what gets
+    restored after a reconnect, so startup and recovery take the same path.
+
+    .. code-block:: python
+
+        with open('topology.yaml') as handle:
+            yield topika.topology.apply(channel, handle.read())
+
+    :type channel: :class:`topika.Channel`
+    :param spec: the spec as a mapping or a YAML document, see :class:`Topology`
+    :type spec: dict or str or :class:`Topology`
+    :param delete: delete the exchanges and queues that were removed from the spec since the last time it was
+        applied, otherwise they are only forgotten and no longer restored
+    :type delete: bool
+    :param timeout: execution timeout
+    :type timeout: int
+    :return: the changes that were applied
+    :rtype: :class:`Generator[Any, None, Diff]`
+    """
+    target = Topology.load(spec)
+    changes = diff(channel, target)
+    previous = channel._topology or _Applied(Topology(), {}, {})  # pylint: disable=protected-access
+
+    LOGGER.debug("Applying topology %r to channel %r: %r", target, channel, changes)
+
+    exchanges = dict(previous.exchanges)
+    exchanges.update(getattr(channel, '_exchanges', {}))
+    queues = dict(previous.queues)
+    queues.update(getattr(channel, '_queues', {}))
+
+    declared = yield [
+        channel.declare_exchange(
+            exchange.name,
+            type=exchange.type,
+            durable=exchange.durable,
+            auto_delete=exchange.auto_delete,
+            internal=exchange.internal,
+            arguments=exchange.arguments,
+            nowait=True) for exchange in changes.exchanges
+    ] + [
+        channel.declare_queue(
+            queue.name,
+            durable=queue.durable,
+            exclusive=queue.exclusive,
+            auto_delete=queue.auto_delete,
+            arguments=queue.arguments,
+            nowait=True) for queue in changes.queues
+    ]
+    for item in declared:
+        (exchanges if isinstance(item, Exchange) else queues)[item.name] = item
+
+    removed = set()
+    if delete:
+        removed.update((DESTINATION_EXCHANGE, exchange.name) for exchange in changes.removed_exchanges)
+        removed.update((DESTINATION_QUEUE, queue.name) for queue in changes.removed_queues)
+
+    def destination(binding):
+        return (queues if binding.destination_type == DESTINATION_QUEUE else exchanges)[binding.destination]
+
+    futures = [
+        destination(binding).unbind(binding.source, binding.routing_key, arguments=binding.arguments, nowait=True)
+        for binding in changes.unbindings
+        if (binding.destination_type, binding.destination) not in removed
+    ]
+    futures.extend(
+        destination(binding).bind(binding.source, binding.routing_key, arguments=binding.arguments, nowait=True)
+        for binding in changes.bindings)
+
+    if delete:
+        futures.extend(channel.exchange_delete(exchange.name, nowait=True) for exchange in changes.removed_exchanges)
+        futures.extend(channel.queue_delete(queue.name, nowait=True) for queue in changes.removed_queues)
+
+    yield futures
+    yield channel.synchronize(timeout=timeout)
+
+    # What was removed from the spec is not restored after a reconnect
+    for exchange in changes.removed_exchanges:
+        exchanges.pop(exchange.name, None)
+        getattr(channel, '_exchanges', {}).pop(exchange.name, None)
+    for queue in changes.removed_queues:
+        queues.pop(queue.name, None)
+        getattr(channel, '_queues', {}).pop(queue.name, None)
+
+    channel._topology = _Applied(  # pylint: disable=protected-access
+        topology=target,
+        exchanges={name: exchanges[name] for name in target.exchanges},
+        queues={name: queues[name] for name in target.queues},
+    )
+
+    raise gen.Return(changes)
+
+
+def _entries(entries):
+    """ Get the (name, options) pairs of exchanges or queues given as a mapping or as a list with names """
+    if not entries:
+        return []
+
+    if isinstance(entries, dict):
+        return [(name, options or {}) for name, options in entries.items()]
+
+    result = []
+    for options in entries:
+        options = dict(options)
+        try:
+            name = options.pop('name')
+        except KeyError:
+            raise ValueError("Entry without a name: {}".format(options))
+        result.append((name, options))
+    return result
+
+
+def _check_options(kind, options, allowed):
+    if not isinstance(options, dict):
+        raise ValueError("The {} spec has to be a mapping, got {!r}".format(kind, options))
+
+    unknown = set(options) - set(allowed)
+    if unknown:
+        raise ValueError("Unknown {} options: {}".format(kind, ', '.join(sorted(unknown))))
+
+
+def _exchange_spec(name, options):
+    _check_options("exchange '{}'".format(name), options, _EXCHANGE_OPTIONS)
+    return ExchangeSpec(
+        name=name,
+        type=ExchangeType(options.get('type', ExchangeType.DIRECT.value)),
+        durable=bool(options.get('durable', False)),
+        auto_delete=bool(options.get('auto_delete', False)),
+        internal=bool(options.get('internal', False)),
+        arguments=options.get('arguments') or {})
+
+
+def _queue_spec(name, options):
+    _check_options("queue '{}'".format(name), options, _QUEUE_OPTIONS)
+    return QueueSpec(
+        name=name,
+        durable=bool(options.get('durable', False)),
+        exclusive=bool(options.get('exclusive', False)),
+        auto_delete=bool(options.get('auto_delete', False)),
+        arguments=options.get('arguments') or {})
+
+
+def _binding_spec(options):
+    _check_options('binding', options, _BINDING_OPTIONS)
+
+    destinations = [kind for kind in (DESTINATION_QUEUE, DESTINATION_EXCHANGE) if kind in options]
+    if 'source' not in options or len(destinations) != 1:
+        raise ValueError("A binding needs a source and either a queue or an exchange: {}".format(options))
+
+    return BindingSpec(
+        source=options['source'],
+        destination=options[destinations[0]],
+        destination_type=destinations[0],
+        routing_key=options.get('routing_key', ''),
+        arguments=options.get('arguments') or {})
+
+
+def _binding_key(binding):
+    """
+    :type binding: :class:`BindingSpec`
+    """
+    return (binding.source, binding.destination_type, binding.destination, binding.routing_key,
+            tools.freeze(binding.arguments))
+
+
+def _describe_exchange(exchange):
+    """
+    :type exchange: :class:`topika.Exchange`
+    :rtype: :class:`ExchangeSpec`
+    """
+    return ExchangeSpec(
+        name=exchange.name,
+        type=exchange.type,
+        durable=bool(exchange.durable),
+        auto_delete=bool(exchange.auto_delete),
+        internal=bool(exchange.internal),
+        arguments=exchange.arguments or {})
+
+
+def _describe_queue(queue):
+    """
+    :type queue: :class:`topika.Queue`
+    :rtype: :class:`QueueSpec`
+    """
+    return QueueSpec(
+        name=queue.name,
+        durable=bool(queue.durable),
+        exclusive=bool(queue.exclusive),
+        auto_delete=bool(queue.auto_delete),
+        arguments=queue.arguments or {})
+
+
+def _known_bindings(exchanges, queues):
+    """ The keys of the bindings recorded by the robust exchanges and queues of a channel """
+    keys = set()
+    for queue in queues.values():
+        for (exchange, routing_key), kwargs in getattr(queue, '_bindings', {}).items():
+            keys.add(
+                _binding_key(
+                    BindingSpec(
+                        Exchange._get_exchange_name(exchange),  # pylint: disable=protected-access
+                        queue.name,
+                        DESTINATION_QUEUE,
+                        routing_key,
+                        kwargs.get('arguments') or {})))
+    for destination in exchanges.values():
+        for exchange, kwargs in getattr(destination, '_bindings', {}).items():
+            keys.add(
+                _binding_key(
+                    BindingSpec(
+                        Exchange._get_exchange_name(exchange),  # pylint: disable=protected-access
+                        destination.name,
+                        DESTINATION_EXCHANGE,
+                        kwargs.get('routing_key', ''),
+                        kwargs.get('arguments') or {})))
+    return keys
+
+
+__all__ = ('apply', 'diff', 'Topology', 'Diff', 'ExchangeSpec', 'QueueSpec', 'BindingSpec')
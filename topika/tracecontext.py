@@ -0,0 +1,315 @@
+""" Distributed trace context propagation through the message headers, in the W3C `traceparent`_ format.
+
+Once enabled, every message published with :meth:`Exchange.publish <topika.Exchange.publish>` carries the
+context of its publish span, and the context of a delivered message is available as
+:attr:`IncomingMessage.trace_context <topika.IncomingMessage.trace_context>`.  A message is published in a new
+trace unless its parent was set with :func:`with_parent`.  The parent is passed explicitly rather than taken from
+an implicit current span because the coroutines of all the consumers interleave on the thread of the event loop.
+
+The sampling decision is made once, when a trace starts, and travels with it in the flags of the header, so the
+messages of unsampled traces still carry it.  Only the spans of sampled traces are exported: the publishes, from
+the publish to the confirmation, and the blocks of :func:`start_span`.  An exporter is any callable taking a
+:class:`Span`, see :class:`FileExporter` and :class:`Collector`.
+
+.. code-block:: python
+
+    import topika.tracecontext
+
+    topika.tracecontext.enable(ratio=0.01, exporter=topika.tracecontext.FileExporter('/tmp/spans.jsonl'))
+
+    @gen.coroutine
+    def handler(message):
+        with topika.tracecontext.start_span('process', message.trace_context) as span:
+            reply = topika.Message(b'reply')
+            yield exchange.publish(topika.tracecontext.with_parent(reply, span), routing_key='replies')
+
+.. _traceparent: https://www.w3.org/TR/trace-context/
+"""
+from __future__ import absolute_import
+import collections
+import contextlib
+import json
+from logging import getLogger
+import random
+import re
+import threading
+
+from six.moves import queue
+
+from . import latency
+
+LOGGER = getLogger(__name__)
+
+HEADER = 'traceparent'
+
+# The enabled propagator, None when trace contexts are not propagated
+PROPAGATOR = None
+
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+_INVALID_TRACE_ID = '0' * 32
+_INVALID_SPAN_ID = '0' * 16
+_SAMPLED = 0x01
+
+Span = collections.namedtuple('Span', 'name trace_id span_id parent_id start end attributes')
+
+
+class TraceContext(collections.namedtuple('TraceContext', 'trace_id span_id sampled')):
+    """ The position in a trace: the trace, the current span in it and whether the trace is sampled """
+
+    __slots__ = ()
+
+    @property
+    def traceparent(self):
+        """
+        :rtype: str
+        """
+        return '00-{}-{}-{:02x}'.format(self.trace_id, self.span_id, _SAMPLED if self.sampled else 0)
+
+    @classmethod
+    def parse(cls, traceparent):
+        """
+        :param traceparent: the value of a `traceparent` header
+        :type traceparent: str or bytes
+        :return: the context, None if the value is not a valid version 00 traceparent
+        :rtype: :class:`TraceContext`
+        """
+        if isinstance(traceparent, bytes):
+            traceparent = traceparent.decode('ascii', 'replace')
+
+        match = _TRACEPARENT.match(traceparent.strip().lower()) if traceparent else None
+        if match is None:
+            return None
+
+        trace_id, span_id, flags = match.groups()
+        if trace_id == _INVALID_TRACE_ID or span_id == _INVALID_SPAN_ID:
+            return None
+
+        return cls(trace_id, span_id, bool(int(flags, 16) & _SAMPLED))
+
+
+def _new_trace_id():
+    return '{:032x}'.format(random.getrandbits(128) or 1)
+
+
+def _new_span_id():
+    return '{:016x}'.format(random.getrandbits(64) or 1)
+
+
+def extract(headers):
+    """
+    :param headers: the headers of a message
+    :type headers: dict
+    :return: the trace context carried by the headers, None if there is none
+    :rtype: :class:`TraceContext`
+    """
+    if not headers:
+        return None
+
+    value = headers.get(HEADER)
+    return TraceContext.parse(value) if value is not None else None
+
+
+def with_parent(message, parent):
+    """ Publish the message as a child of the parent span, does nothing when the parent is None
+
+    :type message: :class:`topika.Message`
+    :type parent: :class:`TraceContext`
+    :return: the message
+    :rtype: :class:`topika.Message`
+    """
+    if parent is not None:
+        headers = dict(message.headers) if message.headers else {}
+        headers[HEADER] = parent.traceparent
+        message.headers = headers
+    return message
+
+
+class Propagator(object):
+    """ Samples the traces, injects their context in the published messages and exports their spans """
+
+    def __init__(self, ratio=1., exporter=None):
+        """
+        :param ratio: the fraction of the traces that are sampled, between 0 and 1
+        :type ratio: float
+        :param exporter: called with every finished :class:`Span` of a sampled trace
+        """
+        if not 0 <= ratio <= 1:
+            raise ValueError("ratio must be between 0 and 1")
+
+        self.ratio = ratio
+        self.exporter = exporter
+        self._bound = int(ratio * (2**64 - 1))
+
+    def sample(self, trace_id):
+        """ Whether a new trace is sampled, the decision only depends on the trace id
+
+        :type trace_id: str
+        :rtype: bool
+        """
+        return int(trace_id[16:], 16) <= self._bound if self.ratio < 1 else True
+
+    def start(self, parent=None):
+        """ Start a span, in the trace of the parent or in a new one
+
+        :type parent: :class:`TraceContext`
+        :rtype: :class:`TraceContext`
+        """
+        if parent is not None:
+            return TraceContext(parent.trace_id, _new_span_id(), parent.sampled)
+
+        trace_id = _new_trace_id()
+        return TraceContext(trace_id, _new_span_id(), self.sample(trace_id))
+
+    def export(self, name, context, parent, start, **attributes):
+        """ Export the finished span of a sampled trace
+
+        :type name: str
+        :type context: :class:`TraceContext`
+        :type parent: :class:`TraceContext`
+        :param start: the start of the span in seconds since the epoch
+        :type start: float
+        """
+        if self.exporter is None or not context.sampled:
+            return
+
+        span = Span(name, context.trace_id, context.span_id, parent.span_id if parent is not None else None, start,
+                    latency.now(), attributes)
+        try:
+            self.exporter(span)
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception("Failed to export span %r", span)
+
+    def inject(self, properties, exchange, routing_key):
+        """ Start the span of a publish, in the trace of the parent set with :func:`with_parent` or in a new one,
+        and put its context in the headers
+
+        :type properties: :class:`pika.BasicProperties`
+        :return: finishes the span when called with the publish future, None if the trace is not sampled
+        """
+        parent = extract(properties.headers)
+        context = self.start(parent)
+
+        headers = dict(properties.headers) if properties.headers else {}
+        headers[HEADER] = context.traceparent
+        properties.headers = headers
+
+        if not context.sampled:
+            return None
+
+        start = latency.now()
+
+        def finish(future):
+            # exception() raises on a cancelled future, e.g. one cancelled by asyncio.wait_for
+            if future.cancelled():
+                error = 'cancelled'
+            else:
+                error = future.exception()
+                error = repr(error) if error is not None else None
+
+            self.export('publish', context, parent, start, exchange=exchange, routing_key=routing_key, error=error)
+
+        return finish
+
+
+@contextlib.contextmanager
+def start_span(name, parent=None, **attributes):
+    """ A span for the duration of the block, exported when the block exits.  Pass its context to
+    :func:`with_parent` to publish messages as its children.  Nothing is exported unless propagation is enabled.
+
+    :param name: the name of the span
+    :type name: str
+    :param parent: the parent, e.g. the :attr:`trace_context <topika.IncomingMessage.trace_context>` of a message,
+        a new trace is started when None
+    :type parent: :class:`TraceContext`
+    :param attributes: exported with the span
+    :return: the context of the span
+    :rtype: :class:`TraceContext`
+    """
+    propagator = PROPAGATOR or Propagator()
+    context = propagator.start(parent)
+    start = latency.now()
+
+    try:
+        yield context
+    finally:
+        propagator.export(name, context, parent, start, **attributes)
+
+
+class Collector(object):
+    """ Collects the exported spans in memory, up to `max_spans` most recent ones """
+
+    def __init__(self, max_spans=10000):
+        self.spans = collections.deque(maxlen=max_spans)
+
+    def __call__(self, span):
+        self.spans.append(span)
+
+
+class FileExporter(object):
+    """ Appends the exported spans to a file, one JSON object per line.  The file is written by a thread of its
+    own so that the loop never waits for the disk.  Spans are dropped, and counted in :attr:`dropped`, while
+    `max_pending` of them wait to be written. """
+
+    DEFAULT_MAX_PENDING = 10000
+
+    def __init__(self, path, max_pending=DEFAULT_MAX_PENDING):
+        """
+        :param path: the path of the file
+        :type path: str
+        :param max_pending: the number of spans that can wait to be written
+        :type max_pending: int
+        """
+        self.path = path
+        self.dropped = 0
+        self._file = open(path, 'a')
+        self._pending = queue.Queue(max_pending)
+        self._writer = threading.Thread(target=self._write, name='topika-span-exporter')
+        self._writer.daemon = True
+        self._writer.start()
+
+    def __call__(self, span):
+        try:
+            self._pending.put_nowait(json.dumps(span._asdict(), sort_keys=True))
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self):
+        while True:
+            line = self._pending.get()
+            if line is None:
+                break
+
+            self._file.write(line + '\n')
+            # Flush once all the spans at hand are written
+            if self._pending.empty():
+                self._file.flush()
+
+        self._file.close()
+
+    def close(self):
+        """ Write the pending spans and close the file """
+        self._pending.put(None)
+        self._writer.join()
+
+
+def enable(ratio=1., exporter=None):
+    """ Propagate trace contexts through the messages published and delivered by this process
+
+    :param ratio: the fraction of the traces that are sampled, between 0 and 1
+    :type ratio: float
+    :param exporter: called with every finished :class:`Span` of a sampled trace
+    :rtype: :class:`Propagator`
+    """
+    global PROPAGATOR  # pylint: disable=global-statement
+
+    PROPAGATOR = Propagator(ratio, exporter)
+    return PROPAGATOR
+
+
+def disable():
+    global PROPAGATOR  # pylint: disable=global-statement
+    PROPAGATOR = None
+
+
+__all__ = ('TraceContext', 'Span', 'Propagator', 'Collector', 'FileExporter', 'enable', 'disable', 'extract',
+           'with_parent', 'start_span', 'HEADER')
@@ -0,0 +1,215 @@
+""" Instrumentation hooks for the AMQP operations.
+
+A :class:`Tracer` installed with :func:`install` is called for every operation of every connection of the process.
+The hooks are looked up through the module level :data:`TRACER`, so when no tracer is installed the only cost on
+the hot paths is that lookup.
+
+.. code-block:: python
+
+    import topika.tracing
+
+    class ConfirmLatency(topika.tracing.Tracer):
+
+        def on_confirm(self, channel, delivery_tag, acked, timestamp, latency):
+            print('confirmed in', latency)
+
+    topika.tracing.install(ConfirmLatency())
+
+All the times are taken with :func:`clock` and in seconds.  A latency is None when its start wasn't seen, e.g.
+because the tracer was installed in between.  The hooks run on the event loop so they must not block.
+"""
+from __future__ import absolute_import
+from logging import getLogger
+import time
+
+LOGGER = getLogger(__name__)
+
+# The clock all the times passed to the hooks come from
+clock = getattr(time, 'perf_counter', time.time)  # pylint: disable=invalid-name
+
+# The installed tracer, None when tracing is off
+TRACER = None
+
+ACK = 'ack'
+NACK = 'nack'
+REJECT = 'reject'
+
+EXCHANGE = 'exchange'
+QUEUE = 'queue'
+
+
+class Tracer(object):
+    """ Receives the AMQP operations, all the hooks do nothing so only those of interest need overriding """
+
+    def on_publish(self, channel, exchange, routing_key, delivery_tag, timestamp, duration):
+        """ A message was written to the channel
+
+        :type channel: :class:`topika.Channel`
+        :param exchange: the name of the exchange
+        :type exchange: str
+        :type routing_key: str
+        :type delivery_tag: int
+        :param duration: the time it took to write the message
+        :type duration: float
+        """
+
+    def on_confirm(self, channel, delivery_tag, acked, timestamp, latency):
+        """ The broker confirmed a published message
+
+        :type channel: :class:`topika.Channel`
+        :type delivery_tag: int
+        :param acked: False if the broker nacked the message
+        :type acked: bool
+        :param latency: the time since the message was published
+        :type latency: float
+        """
+
+    def on_return(self, channel, message, timestamp):
+        """ The broker returned an unroutable message
+
+        :type channel: :class:`topika.Channel`
+        :type message: :class:`topika.message.ReturnedMessage`
+        """
+
+    def on_deliver(self, queue, message, timestamp):
+        """ A message was delivered to a consumer
+
+        :type queue: :class:`topika.Queue`
+        :type message: :class:`topika.IncomingMessage`
+        """
+
+    def on_cancel(self, queue, consumer_tag, timestamp):
+        """ A consumer was cancelled
+
+        :type queue: :class:`topika.Queue`
+        :type consumer_tag: str
+        """
+
+    def on_ack(self, message, action, timestamp, latency):
+        """ A delivered message was settled
+
+        :type message: :class:`topika.IncomingMessage`
+        :param action: :data:`ACK`, :data:`NACK` or :data:`REJECT`
+        :type action: str
+        :param latency: the time since the message was delivered
+        :type latency: float
+        """
+
+    def on_declare(self, channel, kind, name, timestamp, duration):
+        """ An exchange or queue was declared
+
+        :type channel: :class:`topika.Channel`
+        :param kind: :data:`EXCHANGE` or :data:`QUEUE`
+        :type kind: str
+        :type name: str
+        :param duration: the time the declaration took, including the wait for the channel
+        :type duration: float
+        """
+
+    def on_channel_open(self, channel, timestamp, duration):
+        """
+        :type channel: :class:`topika.Channel`
+        :param duration: the time it took to open the channel
+        :type duration: float
+        """
+
+    def on_channel_close(self, channel, reason, timestamp, lifetime):
+        """
+        :type channel: :class:`topika.Channel`
+        :param reason: why the channel was closed
+        :type reason: Exception
+        :param lifetime: the time the channel was open
+        :type lifetime: float
+        """
+
+    def on_reconnect(self, connection, timestamp, downtime, restore_duration):
+        """ A robust connection recovered from losing its connection
+
+        :type connection: :class:`topika.robust_connection.RobustConnection`
+        :param downtime: the time from losing the connection to having restored all the channels
+        :type downtime: float
+        :param restore_duration: the time it took to restore the channels
+        :type restore_duration: float
+        """
+
+
+class MultiTracer(Tracer):
+    """ Passes the operations on to several tracers, a tracer that fails doesn't affect the others """
+
+    def __init__(self, tracers):
+        """
+        :type tracers: tuple
+        """
+        self.tracers = tuple(tracers)
+
+    def _call(self, hook, *args):
+        for tracer in self.tracers:
+            try:
+                getattr(tracer, hook)(*args)
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Tracer %r failed in %s", tracer, hook)
+
+    def on_publish(self, *args):  # pylint: disable=arguments-differ
+        self._call('on_publish', *args)
+
+    def on_confirm(self, *args):  # pylint: disable=arguments-differ
+        self._call('on_confirm', *args)
+
+    def on_return(self, *args):  # pylint: disable=arguments-differ
+        self._call('on_return', *args)
+
+    def on_deliver(self, *args):  # pylint: disable=arguments-differ
+        self._call('on_deliver', *args)
+
+    def on_cancel(self, *args):  # pylint: disable=arguments-differ
+        self._call('on_cancel', *args)
+
+    def on_ack(self, *args):  # pylint: disable=arguments-differ
+        self._call('on_ack', *args)
+
+    def on_declare(self, *args):  # pylint: disable=arguments-differ
+        self._call('on_declare', *args)
+
+    def on_channel_open(self, *args):  # pylint: disable=arguments-differ
+        self._call('on_channel_open', *args)
+
+    def on_channel_close(self, *args):  # pylint: disable=arguments-differ
+        self._call('on_channel_close', *args)
+
+    def on_reconnect(self, *args):  # pylint: disable=arguments-differ
+        self._call('on_reconnect', *args)
+
+
+def tracers():
+    """ The installed tracers
+
+    :rtype: tuple
+    """
+    return TRACER.tracers if TRACER is not None else ()
+
+
+def install(tracer):
+    """ Install the tracer in addition to those already installed
+
+    :type tracer: :class:`Tracer`
+    """
+    _set(tracers() + (tracer,))
+
+
+def uninstall(tracer=None):
+    """ Remove the tracer, or all of them when None
+
+    :type tracer: :class:`Tracer`
+    """
+    _set(tuple(installed for installed in tracers() if tracer is not None and installed is not tracer))
+
+
+def _set(installed):
+    global TRACER  # pylint: disable=global-statement
+
+    # Always go through a MultiTracer so that a failing hook can't break the operation it traces
+    TRACER = MultiTracer(installed) if installed else None
+
+
+__all__ = ('Tracer', 'MultiTracer', 'install', 'uninstall', 'tracers', 'clock', 'ACK', 'NACK', 'REJECT', 'EXCHANGE',
+           'QUEUE')